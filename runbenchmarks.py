@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+
+import sys
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+django.setup()
+
+from tests.benchmarks.runner import main  # noqa: E402
+
+main(sys.argv[1:])
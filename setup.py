@@ -15,6 +15,7 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     include_package_data=True,
     install_requires=["wagtail>=2.12",],
+    extras_require={"numpy": ["numpy"], "service-account": ["google-auth"],},
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,121 @@
+import hashlib
+import io
+import os
+import random
+
+import PIL.Image
+
+from wagtail.core.models import Collection
+
+from wagtail_image_import.fingerprints import normalize_title
+from wagtail_image_import.models import DriveIDMapping, DuplicateFingerprint
+
+from tests.models import CustomImage
+
+
+SEED_BATCH_SIZE = 10000
+
+
+def get_drive_id(index):
+    return "drive-{:07d}".format(index)
+
+
+def get_title(index):
+    return "IMG_{:07d}.jpg".format(index)
+
+
+def get_md5_hash(index):
+    return hashlib.md5(str(index).encode()).hexdigest()
+
+
+def seed_library(size):
+    """
+    Adds synthetic images to the library until it holds size images, each with a Drive ID mapping and a
+    fingerprint as the signal handlers would create them. Rows are bulk created without files, so seeding a large
+    library takes seconds per hundred thousand rows. Returns the number of images added
+    """
+    existing = CustomImage.objects.count()
+    rng = random.Random(existing)
+    collection_id = Collection.get_first_root_node().pk
+    for start in range(existing, size, SEED_BATCH_SIZE):
+        indexes = range(start, min(start + SEED_BATCH_SIZE, size))
+        images = CustomImage.objects.bulk_create(
+            [
+                CustomImage(
+                    title=get_title(index),
+                    file="original_images/{}".format(get_title(index)),
+                    width=4000,
+                    height=3000,
+                    collection_id=collection_id,
+                    md5_hash=get_md5_hash(index),
+                    exif_datetime="2020:01:01 00:00:00",
+                    perceptual_hash="{:016x}".format(rng.getrandbits(64)),
+                )
+                for index in indexes
+            ]
+        )
+        if images[0].pk is None:
+            # only some databases return the primary keys of bulk created rows
+            images = list(
+                CustomImage.objects.filter(
+                    title__in=[get_title(index) for index in indexes]
+                ).order_by("pk")
+            )
+        DriveIDMapping.objects.bulk_create(
+            [
+                DriveIDMapping(image_id=image.pk, drive_id=get_drive_id(index))
+                for index, image in zip(indexes, images)
+            ]
+        )
+        DuplicateFingerprint.objects.bulk_create(
+            [
+                DuplicateFingerprint(
+                    image_id=image.pk,
+                    drive_id=get_drive_id(index),
+                    title=normalize_title(image.title),
+                    md5_hash=image.md5_hash,
+                    exif_datetime=image.exif_datetime,
+                    perceptual_hash=image.perceptual_hash,
+                )
+                for index, image in zip(indexes, images)
+            ]
+        )
+    return max(size - existing, 0)
+
+
+def get_drive_items(count, existing, library_size):
+    """
+    Returns count Drive items as returned by the picker, of which roughly the existing fraction are already in
+    the library
+    """
+    rng = random.Random(count)
+    items = []
+    for index in range(count):
+        if rng.random() < existing and library_size:
+            library_index = rng.randrange(library_size)
+            items.append(
+                {
+                    "id": get_drive_id(library_index),
+                    "name": get_title(library_index),
+                    "md5Checksum": get_md5_hash(library_index),
+                }
+            )
+        else:
+            items.append(
+                {
+                    "id": "new-drive-{}".format(index),
+                    "name": "new image {}.jpg".format(index),
+                    "md5Checksum": get_md5_hash(-index - 1),
+                }
+            )
+    return items
+
+
+def make_jpeg(width, height):
+    """
+    Returns the content of a JPEG of random noise, which compresses about as badly as a photograph
+    """
+    image = PIL.Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    f = io.BytesIO()
+    image.save(f, "JPEG", quality=90)
+    return f.getvalue()
@@ -0,0 +1,287 @@
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import django
+import wagtail
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.runner import DiscoverRunner
+from django.urls import reverse
+
+from wagtail.core.models import Collection
+
+from wagtail_image_import.utils import get_duplicate_scoring_plan, get_most_likely_duplicate
+
+from tests.benchmarks.library import get_drive_items, make_jpeg, seed_library
+from tests.models import CustomImage
+
+
+DEFAULT_LIBRARY_SIZES = [1000, 100000]
+
+DEFAULT_SELECTION_SIZES = [100, 1000]
+
+FILE_SIZES = {
+    "small": (640, 480),
+    "medium": (1920, 1440),
+    "large": (3264, 2448),
+}
+
+
+def time_call(function, repeats, setup=None):
+    """
+    Returns the min, median and mean time in seconds of repeats calls of function, calling setup (untimed) before each
+    """
+    timings = []
+    for repeat in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "repeats": repeats,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+    }
+
+
+def check_response(response):
+    if response.status_code != 200 or response.json().get("success") is False:
+        raise AssertionError(
+            "Benchmarked request failed: {}".format(response.content[:500])
+        )
+
+
+class Benchmarks:
+    def __init__(self, repeats, selection_sizes, file_sizes):
+        self.repeats = repeats
+        self.selection_sizes = selection_sizes
+        self.files = {name: make_jpeg(*size) for name, size in file_sizes.items()}
+        self.results = []
+        user = get_user_model().objects.create_superuser(
+            "benchmark", "benchmark@example.com", "password"
+        )
+        self.client = Client()
+        self.client.force_login(user)
+        self.collection_id = Collection.get_first_root_node().pk
+
+    def record(self, name, library_size, params, timing):
+        result = {
+            "name": name,
+            "library_size": library_size,
+            "params": params,
+            **timing,
+        }
+        self.results.append(result)
+        print(
+            "{name} library_size={library_size} {params}: median {median:.4f}s".format(
+                **result
+            ),
+            file=sys.stderr,
+        )
+
+    def run(self, library_size):
+        self.bench_get_most_likely_duplicate(library_size)
+        self.bench_find_duplicates(library_size)
+        self.bench_import_from_drive(library_size)
+        self.bench_mixin_save(library_size)
+
+    def bench_get_most_likely_duplicate(self, library_size):
+        plan = get_duplicate_scoring_plan()
+        for existing in (0, 1):
+            (item,) = get_drive_items(1, existing, library_size)
+            timing = time_call(
+                lambda: get_most_likely_duplicate(
+                    item, plan.field_mapping, plan.field_weighting
+                ),
+                self.repeats,
+            )
+            self.record(
+                "get_most_likely_duplicate",
+                library_size,
+                {"existing": bool(existing)},
+                timing,
+            )
+
+    def bench_find_duplicates(self, library_size):
+        url = reverse("wagtail_image_import:find_duplicates")
+        for selection_size in self.selection_sizes:
+            body = json.dumps(get_drive_items(selection_size, 0.5, library_size))
+            timing = time_call(
+                lambda: check_response(
+                    self.client.post(url, data=body, content_type="application/json")
+                ),
+                self.repeats,
+            )
+            self.record(
+                "find_duplicates",
+                library_size,
+                {"selection_size": selection_size},
+                timing,
+            )
+
+    def bench_import_from_drive(self, library_size):
+        url = reverse("wagtail_image_import:import")
+        for name, content in self.files.items():
+            data = {}
+
+            def setup():
+                data["image_file"] = SimpleUploadedFile(
+                    "import.jpg", content, content_type="image/jpeg"
+                )
+
+            timing = time_call(
+                lambda: check_response(
+                    self.client.post(
+                        url,
+                        {
+                            "name": "imported",
+                            "collection": self.collection_id,
+                            "image_file": data["image_file"],
+                            "action": "keep",
+                        },
+                    )
+                ),
+                self.repeats,
+                setup=setup,
+            )
+            self.record(
+                "import_from_drive",
+                library_size,
+                {"file": name, "bytes": len(content)},
+                timing,
+            )
+
+    def bench_mixin_save(self, library_size):
+        for name, content in self.files.items():
+            images = []
+
+            def setup():
+                images.append(
+                    CustomImage(
+                        title="saved",
+                        file=SimpleUploadedFile("saved.jpg", content),
+                        collection_id=self.collection_id,
+                    )
+                )
+
+            timing = time_call(lambda: images[-1].save(), self.repeats, setup=setup)
+            self.record(
+                "mixin_save", library_size, {"file": name, "bytes": len(content)}, timing,
+            )
+
+
+def get_environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "django": django.get_version(),
+        "wagtail": wagtail.__version__,
+        "database": connection.vendor,
+    }
+
+
+def compare(results, baseline):
+    """
+    Prints the ratio of each median time to the median of the same benchmark in a baseline results file
+    """
+    baseline_medians = {
+        (
+            result["name"],
+            result["library_size"],
+            json.dumps(result["params"], sort_keys=True),
+        ): result["median"]
+        for result in baseline["results"]
+    }
+    for result in results:
+        key = (
+            result["name"],
+            result["library_size"],
+            json.dumps(result["params"], sort_keys=True),
+        )
+        if key in baseline_medians:
+            print(
+                "{} library_size={} {}: {:.2f}x baseline".format(
+                    *key, result["median"] / baseline_medians[key]
+                ),
+                file=sys.stderr,
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Times duplicate finding, importing and hashing against seeded libraries of images"
+    )
+    parser.add_argument(
+        "--library-sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=DEFAULT_LIBRARY_SIZES,
+        help="Comma separated numbers of images to seed the library with, such as 1000,100000,1000000",
+    )
+    parser.add_argument(
+        "--selection-sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=DEFAULT_SELECTION_SIZES,
+        help="Comma separated numbers of Drive items to find duplicates for at once",
+    )
+    parser.add_argument(
+        "--files",
+        type=lambda value: value.split(","),
+        default=list(FILE_SIZES),
+        help="Comma separated sizes of files to import and save, from {}".format(
+            ", ".join(FILE_SIZES)
+        ),
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--output", help="A file to write the JSON results to, rather than stdout"
+    )
+    parser.add_argument(
+        "--compare", help="A previous JSON results file to compare the results against"
+    )
+    options = parser.parse_args(argv)
+
+    media_root = tempfile.mkdtemp()
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    runner.setup_test_environment()
+    old_config = runner.setup_databases()
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            benchmarks = Benchmarks(
+                options.repeats,
+                options.selection_sizes,
+                {name: FILE_SIZES[name] for name in options.files},
+            )
+            for library_size in sorted(options.library_sizes):
+                seed_start = time.perf_counter()
+                seed_library(library_size)
+                print(
+                    "Seeded {} images in {:.1f}s".format(
+                        library_size, time.perf_counter() - seed_start
+                    ),
+                    file=sys.stderr,
+                )
+                benchmarks.run(library_size)
+            output = {"environment": get_environment(), "results": benchmarks.results}
+    finally:
+        runner.teardown_databases(old_config)
+        runner.teardown_test_environment()
+        shutil.rmtree(media_root, ignore_errors=True)
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            compare(output["results"], json.load(f))
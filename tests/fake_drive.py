@@ -0,0 +1,179 @@
+import hashlib
+import json
+import re
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeDriveServer:
+    """
+    A local HTTP server imitating the parts of the Google Drive API used by Wagtail Image Import
+    """
+
+    def __init__(
+        self,
+        files=None,
+        oauth_token="test-token",
+        max_page_size=None,
+        refresh_token="test-refresh-token",
+    ):
+        # maps Drive IDs to file contents
+        self.files = files or {}
+        # maps Drive IDs to the metadata listed for files added with add_file
+        self.metadata = {}
+        # the (Drive ID, removed) of each change, where a page token is an index into the list
+        self.changes = []
+        self.oauth_token = oauth_token
+        # the refresh token exchanged for oauth_token by the token endpoint
+        self.refresh_token = refresh_token
+        # the JWT assertions sent to the token endpoint for service accounts
+        self.assertions = []
+        self.max_page_size = max_page_size
+        self.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.get_handler_class())
+
+    @property
+    def api_url(self):
+        return "http://127.0.0.1:{}/drive/v3/".format(self.server.server_port)
+
+    @property
+    def token_url(self):
+        return "http://127.0.0.1:{}/token".format(self.server.server_port)
+
+    def get_thumbnail_link(self, drive_id):
+        return "http://127.0.0.1:{}/thumbnails/{}".format(
+            self.server.server_port, urllib.parse.quote(drive_id, safe="")
+        )
+
+    def add_file(self, drive_id, content, name, parents, mime_type="image/png"):
+        """
+        Adds or changes a file, which is listed in its parent folders and the changes feed
+        """
+        self.files[drive_id] = content
+        self.metadata[drive_id] = {
+            "id": drive_id,
+            "name": name,
+            "mimeType": mime_type,
+            "parents": parents,
+            "trashed": False,
+            "md5Checksum": hashlib.md5(content).hexdigest(),
+        }
+        self.changes.append((drive_id, False))
+
+    def remove_file(self, drive_id):
+        del self.files[drive_id]
+        del self.metadata[drive_id]
+        self.changes.append((drive_id, True))
+
+    def get_page(self, items, query):
+        # page tokens are offsets into the list of items
+        start = int(query.get("pageToken", ["0"])[0])
+        page_size = int(query.get("pageSize", ["100"])[0])
+        if self.max_page_size:
+            page_size = min(page_size, self.max_page_size)
+        end = start + page_size
+        return items[start:end], (str(end) if end < len(items) else None)
+
+    def list_files(self, query):
+        match = re.match(r"'(.*)' in parents", query.get("q", [""])[0])
+        parent = match.group(1) if match else None
+        files = [
+            metadata
+            for metadata in self.metadata.values()
+            if parent is None or parent in metadata["parents"]
+        ]
+        files, next_page_token = self.get_page(files, query)
+        page = {"files": files}
+        if next_page_token:
+            page["nextPageToken"] = next_page_token
+        return page
+
+    def list_changes(self, query):
+        changes, next_page_token = self.get_page(self.changes, query)
+        page = {
+            "changes": [
+                {"fileId": drive_id, "removed": True}
+                if removed
+                else {
+                    "fileId": drive_id,
+                    "removed": False,
+                    "file": self.metadata.get(drive_id),
+                }
+                for drive_id, removed in changes
+            ]
+        }
+        if next_page_token:
+            page["nextPageToken"] = next_page_token
+        else:
+            page["newStartPageToken"] = str(len(self.changes))
+        return page
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_handler_class(self):
+        drive = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                drive.requests.append(url)
+                if self.headers.get("Authorization") != "Bearer " + drive.oauth_token:
+                    return self.send_error(401)
+                prefix = "/drive/v3/files/"
+                query = urllib.parse.parse_qs(url.query)
+                if url.path == "/drive/v3/files":
+                    return self.send_json(drive.list_files(query))
+                if url.path == "/drive/v3/changes":
+                    return self.send_json(drive.list_changes(query))
+                if url.path == "/drive/v3/changes/startPageToken":
+                    return self.send_json({"startPageToken": str(len(drive.changes))})
+                if url.path.startswith("/thumbnails/"):
+                    # thumbnails are served as the full file, which is enough for hashing
+                    prefix = "/thumbnails/"
+                elif not url.path.startswith(prefix) or query.get("alt") != ["media"]:
+                    return self.send_error(404)
+                drive_id = urllib.parse.unquote(url.path[len(prefix) :])
+                if drive_id not in drive.files:
+                    return self.send_error(404)
+                content = drive.files[drive_id]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_POST(self):
+                url = urllib.parse.urlparse(self.path)
+                drive.requests.append(url)
+                if url.path != "/token":
+                    return self.send_error(404)
+                length = int(self.headers.get("Content-Length", 0))
+                params = urllib.parse.parse_qs(self.rfile.read(length).decode())
+                grant_type = params.get("grant_type", [""])[0]
+                if grant_type == "refresh_token" and params.get("refresh_token") == [
+                    drive.refresh_token
+                ]:
+                    return self.send_json({"access_token": drive.oauth_token})
+                if grant_type == "urn:ietf:params:oauth:grant-type:jwt-bearer":
+                    drive.assertions.extend(params.get("assertion", []))
+                    return self.send_json({"access_token": drive.oauth_token})
+                self.send_error(400)
+
+            def send_json(self, data):
+                content = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tests", "0002_auto_20200625_0434"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customimage",
+            name="perceptual_hash",
+            field=models.CharField(blank=True, default="", max_length=16),
+        ),
+    ]
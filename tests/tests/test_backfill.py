@@ -0,0 +1,129 @@
+import os.path
+import shutil
+from io import StringIO
+from unittest import mock
+
+import PIL.Image
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from wagtail_image_import.models import BackfillProgress, DuplicateFingerprint
+
+from tests.models import CustomImage
+
+
+TEST_MEDIA_DIR = os.path.join(os.path.join(settings.BASE_DIR, "test-media"))
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+@override_settings(WAGTAILIMAGEIMPORT_NEAR_DUPLICATE_DISTANCE=6)
+class TestBackfillDuplicateFields(TestCase):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        self.images = []
+        for name in ["wagtail_1.png", "wagtail_2.png", "Canon_40D.jpg"]:
+            with open(TEST_DATA_DIR + "/" + name, "rb") as f:
+                self.images.append(
+                    CustomImage.objects.create(
+                        title=name, file=SimpleUploadedFile(name, f.read())
+                    )
+                )
+        self.expected = {
+            image.pk: (image.md5_hash, image.exif_datetime, image.perceptual_hash)
+            for image in self.images
+        }
+        # as if the mixin had just been added to the model
+        CustomImage.objects.update(md5_hash="", exif_datetime="", perceptual_hash="")
+        DuplicateFingerprint.objects.update(
+            md5_hash="", exif_datetime="", perceptual_hash=""
+        )
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def get_values(self):
+        return {
+            image.pk: (image.md5_hash, image.exif_datetime, image.perceptual_hash)
+            for image in CustomImage.objects.all()
+        }
+
+    def backfill(self, **options):
+        stdout = StringIO()
+        call_command("backfill_duplicate_fields", stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_backfill(self):
+        output = self.backfill(processes=0, batch_size=2)
+        self.assertIn("Backfilled 3 images, 0 of whose", output)
+        self.assertEqual(self.get_values(), self.expected)
+        fingerprint = DuplicateFingerprint.objects.get(image=self.images[2])
+        self.assertEqual(fingerprint.md5_hash, self.expected[self.images[2].pk][0])
+        self.assertEqual(fingerprint.exif_datetime, "2008:07:31 10:38:11")
+        # the checkpoint is cleared once every image has been backfilled
+        self.assertEqual(
+            BackfillProgress.objects.get(name="duplicate_fields").last_image_id, 0
+        )
+
+    def test_interrupted_backfill_keeps_progress(self):
+        with mock.patch(
+            "wagtail_image_import.backfill.compute_perceptual_hash",
+            side_effect=["0" * 16, KeyboardInterrupt],
+        ), self.assertRaises(KeyboardInterrupt):
+            self.backfill(processes=0, batch_size=1)
+        self.assertEqual(
+            BackfillProgress.objects.get(name="duplicate_fields").last_image_id,
+            self.images[0].pk,
+        )
+
+    def test_next_run_starts_from_first_image(self):
+        self.backfill(processes=0)
+        type(self.images[0]).objects.filter(pk=self.images[0].pk).update(md5_hash="")
+        output = self.backfill(processes=0)
+        self.assertNotIn("Resuming", output)
+        self.assertIn("Backfilled 1 images", output)
+        self.assertEqual(self.get_values(), self.expected)
+
+    def test_backfill_in_process_pool(self):
+        self.backfill(processes=2, batch_size=1)
+        self.assertEqual(self.get_values(), self.expected)
+
+    def test_resume(self):
+        BackfillProgress.objects.create(
+            name="duplicate_fields", last_image_id=self.images[0].pk
+        )
+        output = self.backfill(processes=0)
+        self.assertIn("Resuming after image %d" % self.images[0].pk, output)
+        values = self.get_values()
+        self.assertEqual(values[self.images[0].pk], ("", "", ""))
+        self.assertEqual(values[self.images[1].pk], self.expected[self.images[1].pk])
+
+        self.backfill(processes=0, restart=True)
+        self.assertEqual(self.get_values(), self.expected)
+
+    def test_unreadable_files_are_skipped(self):
+        self.images[0].file.storage.delete(self.images[0].file.name)
+        output = self.backfill(processes=0)
+        self.assertIn("Backfilled 3 images, 1 of whose", output)
+        values = self.get_values()
+        self.assertEqual(values[self.images[0].pk], ("", "", ""))
+        self.assertEqual(values[self.images[2].pk], self.expected[self.images[2].pk])
+
+    def test_undecodable_images_are_skipped(self):
+        with mock.patch(
+            "wagtail_image_import.backfill.compute_perceptual_hash",
+            side_effect=[
+                "0" * 16,
+                PIL.Image.DecompressionBombError("too large"),
+                "0" * 16,
+            ],
+        ):
+            output = self.backfill(processes=0)
+        self.assertIn("Backfilled 3 images, 1 of whose", output)
+        values = self.get_values()
+        self.assertEqual(values[self.images[1].pk], ("", "", ""))
+        self.assertEqual(
+            values[self.images[2].pk][0], self.expected[self.images[2].pk][0]
+        )
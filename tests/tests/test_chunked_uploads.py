@@ -0,0 +1,185 @@
+import os.path
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from wagtail.tests.utils import WagtailTestUtils
+
+from wagtail_image_import.chunked_uploads import get_upload_path
+from wagtail_image_import.models import ChunkedUpload
+
+from tests.models import CustomImage
+
+
+TEST_MEDIA_DIR = os.path.join(os.path.join(settings.BASE_DIR, "test-media"))
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "test_chunked_uploads")
+
+
+@override_settings(
+    WAGTAILIMAGEIMPORT_CHUNKED_UPLOAD_DIR=UPLOAD_DIR,
+    WAGTAILIMAGEIMPORT_CHUNKED_UPLOAD_CHUNK_SIZE=1000,
+)
+class TestChunkedUploads(TestCase, WagtailTestUtils):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        with open(TEST_DATA_DIR + "/Canon_40D.jpg", "rb") as f:
+            self.content = f.read()
+        self.user = self.login()
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        shutil.rmtree(UPLOAD_DIR, ignore_errors=True)
+
+    def start_upload(self):
+        response = self.client.post(
+            reverse("wagtail_image_import:start_chunked_upload"),
+            {
+                "name": "Canon_40D.jpg",
+                "size": len(self.content),
+                "collection": 1,
+                "action": "keep",
+                "drive_id": "canon",
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["chunk_size"], 1000)
+        return response.json()["upload_id"]
+
+    def put_chunk(self, upload_id, start, end):
+        return self.client.put(
+            reverse("wagtail_image_import:chunked_upload", args=[upload_id]),
+            data=self.content[start : end + 1],
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE="bytes %d-%d/%d" % (start, end, len(self.content)),
+        )
+
+    def upload_chunks(self, upload_id, start=0):
+        for chunk_start in range(start, len(self.content), 1000):
+            chunk_end = min(chunk_start + 1000, len(self.content)) - 1
+            response = self.put_chunk(upload_id, chunk_start, chunk_end)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["received"], chunk_end + 1)
+
+    def finish_upload(self, upload_id):
+        return self.client.post(
+            reverse("wagtail_image_import:finish_chunked_upload", args=[upload_id])
+        )
+
+    def test_upload(self):
+        upload_id = self.start_upload()
+        self.upload_chunks(upload_id)
+        upload = ChunkedUpload.objects.get(upload_id=upload_id)
+        path = get_upload_path(upload)
+
+        response = self.finish_upload(upload_id)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertTrue(result["success"])
+        self.assertIn("form", result)
+        image = CustomImage.objects.get(id=result["image_id"])
+        self.assertEqual(image.title, "Canon_40D.jpg")
+        self.assertEqual(image.driveidmapping.drive_id, "canon")
+        self.assertEqual(image.file_size, len(self.content))
+        self.assertEqual(image.exif_datetime, "2008:07:31 10:38:11")
+
+        # the upload and its temporary file are cleaned up
+        self.assertFalse(ChunkedUpload.objects.filter(upload_id=upload_id).exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_resume(self):
+        upload_id = self.start_upload()
+        self.put_chunk(upload_id, 0, 999)
+        self.put_chunk(upload_id, 1000, 1999)
+
+        response = self.client.get(
+            reverse("wagtail_image_import:chunked_upload", args=[upload_id])
+        )
+        self.assertEqual(response.json()["received"], 2000)
+
+        # a chunk sent again after its acknowledgement was lost is rejected, reporting where to resume from
+        response = self.put_chunk(upload_id, 1000, 1999)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["received"], 2000)
+
+        self.upload_chunks(upload_id, start=2000)
+        response = self.finish_upload(upload_id)
+        image = CustomImage.objects.get(id=response.json()["image_id"])
+        with image.file.open() as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_invalid_chunks_are_rejected(self):
+        upload_id = self.start_upload()
+        self.assertEqual(self.put_chunk(upload_id, 1000, 1999).status_code, 409)
+        # larger than the chunk size
+        self.assertEqual(self.put_chunk(upload_id, 0, 1999).status_code, 409)
+        response = self.client.put(
+            reverse("wagtail_image_import:chunked_upload", args=[upload_id]),
+            data=self.content[:1000],
+            content_type="application/octet-stream",
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(ChunkedUpload.objects.get(upload_id=upload_id).received, 0)
+
+    def test_chunk_beyond_total_is_rejected(self):
+        upload_id = self.start_upload()
+        response = self.client.put(
+            reverse("wagtail_image_import:chunked_upload", args=[upload_id]),
+            data=self.content[:1000],
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE="bytes 0-999/500",
+        )
+        self.assertEqual(response.status_code, 409)
+
+    def test_too_large_upload_is_rejected(self):
+        with override_settings(WAGTAILIMAGES_MAX_UPLOAD_SIZE=len(self.content) - 1):
+            response = self.client.post(
+                reverse("wagtail_image_import:start_chunked_upload"),
+                {"name": "Canon_40D.jpg", "size": len(self.content), "collection": 1},
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("too large", response.json()["error"])
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+        # an upload started before the limit was lowered can't send chunks or be finished
+        upload_id = self.start_upload()
+        with override_settings(WAGTAILIMAGES_MAX_UPLOAD_SIZE=len(self.content) - 1):
+            self.assertEqual(self.put_chunk(upload_id, 0, 999).status_code, 409)
+        self.upload_chunks(upload_id)
+        with override_settings(WAGTAILIMAGES_MAX_UPLOAD_SIZE=len(self.content) - 1):
+            response = self.finish_upload(upload_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CustomImage.objects.exists())
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_empty_upload_is_rejected(self):
+        response = self.client.post(
+            reverse("wagtail_image_import:start_chunked_upload"),
+            {"name": "empty.jpg", "size": 0, "collection": 1},
+        )
+        self.assertEqual(response.status_code, 400)
+
+        upload = ChunkedUpload.objects.create(user=self.user, name="empty.jpg", size=0)
+        response = self.finish_upload(upload.upload_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "The file is empty")
+
+    def test_incomplete_upload_cannot_be_finished(self):
+        upload_id = self.start_upload()
+        self.put_chunk(upload_id, 0, 999)
+        response = self.finish_upload(upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(CustomImage.objects.exists())
+
+    def test_other_users_uploads_are_not_found(self):
+        upload_id = self.start_upload()
+        get_user_model().objects.create_superuser(
+            "other@email.com", "other@email.com", "password"
+        )
+        self.client.login(username="other@email.com", password="password")
+        self.assertEqual(self.put_chunk(upload_id, 0, 999).status_code, 404)
+        self.assertEqual(self.finish_upload(upload_id).status_code, 404)
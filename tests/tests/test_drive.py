@@ -0,0 +1,147 @@
+import json
+import os.path
+import shutil
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from wagtail.tests.utils import WagtailTestUtils
+
+from tests.fake_drive import FakeDriveServer
+from tests.models import CustomImage
+
+
+TEST_MEDIA_DIR = os.path.join(os.path.join(settings.BASE_DIR, "test-media"))
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+class TestServerSideDriveFetch(TestCase, WagtailTestUtils):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        with open(TEST_DATA_DIR + "/Canon_40D.jpg", "rb") as f:
+            self.canon_content = f.read()
+        self.drive = FakeDriveServer(files={"canon": self.canon_content})
+        self.drive.start()
+        self.settings_override = override_settings(
+            WAGTAILIMAGEIMPORT_DRIVE_API_URL=self.drive.api_url,
+            WAGTAILIMAGEIMPORT_SERVER_SIDE_DRIVE_FETCH=True,
+        )
+        self.settings_override.enable()
+        self.login()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.drive.stop()
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def test_import_fetches_file_from_drive(self):
+        response = self.client.post(
+            reverse("wagtail_image_import:import"),
+            {
+                "name": "Canon_40D.jpg",
+                "collection": 1,
+                "action": "keep",
+                "drive_id": "canon",
+                "oauth_token": "test-token",
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        response_json = response.json()
+        self.assertEqual(response_json["success"], True)
+
+        image = CustomImage.objects.get(id=response_json["image_id"])
+        self.assertEqual(image.driveidmapping.drive_id, "canon")
+        self.assertEqual(image.file_size, len(self.canon_content))
+        with image.open_file() as f:
+            self.assertEqual(f.read(), self.canon_content)
+
+        response = self.client.get(
+            reverse("wagtail_image_import:drive_fetch_progress"), {"drive_id": "canon"}
+        )
+        self.assertEqual(
+            response.json(),
+            {"loaded": len(self.canon_content), "total": len(self.canon_content)},
+        )
+
+    def test_import_fetch_failure(self):
+        response = self.client.post(
+            reverse("wagtail_image_import:import"),
+            {
+                "name": "Canon_40D.jpg",
+                "collection": 1,
+                "action": "keep",
+                "drive_id": "canon",
+                "oauth_token": "expired-token",
+            },
+        )
+        self.assertEqual(
+            response.json(), {"success": False, "error": "Failed to import from Google"}
+        )
+        self.assertFalse(CustomImage.objects.exists())
+
+    def test_import_without_drive_id_or_token(self):
+        for data in [
+            {"drive_id": "canon"},
+            {"oauth_token": "test-token"},
+            {"drive_id": "", "oauth_token": "test-token"},
+        ]:
+            response = self.client.post(
+                reverse("wagtail_image_import:import"),
+                {"name": "Canon_40D.jpg", "collection": 1, "action": "keep", **data},
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["success"], False)
+        self.assertFalse(CustomImage.objects.exists())
+
+    def test_fetch_disabled(self):
+        data = {
+            "name": "Canon_40D.jpg",
+            "collection": 1,
+            "action": "keep",
+            "drive_id": "canon",
+            "oauth_token": "test-token",
+        }
+        with override_settings(WAGTAILIMAGEIMPORT_SERVER_SIDE_DRIVE_FETCH=False):
+            response = self.client.post(reverse("wagtail_image_import:import"), data)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("disabled", response.json()["error"])
+
+            response = self.client.post(
+                reverse("wagtail_image_import:import_bulk"),
+                {
+                    "items": json.dumps([{"drive_id": "canon"}]),
+                    "collection": 1,
+                    "oauth_token": "test-token",
+                },
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(CustomImage.objects.exists())
+        self.assertEqual(self.drive.requests, [])
+
+    def test_import_bulk_fetches_files_from_drive(self):
+        response = self.client.post(
+            reverse("wagtail_image_import:import_bulk"),
+            {
+                "items": json.dumps(
+                    [
+                        {"drive_id": "canon", "name": "Canon_40D.jpg"},
+                        {"drive_id": "missing", "name": "missing.jpg"},
+                    ]
+                ),
+                "collection": 1,
+                "oauth_token": "test-token",
+            },
+        )
+        results = response.json()["results"]
+        self.assertEqual(results[0]["success"], True)
+        self.assertEqual(
+            results[1],
+            {
+                "drive_id": "missing",
+                "success": False,
+                "error": "Failed to import from Google",
+            },
+        )
+        image = CustomImage.objects.get(id=results[0]["image_id"])
+        self.assertEqual(image.driveidmapping.drive_id, "canon")
@@ -0,0 +1,103 @@
+import json
+import os.path
+import shutil
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from wagtail.tests.utils import WagtailTestUtils
+
+from wagtail_image_import.duplicate_cache import LocalLRUCache, local_cache
+from wagtail_image_import.models import DriveIDMapping
+from wagtail_image_import.utils import set_drive_id_mappings
+
+from tests.models import CustomImage
+
+
+TEST_MEDIA_DIR = os.path.join(os.path.join(settings.BASE_DIR, "test-media"))
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+@override_settings(WAGTAILIMAGEIMPORT_DUPLICATE_CACHE="local")
+class TestDuplicatePayloadCache(TestCase, WagtailTestUtils):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        local_cache.clear()
+        self.image = self.create_image("wagtail")
+        DriveIDMapping.objects.create(image=self.image, drive_id="drive-1")
+        self.login()
+
+    def tearDown(self):
+        local_cache.clear()
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def create_image(self, title):
+        with open(TEST_DATA_DIR + "/wagtail_1.png", "rb") as f:
+            return CustomImage.objects.create(
+                title=title, file=SimpleUploadedFile("wagtail_1.png", f.read())
+            )
+
+    def find_duplicates(self, image_data_list):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("wagtail_image_import:find_duplicates"),
+                data=json.dumps(image_data_list),
+                content_type="application/json",
+            )
+        return response.json(), len(queries)
+
+    def test_repeated_request_uses_cache(self):
+        image_data_list = [
+            {"id": "drive-1", "name": "other"},
+            {"id": "drive-2", "name": "new image"},
+        ]
+        duplicates, uncached_queries = self.find_duplicates(image_data_list)
+        cached_duplicates, cached_queries = self.find_duplicates(image_data_list)
+        self.assertEqual(cached_duplicates, duplicates)
+        self.assertEqual(list(duplicates), ["drive-1"])
+        self.assertLess(cached_queries, uncached_queries)
+
+    def test_title_change_invalidates_match(self):
+        image_data_list = [{"id": "drive-1", "name": "other"}]
+        self.find_duplicates(image_data_list)
+        self.image.title = "renamed"
+        self.image.save()
+        duplicates, queries = self.find_duplicates(image_data_list)
+        self.assertEqual(duplicates["drive-1"]["title"], "renamed")
+
+    def test_new_image_invalidates_no_duplicate(self):
+        image_data_list = [{"id": "drive-2", "name": "new image"}]
+        duplicates, queries = self.find_duplicates(image_data_list)
+        self.assertEqual(duplicates, {})
+        new_image = self.create_image("new image")
+        duplicates, queries = self.find_duplicates(image_data_list)
+        self.assertEqual(duplicates["drive-2"]["wagtail_id"], new_image.pk)
+
+    def test_deleted_image_invalidates_match(self):
+        image_data_list = [{"id": "drive-1", "name": "other"}]
+        self.find_duplicates(image_data_list)
+        self.image.delete()
+        duplicates, queries = self.find_duplicates(image_data_list)
+        self.assertEqual(duplicates, {})
+
+    def test_drive_id_change_invalidates_match(self):
+        image_data_list = [
+            {"id": "drive-1", "name": "other"},
+            {"id": "drive-3", "name": "other"},
+        ]
+        duplicates, queries = self.find_duplicates(image_data_list)
+        self.assertEqual(list(duplicates), ["drive-1"])
+        set_drive_id_mappings({self.image.pk: "drive-3"})
+        duplicates, queries = self.find_duplicates(image_data_list)
+        self.assertEqual(list(duplicates), ["drive-3"])
+
+    def test_local_cache_evicts_least_recently_used(self):
+        cache = LocalLRUCache(max_size=2)
+        cache.set_many({"a": 1, "b": 2})
+        cache.get_many(["a"])
+        cache.set_many({"c": 3})
+        self.assertEqual(cache.get_many(["a", "b", "c"]), {"a": 1, "c": 3})
@@ -1,12 +1,36 @@
+import hashlib
+import importlib
 import os.path
 import shutil
+from contextlib import contextmanager
+from unittest import mock
 
+from django.apps import apps
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, override_settings
 
-from wagtail_image_import.models import DriveIDMapping
-from wagtail_image_import.utils import get_most_likely_duplicate
+from wagtail.images.models import Image
+
+from wagtail_image_import.duplicate_backends import reset_duplicate_backend
+from wagtail_image_import.fuzzy_titles import get_similarity, get_title_ngrams
+from wagtail_image_import.metadata import extract_file_metadata
+from wagtail_image_import.models import (
+    DriveIDMapping,
+    DuplicateFingerprint,
+    TitleNGram,
+)
+from wagtail_image_import.utils import (
+    DEFAULT_FIELD_MAPPING,
+    DuplicateScoringPlan,
+    find_similar_titles,
+    get_duplicate_scoring_plan,
+    get_most_likely_duplicate,
+    get_most_likely_duplicates,
+)
 
 from tests.models import CustomImage
 
@@ -59,6 +83,13 @@ class TestDuplicateFinding(TestCase):
         )
         self.assertEqual(duplicate_2, None)
 
+    def test_find_normalized_title_duplicates(self):
+        title_config = ({"name": "title"}, {"title": 10})
+        duplicate = get_most_likely_duplicate(
+            {"name": "  WAGTAIL_2.png "}, *title_config
+        )
+        self.assertEqual(duplicate, self.wagtail_2_image)
+
     def test_find_drive_id_duplicates(self):
         id_config = ({"id": "driveidmapping__drive_id"}, {})
         duplicate = get_most_likely_duplicate({"id": "1"}, *id_config)
@@ -101,3 +132,372 @@ class TestDuplicateFinding(TestCase):
         self.assertEqual(self.wagtail_1_image.exif_datetime, "")
         self.assertEqual(self.wagtail_2_image.exif_datetime, "")
         self.assertEqual(self.canon_image.exif_datetime, "2008:07:31 10:38:11")
+
+    def test_find_duplicates_batched(self):
+        config = (
+            {"id": "driveidmapping__drive_id", "name": "title", "md5Checksum": "md5_hash"},
+            {"driveidmapping__drive_id": 10, "md5_hash": 5, "title": 2},
+        )
+        image_data_list = [
+            {"id": "1", "name": "wagtail_1.png"},
+            {"id": "200000", "name": "Canon_40D.jpg"},
+            {"id": "300000", "name": "new_image.png"},
+            # the md5 hash points to wagtail_2 and outweighs the title match
+            {"name": "wagtail_1.png", "md5Checksum": "4bbc11818585b0e359a30e6d93eeb613"},
+        ]
+        # one query per mapped field, and one to fetch the matched images
+        with self.assertNumQueries(4):
+            duplicates = get_most_likely_duplicates(image_data_list, *config)
+        self.assertEqual(
+            duplicates,
+            [self.wagtail_1_image, self.canon_image, None, self.wagtail_2_image],
+        )
+
+    def test_save_only_extracts_metadata_when_file_changes(self):
+        image = CustomImage.objects.get(pk=self.canon_image.pk)
+        # a missing perceptual hash is left to backfill_duplicate_fields, rather than computed on every save
+        CustomImage.objects.filter(pk=image.pk).update(perceptual_hash="")
+        image.perceptual_hash = ""
+        with mock.patch(
+            "wagtail_image_import.models.extract_file_metadata"
+        ) as extract, mock.patch(
+            "wagtail_image_import.models.compute_perceptual_hash"
+        ) as compute_hash:
+            image.title = "edited"
+            image.save()
+            image.title = "edited again"
+            image.save()
+            self.canon_image.focal_point_x = 10
+            self.canon_image.save()
+        extract.assert_not_called()
+        compute_hash.assert_not_called()
+        self.assertEqual(image.exif_datetime, "2008:07:31 10:38:11")
+
+        image.file = SimpleUploadedFile(
+            name="wagtail_2.png",
+            content=open(TEST_DATA_DIR + "/wagtail_2.png", "rb").read(),
+            content_type="image/png",
+        )
+        image.save()
+        image.refresh_from_db()
+        self.assertEqual(image.md5_hash, "4bbc11818585b0e359a30e6d93eeb613")
+        self.assertEqual(image.exif_datetime, "")
+
+    def test_extract_file_metadata(self):
+        with open(TEST_DATA_DIR + "/Canon_40D.jpg", "rb") as f:
+            metadata = extract_file_metadata(f, chunk_size=1024)
+            f.seek(0)
+            contents = f.read()
+        self.assertEqual(metadata.file_hash, hashlib.sha1(contents).hexdigest())
+        self.assertEqual(metadata.md5_hash, "406958840ad1665ffcd1be9c29d515b9")
+        self.assertEqual(metadata.size, len(contents))
+        self.assertEqual((metadata.width, metadata.height), (100, 68))
+        self.assertEqual(metadata.exif_datetime, "2008:07:31 10:38:11")
+
+    def test_fingerprints_kept_in_sync(self):
+        fingerprint = DuplicateFingerprint.objects.get(image=self.canon_image)
+        self.assertEqual(fingerprint.title, "canon_40d.jpg")
+        self.assertEqual(fingerprint.drive_id, "")
+        self.assertEqual(fingerprint.md5_hash, self.canon_image.md5_hash)
+        self.assertEqual(fingerprint.exif_datetime, "2008:07:31 10:38:11")
+
+        self.canon_image.title = "Renamed Canon.jpg"
+        self.canon_image.save(update_fields=["title"])
+        mapping = DriveIDMapping.objects.create(image=self.canon_image, drive_id="3")
+        fingerprint.refresh_from_db()
+        self.assertEqual(fingerprint.title, "renamed canon.jpg")
+        self.assertEqual(fingerprint.drive_id, "3")
+
+        mapping.delete()
+        fingerprint.refresh_from_db()
+        self.assertEqual(fingerprint.drive_id, "")
+
+        self.wagtail_1_image.delete()
+        self.assertFalse(
+            DuplicateFingerprint.objects.filter(image_id=self.wagtail_1_image.pk).exists()
+        )
+
+    def test_rebuild_duplicate_fingerprints_command(self):
+        DuplicateFingerprint.objects.all().delete()
+        call_command("rebuild_duplicate_fingerprints", batch_size=2, stdout=open(os.devnull, "w"))
+
+        self.assertEqual(DuplicateFingerprint.objects.count(), 3)
+        fingerprint = DuplicateFingerprint.objects.get(image=self.wagtail_1_image)
+        self.assertEqual(fingerprint.drive_id, "1")
+        self.assertEqual(fingerprint.md5_hash, "93d85f960bcffa9c1b1d55296db40ad0")
+
+    def test_fingerprints_populated_by_migration(self):
+        migration = importlib.import_module(
+            "wagtail_image_import.migrations.0013_populate_duplicatefingerprints"
+        )
+        DuplicateFingerprint.objects.exclude(image=self.canon_image).delete()
+        migration.populate_fingerprints(apps, None)
+
+        self.assertEqual(DuplicateFingerprint.objects.count(), 3)
+        fingerprint = DuplicateFingerprint.objects.get(image=self.wagtail_1_image)
+        self.assertEqual(fingerprint.drive_id, "1")
+        self.assertEqual(fingerprint.md5_hash, "93d85f960bcffa9c1b1d55296db40ad0")
+        self.assertEqual(fingerprint.title, "wagtail_1.png")
+        self.assertEqual(
+            get_most_likely_duplicate({"id": "2"}, {"id": "driveidmapping__drive_id"}, {}),
+            self.wagtail_2_image,
+        )
+
+
+@contextmanager
+def run_on_commit_callbacks():
+    """
+    Runs the on_commit callbacks registered within the block, as TestCase's transaction is never committed
+    """
+    start = len(connection.run_on_commit)
+    yield
+    callbacks = connection.run_on_commit[start:]
+    del connection.run_on_commit[start:]
+    for callback in callbacks:
+        callback[1]()
+
+
+@override_settings(
+    WAGTAILIMAGEIMPORT_DUPLICATE_BACKEND="wagtail_image_import.duplicate_backends.InMemoryDuplicateBackend"
+)
+class TestInMemoryDuplicateBackend(TestDuplicateFinding):
+    # runs every duplicate finding test against the in-memory index too
+
+    def setUp(self):
+        # the index outlives each test's rolled back transaction, so start afresh
+        reset_duplicate_backend("WAGTAILIMAGEIMPORT_DUPLICATE_BACKEND")
+        super().setUp()
+
+    def test_find_duplicates_batched(self):
+        config = (
+            {"id": "driveidmapping__drive_id", "name": "title", "md5Checksum": "md5_hash"},
+            {"driveidmapping__drive_id": 10, "md5_hash": 5, "title": 2},
+        )
+        image_data_list = [
+            {"id": "1", "name": "wagtail_1.png"},
+            {"name": "wagtail_1.png", "md5Checksum": "4bbc11818585b0e359a30e6d93eeb613"},
+        ]
+        # one query to load the index, and one to fetch the matched images
+        with self.assertNumQueries(2):
+            duplicates = get_most_likely_duplicates(image_data_list, *config)
+        self.assertEqual(duplicates, [self.wagtail_1_image, self.wagtail_2_image])
+        # once loaded, only the matched images are fetched
+        with self.assertNumQueries(1):
+            get_most_likely_duplicates(image_data_list, *config)
+
+    def test_index_kept_in_sync(self):
+        config = ({"id": "driveidmapping__drive_id", "name": "title"}, {})
+        self.assertEqual(get_most_likely_duplicate({"id": "3"}, *config), None)
+
+        with run_on_commit_callbacks():
+            DriveIDMapping.objects.create(image=self.canon_image, drive_id="3")
+        self.assertEqual(
+            get_most_likely_duplicate({"id": "3"}, *config), self.canon_image
+        )
+
+        self.canon_image.title = "Renamed Canon.jpg"
+        with run_on_commit_callbacks():
+            self.canon_image.save(update_fields=["title"])
+        self.assertEqual(
+            get_most_likely_duplicate({"name": "renamed canon.jpg"}, *config),
+            self.canon_image,
+        )
+        self.assertEqual(
+            get_most_likely_duplicate({"name": "Canon_40D.jpg"}, *config), None
+        )
+
+        with run_on_commit_callbacks():
+            self.canon_image.delete()
+        self.assertEqual(get_most_likely_duplicate({"id": "3"}, *config), None)
+
+    def test_rolled_back_changes_not_indexed(self):
+        config = ({"id": "driveidmapping__drive_id"}, {})
+        self.assertEqual(get_most_likely_duplicate({"id": "3"}, *config), None)
+
+        with run_on_commit_callbacks():
+            try:
+                with transaction.atomic():
+                    DriveIDMapping.objects.create(image=self.canon_image, drive_id="3")
+                    raise DatabaseError("rolled back")
+            except DatabaseError:
+                pass
+        self.assertFalse(DriveIDMapping.objects.filter(drive_id="3").exists())
+        self.assertEqual(get_most_likely_duplicate({"id": "3"}, *config), None)
+
+    def test_index_reloaded_when_stale(self):
+        config = ({"id": "driveidmapping__drive_id"}, {})
+        self.assertEqual(get_most_likely_duplicate({"id": "3"}, *config), None)
+        # a change the index isn't told of, as when made by another process
+        DuplicateFingerprint.objects.filter(image=self.canon_image).update(drive_id="3")
+        self.assertEqual(get_most_likely_duplicate({"id": "3"}, *config), None)
+
+        with override_settings(WAGTAILIMAGEIMPORT_DUPLICATE_INDEX_MAX_AGE=-1):
+            self.assertEqual(
+                get_most_likely_duplicate({"id": "3"}, *config), self.canon_image
+            )
+
+
+@override_settings(
+    WAGTAILIMAGEIMPORT_FIELD_MAPPING={
+        "id": "driveidmapping__drive_id",
+        "name": "fuzzy_title",
+    }
+)
+class TestFuzzyTitleMatching(TestCase):
+    field_mapping = {"id": "driveidmapping__drive_id", "name": "fuzzy_title"}
+    field_weighting = {"driveidmapping__drive_id": 10, "fuzzy_title": 2}
+
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        with open(TEST_DATA_DIR + "/Canon_40D.jpg", "rb") as f:
+            self.content = f.read()
+        self.images = {
+            title: self.create_image(title)
+            for title in [
+                "IMG_1234.jpg",
+                "IMG_1235.jpg",
+                "Summer party.jpg",
+                "Summer party at the beach.jpg",
+                "Canon_40D.jpg",
+            ]
+        }
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def create_image(self, title):
+        return CustomImage.objects.create(
+            title=title, file=SimpleUploadedFile("image.jpg", self.content)
+        )
+
+    def find(self, name):
+        return get_most_likely_duplicate(
+            {"id": "", "name": name}, self.field_mapping, self.field_weighting
+        )
+
+    def test_title_ngrams_indexed(self):
+        image = self.images["IMG_1234.jpg"]
+        self.assertEqual(
+            set(
+                TitleNGram.objects.filter(image=image).values_list("ngram", flat=True)
+            ),
+            get_title_ngrams("IMG_1234.jpg"),
+        )
+
+        image.title = "Renamed"
+        image.save()
+        self.assertEqual(
+            set(
+                TitleNGram.objects.filter(image=image).values_list("ngram", flat=True)
+            ),
+            get_title_ngrams("Renamed"),
+        )
+
+        image_id = image.pk
+        image.delete()
+        self.assertFalse(TitleNGram.objects.filter(image_id=image_id).exists())
+
+    def test_find_similar_titles(self):
+        self.assertEqual(self.find("IMG_1234 (1).jpg"), self.images["IMG_1234.jpg"])
+        self.assertEqual(
+            self.find("summer-party.JPG"), self.images["Summer party.jpg"]
+        )
+        # similar but distinct titles fall below the threshold
+        self.assertIsNone(self.find("IMG_4321.jpg"))
+
+    def test_similarity_adds_to_weighting(self):
+        # an exact Drive ID match outweighs a similar title
+        DriveIDMapping.objects.create(image=self.images["Canon_40D.jpg"], drive_id="1")
+        duplicate = get_most_likely_duplicate(
+            {"id": "1", "name": "IMG_1234.jpg"},
+            self.field_mapping,
+            self.field_weighting,
+        )
+        self.assertEqual(duplicate, self.images["Canon_40D.jpg"])
+
+    def test_matches_linear_scan(self):
+        for title in ["IMG_12%02d.jpg" % index for index in range(40)]:
+            self.create_image(title)
+        queries = ["IMG_1234 (2).jpg", "IMG_1201.JPG", "Summer party (1).jpg", "x"]
+        for threshold in (0.5, 0.8):
+            expected = {}
+            for query in queries:
+                similarities = {
+                    image.pk: get_similarity(
+                        get_title_ngrams(query), get_title_ngrams(image.title)
+                    )
+                    for image in CustomImage.objects.all()
+                }
+                expected[query] = {
+                    pk: similarity
+                    for pk, similarity in similarities.items()
+                    if similarity >= threshold
+                }
+            self.assertEqual(find_similar_titles(queries, threshold), expected)
+
+    def test_rebuild_duplicate_fingerprints_command(self):
+        TitleNGram.objects.all().delete()
+        call_command("rebuild_duplicate_fingerprints", stdout=mock.Mock())
+        self.assertEqual(self.find("IMG_1234 (1).jpg"), self.images["IMG_1234.jpg"])
+
+
+class TestDuplicateScoringPlan(TestCase):
+    def test_projects_mapped_fields(self):
+        plan = DuplicateScoringPlan(
+            {
+                "id": "driveidmapping__drive_id",
+                "name": "title",
+                "imageMediaMetadata__time": "exif_datetime",
+            },
+            {},
+        )
+        self.assertEqual(
+            plan.get_lookup_values(
+                {
+                    "id": "1",
+                    "name": "  Wagtail.PNG",
+                    "imageMediaMetadata": {
+                        "time": "2008:07:31 10:38:11",
+                        "location": {"latitude": 1},
+                    },
+                }
+            ),
+            {
+                "driveidmapping__drive_id": "1",
+                "title": "wagtail.png",
+                "exif_datetime": "2008:07:31 10:38:11",
+            },
+        )
+        self.assertEqual(
+            plan.get_lookup_values({"name": "", "imageMediaMetadata": "invalid"}), {}
+        )
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ImproperlyConfigured):
+            DuplicateScoringPlan({"name": "not_a_field"}, {})
+        with self.assertRaises(ImproperlyConfigured):
+            DuplicateScoringPlan({"name": "title"}, {"title": "high"})
+        with self.assertRaises(ImproperlyConfigured):
+            DuplicateScoringPlan(["name"], {})
+
+    def test_mixin_fields_need_mixin(self):
+        # the hashes fingerprinted for images using DuplicateFindingMixin can't be matched on other image models
+        with mock.patch(
+            "wagtail_image_import.utils.get_image_model", return_value=Image
+        ):
+            for field_mapping in [
+                {"md5Checksum": "md5_hash"},
+                {"imageMediaMetadata__time": "exif_datetime"},
+            ]:
+                with self.assertRaises(ImproperlyConfigured):
+                    DuplicateScoringPlan(field_mapping, {})
+            DuplicateScoringPlan(DEFAULT_FIELD_MAPPING, {})
+
+    def test_plan_rebuilt_when_settings_change(self):
+        plan = get_duplicate_scoring_plan()
+        self.assertIs(get_duplicate_scoring_plan(), plan)
+        with override_settings(WAGTAILIMAGEIMPORT_FIELD_MAPPING={"name": "title"}):
+            self.assertEqual(
+                get_duplicate_scoring_plan().field_mapping, {"name": "title"}
+            )
+        self.assertIsNot(get_duplicate_scoring_plan(), plan)
@@ -0,0 +1,97 @@
+import json
+import os.path
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from wagtail.tests.utils import WagtailTestUtils
+
+from wagtail_image_import.models import DriveIDMapping
+
+from tests.models import CustomImage
+
+
+TEST_MEDIA_DIR = os.path.join(os.path.join(settings.BASE_DIR, "test-media"))
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+class TestImportFiles(TestCase, WagtailTestUtils):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        self.create_test_user()
+        with open(TEST_DATA_DIR + "/wagtail_1.png", "rb") as f:
+            self.existing_image = CustomImage.objects.create(
+                title="wagtail_1.png",
+                file=SimpleUploadedFile("wagtail_1.png", f.read()),
+            )
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, "album"))
+        for name, path in [
+            ("wagtail_1.png", "wagtail_1.png"),
+            ("wagtail_2.png", "wagtail_2.png"),
+            ("Canon_40D.jpg", "album/Canon_40D.jpg"),
+        ]:
+            shutil.copy(
+                os.path.join(TEST_DATA_DIR, name), os.path.join(self.directory, path)
+            )
+        with open(os.path.join(self.directory, "notes.txt"), "w") as f:
+            f.write("not an image")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def import_files(self, **options):
+        stdout = StringIO()
+        call_command(
+            "import_files",
+            self.directory,
+            user="test@email.com",
+            processes=0,
+            stdout=stdout,
+            **options
+        )
+        return stdout.getvalue()
+
+    def test_skip_duplicates(self):
+        output = self.import_files()
+        self.assertIn(
+            "Imported 2, replaced 0, skipped 1 and failed to import 0 of 3 files", output
+        )
+        self.assertEqual(
+            sorted(CustomImage.objects.values_list("title", flat=True)),
+            ["Canon_40D.jpg", "wagtail_1.png", "wagtail_2.png"],
+        )
+        self.assertEqual(
+            CustomImage.objects.get(title="Canon_40D.jpg").exif_datetime,
+            "2008:07:31 10:38:11",
+        )
+
+    def test_replace_duplicates(self):
+        old_file_name = self.existing_image.file.name
+        output = self.import_files(duplicates="replace")
+        self.assertIn("Imported 2, replaced 1", output)
+        self.assertEqual(CustomImage.objects.count(), 3)
+        self.existing_image.refresh_from_db()
+        self.assertNotEqual(self.existing_image.file.name, old_file_name)
+
+    def test_keep_duplicates(self):
+        self.import_files(duplicates="keep")
+        self.assertEqual(CustomImage.objects.filter(title="wagtail_1.png").count(), 2)
+
+    def test_sidecar_metadata(self):
+        with open(os.path.join(self.directory, "wagtail_2.png.json"), "w") as f:
+            json.dump({"title": "Wagtail logo", "id": "drive-2"}, f)
+        self.import_files()
+        image = CustomImage.objects.get(title="Wagtail logo")
+        self.assertEqual(DriveIDMapping.objects.get(image=image).drive_id, "drive-2")
+
+    def test_unknown_user(self):
+        with self.assertRaises(CommandError):
+            call_command("import_files", self.directory, user="nobody")
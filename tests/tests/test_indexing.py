@@ -0,0 +1,171 @@
+import json
+import os.path
+import shutil
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from wagtail.tests.utils import WagtailTestUtils
+
+from wagtail_image_import.indexing import flush_search_index_updates
+from wagtail_image_import.models import PendingSearchIndexUpdate
+
+from tests.models import CustomImage
+
+
+TEST_MEDIA_DIR = os.path.join(os.path.join(settings.BASE_DIR, "test-media"))
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+@override_settings(WAGTAILIMAGEIMPORT_DEFER_SEARCH_INDEXING=True)
+class TestDeferredSearchIndexing(TestCase, WagtailTestUtils):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        with open(TEST_DATA_DIR + "/wagtail_1.png", "rb") as f:
+            content = f.read()
+        self.images = [
+            CustomImage.objects.create(
+                title="image %d" % index,
+                file=SimpleUploadedFile("wagtail_%d.png" % index, content),
+            )
+            for index in range(3)
+        ]
+        self.user = self.login()
+        self.backend = mock.Mock()
+        patcher = mock.patch(
+            "wagtail_image_import.indexing.get_search_backends",
+            return_value=[self.backend],
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def edit(self, image):
+        response = self.client.post(
+            reverse("wagtail_image_import:edit", args=[image.id]),
+            {
+                "image-%d-title" % image.id: "edited " + image.title,
+                "image-%d-collection" % image.id: 1,
+            },
+        )
+        self.assertEqual(response.json()["success"], True)
+
+    def import_image(self, url_name="import"):
+        with open(TEST_DATA_DIR + "/wagtail_2.png", "rb") as f:
+            content = f.read()
+        if url_name == "import_bulk":
+            data = {
+                "items": json.dumps(
+                    [{"drive_id": "2", "name": "new", "file": "file_0"}]
+                ),
+                "file_0": SimpleUploadedFile("wagtail_2.png", content),
+            }
+        else:
+            data = {
+                "drive_id": "2",
+                "name": "new",
+                "action": "keep",
+                "image_file": SimpleUploadedFile("wagtail_2.png", content),
+            }
+        data["collection"] = 1
+        response = self.client.post(reverse("wagtail_image_import:" + url_name), data)
+        self.assertEqual(response.status_code, 200)
+        return CustomImage.objects.get(title="new")
+
+    def test_imports_are_queued(self):
+        for url_name in ["import", "import_bulk"]:
+            with self.subTest(url_name=url_name), mock.patch(
+                "wagtail.search.index.get_search_backends_with_name",
+                return_value=[("default", self.backend)],
+            ):
+                image = self.import_image(url_name)
+
+                # Wagtail's own indexing of the saved image is queued too
+                self.backend.add.assert_not_called()
+                self.assertTrue(
+                    PendingSearchIndexUpdate.objects.filter(
+                        image=image, user=self.user
+                    ).exists()
+                )
+                image.delete()
+
+    @override_settings(WAGTAILIMAGEIMPORT_DEFER_SEARCH_INDEXING=False)
+    def test_imports_indexed_when_not_deferred(self):
+        with mock.patch(
+            "wagtail.search.index.get_search_backends_with_name",
+            return_value=[("default", self.backend)],
+        ):
+            image = self.import_image()
+        self.backend.add.assert_called_once_with(image)
+        self.assertFalse(PendingSearchIndexUpdate.objects.exists())
+
+    def test_edits_are_queued(self):
+        for image in self.images:
+            self.edit(image)
+        # editing an image twice only queues it once
+        self.edit(self.images[0])
+
+        self.backend.add.assert_not_called()
+        self.assertEqual(
+            set(PendingSearchIndexUpdate.objects.values_list("image_id", flat=True)),
+            {image.pk for image in self.images},
+        )
+
+    def test_flush_view(self):
+        for image in self.images:
+            self.edit(image)
+        response = self.client.post(reverse("wagtail_image_import:flush_search_index"))
+        self.assertEqual(response.json(), {"success": True, "indexed": 3})
+        self.backend.add_bulk.assert_called_once()
+        self.assertFalse(PendingSearchIndexUpdate.objects.exists())
+
+    def test_flush_in_chunks(self):
+        for image in self.images:
+            self.edit(image)
+        self.assertEqual(flush_search_index_updates(chunk_size=2), 3)
+
+        # the three images are sent in two add_bulk calls, each with the edited images
+        self.assertEqual(self.backend.add_bulk.call_count, 2)
+        indexed_titles = {
+            image.title
+            for call in self.backend.add_bulk.call_args_list
+            for image in call[0][1]
+        }
+        self.assertEqual(
+            indexed_titles, {"edited " + image.title for image in self.images}
+        )
+        self.assertFalse(PendingSearchIndexUpdate.objects.exists())
+
+    def test_flush_only_indexes_own_session(self):
+        PendingSearchIndexUpdate.objects.create(
+            image=self.images[0], user=self.create_user("other")
+        )
+        PendingSearchIndexUpdate.objects.create(image=self.images[1], user=self.user)
+
+        self.assertEqual(flush_search_index_updates(user=self.user), 1)
+        self.assertEqual(
+            list(PendingSearchIndexUpdate.objects.values_list("image_id", flat=True)),
+            [self.images[0].pk],
+        )
+
+    def test_flush_command(self):
+        for image in self.images:
+            PendingSearchIndexUpdate.objects.create(image=image)
+        stdout = StringIO()
+        call_command("flush_search_index", stdout=stdout)
+        self.assertIn("Indexed 3 images", stdout.getvalue())
+        self.backend.add_bulk.assert_called_once()
+        self.assertFalse(PendingSearchIndexUpdate.objects.exists())
+
+    @override_settings(WAGTAILIMAGEIMPORT_DEFER_SEARCH_INDEXING=False)
+    def test_indexing_not_deferred(self):
+        self.edit(self.images[0])
+        self.backend.add.assert_called_once()
+        self.assertFalse(PendingSearchIndexUpdate.objects.exists())
@@ -0,0 +1,122 @@
+import json
+import os.path
+import shutil
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from wagtail.tests.utils import WagtailTestUtils
+
+from wagtail_image_import.instrumentation import stage, stage_finished
+
+from tests.models import CustomImage
+
+
+TEST_MEDIA_DIR = os.path.join(os.path.join(settings.BASE_DIR, "test-media"))
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+class TestInstrumentation(TestCase, WagtailTestUtils):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        with open(TEST_DATA_DIR + "/Canon_40D.jpg", "rb") as f:
+            self.canon_content = f.read()
+        self.login()
+        self.stages = []
+        stage_finished.connect(self.record_stage)
+
+    def tearDown(self):
+        stage_finished.disconnect(self.record_stage)
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def record_stage(self, sender, **kwargs):
+        self.stages.append((sender, kwargs))
+
+    def import_image(self):
+        return self.client.post(
+            reverse("wagtail_image_import:import"),
+            {
+                "name": "new_image",
+                "collection": 1,
+                "image_file": SimpleUploadedFile("Canon_40D.jpg", self.canon_content),
+                "action": "keep",
+                "drive_id": "2",
+            },
+        )
+
+    @override_settings(WAGTAILIMAGEIMPORT_NEAR_DUPLICATE_DISTANCE=6)
+    def test_import_stages(self):
+        response = self.import_image()
+        self.assertEqual(response.json()["success"], True)
+        self.assertNotIn("Server-Timing", response)
+
+        stages = {kwargs["stage"]: kwargs for sender, kwargs in self.stages}
+        self.assertEqual(
+            {sender for sender, kwargs in self.stages}, {"import_from_drive"}
+        )
+        for name in [
+            "form_validation",
+            "exif",
+            "file_hashing",
+            "storage_write",
+            "perceptual_hash",
+            "image_save",
+            "mapping_upsert",
+            "render_form",
+            "total",
+        ]:
+            self.assertIn(name, stages)
+        self.assertEqual(stages["file_hashing"]["bytes"], len(self.canon_content))
+        self.assertGreater(stages["image_save"]["queries"], 0)
+        self.assertEqual(stages["file_hashing"]["queries"], 0)
+        # the whole view is recorded last
+        self.assertEqual(self.stages[-1][1]["stage"], "total")
+
+    @override_settings(WAGTAILIMAGEIMPORT_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.import_image()
+        metrics = [
+            metric.split(";")[0] for metric in response["Server-Timing"].split(", ")
+        ]
+        self.assertIn("file_hashing", metrics)
+        self.assertEqual(metrics[-1], "total")
+
+        response = self.client.post(
+            reverse("wagtail_image_import:find_duplicates"),
+            data=json.dumps([{"id": "2", "name": "new_image"}]),
+            content_type="application/json",
+        )
+        self.assertIn("duplicate_scoring", response["Server-Timing"])
+
+    @override_settings(WAGTAILIMAGEIMPORT_SERVER_TIMING=True)
+    def test_streaming_stages(self):
+        response = self.client.post(
+            reverse("wagtail_image_import:find_duplicates"),
+            data=json.dumps([{"id": "2", "name": "new_image"}]),
+            content_type="application/json",
+            HTTP_ACCEPT="application/x-ndjson",
+        )
+        # the duplicates are found as the response is streamed, after the view has returned
+        self.assertNotIn(
+            "duplicate_scoring", [kwargs["stage"] for sender, kwargs in self.stages]
+        )
+        self.assertNotIn("Server-Timing", response)
+
+        with self.assertLogs("wagtail_image_import.instrumentation", "INFO") as logs:
+            b"".join(response.streaming_content)
+        stages = [kwargs["stage"] for sender, kwargs in self.stages]
+        self.assertIn("duplicate_scoring", stages)
+        self.assertEqual(stages[-1], "total")
+        self.assertGreater(self.stages[-1][1]["queries"], 0)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn(
+            "duplicate_scoring",
+            [stage["stage"] for stage in logs.records[0].stages],
+        )
+
+    def test_stages_outside_views_not_recorded(self):
+        with stage("standalone"):
+            CustomImage.objects.count()
+        self.assertEqual(self.stages, [])
@@ -0,0 +1,206 @@
+import os.path
+import shutil
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from wagtail.images.models import UploadedImage
+from wagtail.tests.utils import WagtailTestUtils
+
+from wagtail_image_import.jobs import prune_import_jobs, requeue_stale_import_jobs
+from wagtail_image_import.models import ImportJob
+
+from tests.fake_drive import FakeDriveServer
+from tests.models import CustomImage
+
+
+TEST_MEDIA_DIR = os.path.join(os.path.join(settings.BASE_DIR, "test-media"))
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+@override_settings(WAGTAILIMAGEIMPORT_BACKGROUND_IMPORTS=True)
+class TestImportJobs(TestCase, WagtailTestUtils):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        with open(TEST_DATA_DIR + "/Canon_40D.jpg", "rb") as f:
+            self.canon_content = f.read()
+        self.user = self.login()
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def run_worker(self):
+        call_command("run_import_worker", processes=0, once=True, stdout=StringIO())
+
+    def get_job_statuses(self, *job_ids):
+        response = self.client.get(
+            reverse("wagtail_image_import:import_jobs"),
+            {"ids": ",".join(str(job_id) for job_id in job_ids)},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["jobs"]
+
+    def test_uploaded_import_is_queued(self):
+        response = self.client.post(
+            reverse("wagtail_image_import:import"),
+            {
+                "image_file": SimpleUploadedFile(
+                    "Canon_40D.jpg", self.canon_content, content_type="image/jpeg"
+                ),
+                "name": "Canon_40D.jpg",
+                "collection": 1,
+                "action": "keep",
+                "drive_id": "canon",
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        job_id = response.json()["job_id"]
+
+        # nothing is imported until the worker runs
+        self.assertFalse(CustomImage.objects.filter(title="Canon_40D.jpg").exists())
+        self.assertEqual(
+            self.get_job_statuses(job_id), {str(job_id): {"status": "pending"}}
+        )
+
+        self.run_worker()
+
+        status = self.get_job_statuses(job_id)[str(job_id)]
+        self.assertEqual(status["status"], "succeeded")
+        self.assertEqual(status["success"], True)
+        self.assertIn("form", status)
+        image = CustomImage.objects.get(id=status["image_id"])
+        self.assertEqual(image.title, "Canon_40D.jpg")
+        self.assertEqual(image.driveidmapping.drive_id, "canon")
+        self.assertEqual(image.file_size, len(self.canon_content))
+        # the staged file is removed once it has been imported
+        self.assertFalse(UploadedImage.objects.exists())
+
+    def test_drive_import_is_queued(self):
+        drive = FakeDriveServer(files={"canon": self.canon_content})
+        drive.start()
+        try:
+            with override_settings(
+                WAGTAILIMAGEIMPORT_DRIVE_API_URL=drive.api_url,
+                WAGTAILIMAGEIMPORT_SERVER_SIDE_DRIVE_FETCH=True,
+            ):
+                response = self.client.post(
+                    reverse("wagtail_image_import:import"),
+                    {
+                        "name": "Canon_40D.jpg",
+                        "collection": 1,
+                        "action": "keep",
+                        "drive_id": "canon",
+                        "oauth_token": "test-token",
+                    },
+                )
+                job_id = response.json()["job_id"]
+                self.run_worker()
+        finally:
+            drive.stop()
+
+        job = ImportJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, ImportJob.STATUS_SUCCEEDED)
+        self.assertEqual(job.oauth_token, "")
+        image = CustomImage.objects.get(id=job.get_result()["image_id"])
+        with image.open_file() as f:
+            self.assertEqual(f.read(), self.canon_content)
+
+    def test_failed_drive_fetch(self):
+        job = ImportJob.objects.create(
+            user=self.user,
+            drive_id="missing",
+            name="missing.jpg",
+            oauth_token="test-token",
+        )
+        with override_settings(WAGTAILIMAGEIMPORT_DRIVE_API_URL="http://127.0.0.1:1/"):
+            self.run_worker()
+
+        status = self.get_job_statuses(job.pk)[str(job.pk)]
+        self.assertEqual(status["status"], "failed")
+        self.assertEqual(status["error"], "Failed to import from Google")
+
+    def test_status_only_includes_own_jobs(self):
+        other_user = self.create_user("other")
+        job = ImportJob.objects.create(user=other_user, drive_id="1")
+        self.assertEqual(self.get_job_statuses(job.pk), {})
+
+    def test_stale_jobs_are_requeued(self):
+        job = ImportJob.objects.create(
+            user=self.user,
+            status=ImportJob.STATUS_RUNNING,
+            started_at=timezone.now() - timedelta(hours=2),
+        )
+        self.assertEqual(
+            requeue_stale_import_jobs(timezone.now() - timedelta(hours=1)), 1
+        )
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_PENDING)
+
+    def test_failed_job_clears_token_and_file(self):
+        uploaded_image = UploadedImage.objects.create(
+            file=SimpleUploadedFile("Canon_40D.jpg", self.canon_content),
+            uploaded_by_user=self.user,
+        )
+        path = uploaded_image.file.path
+        job = ImportJob.objects.create(
+            user=self.user,
+            drive_id="canon",
+            name="Canon_40D.jpg",
+            uploaded_image=uploaded_image,
+            oauth_token="test-token",
+        )
+        with mock.patch(
+            "wagtail_image_import.jobs.import_image_file",
+            side_effect=RuntimeError("storage unavailable"),
+        ), self.assertLogs("wagtail_image_import.jobs", "ERROR"):
+            self.run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.assertEqual(job.oauth_token, "")
+        self.assertIsNone(job.uploaded_image)
+        self.assertFalse(UploadedImage.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_old_jobs_are_pruned(self):
+        uploaded_image = UploadedImage.objects.create(
+            file=SimpleUploadedFile("Canon_40D.jpg", self.canon_content),
+            uploaded_by_user=self.user,
+        )
+        path = uploaded_image.file.path
+        old = timezone.now() - timedelta(days=8)
+        # a finished job whose image the user never completed
+        old_job = ImportJob.objects.create(
+            user=self.user,
+            status=ImportJob.STATUS_SUCCEEDED,
+            uploaded_image=uploaded_image,
+            finished_at=old,
+        )
+        recent_job = ImportJob.objects.create(
+            user=self.user,
+            status=ImportJob.STATUS_FAILED,
+            finished_at=timezone.now(),
+        )
+        pending_job = ImportJob.objects.create(user=self.user)
+
+        stdout = StringIO()
+        call_command("prune_import_jobs", stdout=stdout)
+        self.assertIn("Deleted 1 import jobs", stdout.getvalue())
+        self.assertEqual(
+            set(ImportJob.objects.values_list("pk", flat=True)),
+            {recent_job.pk, pending_job.pk},
+        )
+        self.assertFalse(ImportJob.objects.filter(pk=old_job.pk).exists())
+        self.assertFalse(UploadedImage.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+        # pending jobs are never pruned
+        self.assertEqual(prune_import_jobs(timezone.now()), 1)
+        self.assertEqual(list(ImportJob.objects.all()), [pending_job])
@@ -0,0 +1,179 @@
+import io
+import json
+import os.path
+import random
+import shutil
+import unittest
+from unittest import mock
+
+import PIL.Image
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from wagtail.tests.utils import WagtailTestUtils
+
+from wagtail_image_import import metadata
+from wagtail_image_import.drive import is_drive_thumbnail_url
+from wagtail_image_import.metadata import compute_perceptual_hash
+from wagtail_image_import.models import DuplicateFingerprint
+from wagtail_image_import.near_duplicates import (
+    BKTree,
+    hamming_distance,
+    perceptual_hash_index,
+)
+
+from tests.fake_drive import FakeDriveServer
+from tests.models import CustomImage
+
+
+TEST_MEDIA_DIR = os.path.join(os.path.join(settings.BASE_DIR, "test-media"))
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+def get_resized_copy(path, scale, quality):
+    image = PIL.Image.open(path).convert("RGB")
+    image = image.resize((int(image.width * scale), int(image.height * scale)))
+    f = io.BytesIO()
+    image.save(f, "JPEG", quality=quality)
+    return f.getvalue()
+
+
+class TestBKTree(TestCase):
+    def test_search_matches_linear_scan(self):
+        rng = random.Random(0)
+        values = [rng.getrandbits(64) for i in range(500)]
+        # include some near copies of the same values
+        values += [value ^ (1 << rng.randrange(64)) for value in values[:50]]
+        tree = BKTree()
+        for item, value in enumerate(values):
+            tree.add(value, item)
+
+        for query in values[:20] + [rng.getrandbits(64) for i in range(20)]:
+            for max_distance in (0, 3, 10):
+                expected = {
+                    item
+                    for item, value in enumerate(values)
+                    if hamming_distance(query, value) <= max_distance
+                }
+                found = {
+                    item for distance, value, item in tree.search(query, max_distance)
+                }
+                self.assertEqual(found, expected)
+
+
+class TestPerceptualHash(TestCase):
+    def test_near_copies_have_similar_hashes(self):
+        with open(TEST_DATA_DIR + "/wagtail_1.png", "rb") as f:
+            original = int(compute_perceptual_hash(f), 16)
+        copy_content = get_resized_copy(TEST_DATA_DIR + "/wagtail_1.png", 0.3, 30)
+        copy = int(compute_perceptual_hash(io.BytesIO(copy_content)), 16)
+        with open(TEST_DATA_DIR + "/Canon_40D.jpg", "rb") as f:
+            other = int(compute_perceptual_hash(f), 16)
+
+        self.assertLessEqual(hamming_distance(original, copy), 4)
+        self.assertGreater(hamming_distance(original, other), 10)
+
+    @unittest.skipIf(metadata.numpy is None, "NumPy is not installed")
+    def test_numpy_matches_pure_python(self):
+        for name in ["wagtail_1.png", "wagtail_2.png", "Canon_40D.jpg"]:
+            with open(os.path.join(TEST_DATA_DIR, name), "rb") as f:
+                numpy_hash = compute_perceptual_hash(f)
+            with mock.patch("wagtail_image_import.metadata.numpy", None), open(
+                os.path.join(TEST_DATA_DIR, name), "rb"
+            ) as f:
+                pure_python_hash = compute_perceptual_hash(f)
+            self.assertEqual(numpy_hash, pure_python_hash, name)
+
+    def test_unreadable_file(self):
+        self.assertEqual(compute_perceptual_hash(io.BytesIO(b"not an image")), "")
+
+
+@override_settings(WAGTAILIMAGEIMPORT_NEAR_DUPLICATE_DISTANCE=6)
+class TestNearDuplicates(TestCase, WagtailTestUtils):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        perceptual_hash_index.reset()
+        with open(TEST_DATA_DIR + "/wagtail_1.png", "rb") as f:
+            self.wagtail_image = CustomImage.objects.create(
+                title="wagtail", file=SimpleUploadedFile("wagtail_1.png", f.read())
+            )
+        with open(TEST_DATA_DIR + "/Canon_40D.jpg", "rb") as f:
+            self.canon_image = CustomImage.objects.create(
+                title="canon", file=SimpleUploadedFile("Canon_40D.jpg", f.read())
+            )
+        self.login()
+
+    def tearDown(self):
+        perceptual_hash_index.reset()
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def test_hash_saved_to_fingerprint(self):
+        self.assertEqual(len(self.wagtail_image.perceptual_hash), 16)
+        self.assertEqual(
+            DuplicateFingerprint.objects.get(image=self.wagtail_image).perceptual_hash,
+            self.wagtail_image.perceptual_hash,
+        )
+
+    def test_index_updates_incrementally(self):
+        wagtail_hash = self.wagtail_image.perceptual_hash
+        self.assertEqual(
+            perceptual_hash_index.search([wagtail_hash], 0), [self.wagtail_image.pk]
+        )
+
+        # a changed hash is found at its new value only, without rebuilding the index
+        tree = perceptual_hash_index.tree
+        DuplicateFingerprint.objects.filter(image=self.wagtail_image).update(
+            perceptual_hash="f" * 16, updated_at=timezone.now()
+        )
+        self.assertEqual(
+            perceptual_hash_index.search([wagtail_hash, "f" * 16], 0),
+            [None, self.wagtail_image.pk],
+        )
+        self.assertIs(perceptual_hash_index.tree, tree)
+
+    def test_find_duplicates_view(self):
+        resized_content = get_resized_copy(TEST_DATA_DIR + "/wagtail_1.png", 0.2, 40)
+        drive = FakeDriveServer(files={"resized": resized_content})
+        drive.start()
+        try:
+            with override_settings(
+                WAGTAILIMAGEIMPORT_DRIVE_API_URL=drive.api_url,
+                WAGTAILIMAGEIMPORT_NEAR_DUPLICATE_DISTANCE=6,
+            ):
+                response = self.client.post(
+                    reverse("wagtail_image_import:find_duplicates"),
+                    data=json.dumps(
+                        [
+                            {
+                                "id": "resized",
+                                "name": "a resized copy",
+                                "thumbnailLink": drive.get_thumbnail_link(
+                                    "resized"
+                                ),
+                            },
+                            {"id": "new", "name": "new image"},
+                        ]
+                    ),
+                    content_type="application/json",
+                    HTTP_X_DRIVE_OAUTH_TOKEN="test-token",
+                )
+        finally:
+            drive.stop()
+
+        duplicates = response.json()
+        self.assertEqual(list(duplicates), ["resized"])
+        self.assertEqual(duplicates["resized"]["wagtail_id"], self.wagtail_image.pk)
+        self.assertEqual(duplicates["resized"]["near_duplicate"], True)
+
+    def test_thumbnails_only_fetched_from_drive(self):
+        self.assertTrue(
+            is_drive_thumbnail_url("https://lh3.googleusercontent.com/abc=s220")
+        )
+        self.assertFalse(is_drive_thumbnail_url("http://lh3.googleusercontent.com/a"))
+        self.assertFalse(is_drive_thumbnail_url("https://example.com/abc"))
+        self.assertFalse(
+            is_drive_thumbnail_url("https://googleusercontent.com.example.com/")
+        )
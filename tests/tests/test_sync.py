@@ -0,0 +1,308 @@
+import json
+import os.path
+import shutil
+import unittest
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from wagtail.tests.utils import WagtailTestUtils
+
+from wagtail_image_import.drive import fetch_drive_file
+from wagtail_image_import.importing import import_image_file
+from wagtail_image_import.models import DriveFolderSync, DriveIDMapping
+
+try:
+    from google.auth import jwt as google_auth_jwt
+except ImportError:  # pragma: no cover
+    google_auth_jwt = None
+
+from tests.fake_drive import FakeDriveServer
+from tests.models import CustomImage
+
+
+TEST_MEDIA_DIR = os.path.join(os.path.join(settings.BASE_DIR, "test-media"))
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+class TestSyncDriveFolders(TestCase, WagtailTestUtils):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        self.create_test_user()
+        self.content = {}
+        for name in ["wagtail_1.png", "wagtail_2.png", "Canon_40D.jpg"]:
+            with open(TEST_DATA_DIR + "/" + name, "rb") as f:
+                self.content[name] = f.read()
+
+        # a page size of 1 makes every listing span several pages
+        self.drive = FakeDriveServer(max_page_size=1)
+        self.drive.add_file(
+            "wagtail", self.content["wagtail_1.png"], "wagtail_1.png", ["folder"]
+        )
+        self.drive.add_file(
+            "canon",
+            self.content["Canon_40D.jpg"],
+            "Canon_40D.jpg",
+            ["folder"],
+            mime_type="image/jpeg",
+        )
+        self.drive.add_file(
+            "notes", b"not an image", "notes.txt", ["folder"], mime_type="text/plain"
+        )
+        self.drive.add_file(
+            "elsewhere", self.content["wagtail_2.png"], "wagtail_2.png", ["other"]
+        )
+        self.drive.start()
+        self.settings_override = override_settings(
+            WAGTAILIMAGEIMPORT_DRIVE_API_URL=self.drive.api_url
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.drive.stop()
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def sync(self, *folder_ids, **options):
+        stdout = StringIO()
+        options.setdefault("oauth_token", "test-token")
+        call_command(
+            "sync_drive_folders",
+            *folder_ids,
+            stdout=stdout,
+            stderr=StringIO(),
+            **options
+        )
+        return stdout.getvalue()
+
+    def get_fetched_drive_ids(self):
+        return [
+            url.path.rsplit("/", 1)[1]
+            for url in self.drive.requests
+            if url.query == "alt=media"
+        ]
+
+    def test_first_sync_imports_folder(self):
+        output = self.sync("folder", add=True, user="test@email.com")
+        self.assertIn("Synced folder: imported 2, replaced 0", output)
+        self.assertEqual(
+            dict(DriveIDMapping.objects.values_list("drive_id", "image__title")),
+            {"wagtail": "wagtail_1.png", "canon": "Canon_40D.jpg"},
+        )
+        folder_sync = DriveFolderSync.objects.get(folder_id="folder")
+        self.assertEqual(folder_sync.page_token, str(len(self.drive.changes)))
+        self.assertIsNotNone(folder_sync.last_synced_at)
+
+    def test_sync_imports_only_changes(self):
+        self.sync("folder", add=True, user="test@email.com")
+        canon_image = CustomImage.objects.get(title="Canon_40D.jpg")
+        self.drive.requests.clear()
+
+        self.drive.add_file(
+            "canon", self.content["wagtail_2.png"], "Canon_40D.png", ["folder"]
+        )
+        self.drive.add_file("new", self.content["wagtail_2.png"], "new.png", ["folder"])
+        self.drive.add_file(
+            "other", self.content["wagtail_1.png"], "other.png", ["other"]
+        )
+        self.drive.remove_file("wagtail")
+
+        output = self.sync()
+        self.assertIn("Synced folder: imported 1, replaced 1", output)
+        self.assertEqual(sorted(self.get_fetched_drive_ids()), ["canon", "new"])
+        # the image of the changed file is replaced, and the image of the removed file is kept
+        self.assertEqual(CustomImage.objects.count(), 3)
+        canon_image.refresh_from_db()
+        self.assertEqual(canon_image.file_size, len(self.content["wagtail_2.png"]))
+
+        # with nothing changed, nothing is fetched
+        self.drive.requests.clear()
+        self.sync()
+        self.assertEqual(self.get_fetched_drive_ids(), [])
+
+    def test_sync_skips_unchanged_files(self):
+        self.sync("folder", add=True, user="test@email.com")
+        self.assertEqual(
+            DriveIDMapping.objects.get(drive_id="wagtail").md5_checksum,
+            self.drive.metadata["wagtail"]["md5Checksum"],
+        )
+        self.drive.requests.clear()
+
+        # touching a file without changing its contents doesn't import it again
+        self.drive.add_file(
+            "wagtail", self.content["wagtail_1.png"], "wagtail_1.png", ["folder"]
+        )
+        output = self.sync()
+        self.assertIn("imported 0, replaced 0, skipped 1", output)
+        self.assertEqual(self.get_fetched_drive_ids(), [])
+
+    def test_first_sync_skips_imported_files(self):
+        image = CustomImage.objects.create(
+            title="Canon_40D.jpg",
+            file=SimpleUploadedFile("Canon_40D.jpg", self.content["Canon_40D.jpg"]),
+        )
+        DriveIDMapping.objects.create(image=image, drive_id="canon")
+        output = self.sync("folder", add=True, user="test@email.com")
+        self.assertIn("imported 1, replaced 0, skipped 0", output)
+        self.assertEqual(self.get_fetched_drive_ids(), ["wagtail"])
+
+    def test_failed_import_is_retried(self):
+        self.sync("folder", add=True, user="test@email.com")
+        page_token = DriveFolderSync.objects.get().page_token
+        self.drive.add_file("broken", b"not an image", "broken.png", ["folder"])
+
+        output = self.sync()
+        self.assertIn("failed to import 1 files", output)
+        self.assertEqual(DriveFolderSync.objects.get().page_token, page_token)
+
+        self.drive.add_file(
+            "broken", self.content["wagtail_2.png"], "broken.png", ["folder"]
+        )
+        output = self.sync()
+        self.assertIn(
+            "imported 1, replaced 0, skipped 0 and failed to import 0", output
+        )
+        self.assertNotEqual(DriveFolderSync.objects.get().page_token, page_token)
+
+    def test_import_error_does_not_stop_sync(self):
+        def import_or_fail(user, import_data, image_file):
+            if import_data["drive_id"] == "canon":
+                raise OSError("unreadable")
+            return import_image_file(user, import_data, image_file)
+
+        with mock.patch(
+            "wagtail_image_import.sync.import_image_file", side_effect=import_or_fail
+        ), self.assertLogs("wagtail_image_import.sync", "ERROR"):
+            output = self.sync("folder", add=True, user="test@email.com")
+        self.assertIn(
+            "imported 1, replaced 0, skipped 0 and failed to import 1", output
+        )
+        self.assertTrue(DriveIDMapping.objects.filter(drive_id="wagtail").exists())
+        # the change token isn't advanced, so the failed file is tried again
+        self.assertEqual(DriveFolderSync.objects.get().page_token, "")
+
+    def test_changes_without_page_token(self):
+        self.sync("folder", add=True, user="test@email.com")
+        page_token = DriveFolderSync.objects.get().page_token
+        self.drive.add_file("new", self.content["wagtail_2.png"], "new.png", ["folder"])
+
+        with mock.patch.object(
+            self.drive, "list_changes", return_value={"changes": []}
+        ), self.assertLogs("wagtail_image_import.sync", "WARNING"):
+            output = self.sync()
+        self.assertIn("imported 0", output)
+        self.assertEqual(DriveFolderSync.objects.get().page_token, page_token)
+
+        # the changes are listed again on the next sync
+        output = self.sync()
+        self.assertIn("imported 1", output)
+
+    def test_sync_with_refresh_token(self):
+        with override_settings(WAGTAILIMAGEIMPORT_GOOGLE_TOKEN_URL=self.drive.token_url):
+            output = self.sync(
+                "folder",
+                add=True,
+                user="test@email.com",
+                oauth_token=None,
+                refresh_token="test-refresh-token",
+            )
+        self.assertIn("imported 2", output)
+
+    def test_rejected_refresh_token(self):
+        with override_settings(
+            WAGTAILIMAGEIMPORT_GOOGLE_TOKEN_URL=self.drive.token_url
+        ), self.assertRaisesMessage(CommandError, "Could not get a Drive access token"):
+            self.sync(
+                "folder", add=True, user="test@email.com", refresh_token="revoked"
+            )
+        self.assertFalse(DriveFolderSync.objects.exists())
+
+    @unittest.skipIf(google_auth_jwt is None, "google-auth is not installed")
+    def test_sync_with_service_account(self):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        key_file = os.path.join(TEST_MEDIA_DIR, "service-account.json")
+        os.makedirs(TEST_MEDIA_DIR, exist_ok=True)
+        with open(key_file, "w") as f:
+            json.dump(
+                {
+                    "type": "service_account",
+                    "client_email": "sync@example.iam.gserviceaccount.com",
+                    "private_key": key.private_bytes(
+                        serialization.Encoding.PEM,
+                        serialization.PrivateFormat.PKCS8,
+                        serialization.NoEncryption(),
+                    ).decode(),
+                },
+                f,
+            )
+        with override_settings(WAGTAILIMAGEIMPORT_GOOGLE_TOKEN_URL=self.drive.token_url):
+            output = self.sync(
+                "folder",
+                add=True,
+                user="test@email.com",
+                oauth_token=None,
+                service_account_file=key_file,
+            )
+        self.assertIn("imported 2", output)
+        claims = google_auth_jwt.decode(self.drive.assertions[0], verify=False)
+        self.assertEqual(claims["iss"], "sync@example.iam.gserviceaccount.com")
+        self.assertEqual(claims["aud"], self.drive.token_url)
+
+    def test_no_credentials(self):
+        with self.assertRaisesMessage(CommandError, "Drive credentials are needed"):
+            self.sync("folder", add=True, user="test@email.com", oauth_token=None)
+
+    def test_expired_token_stops_sync(self):
+        self.sync("folder", add=True, user="test@email.com")
+        self.drive.add_file(
+            "new", self.content["wagtail_2.png"], "wagtail_2.png", ["folder"]
+        )
+        # the token expires between runs
+        page_token = DriveFolderSync.objects.get().page_token
+        self.drive.oauth_token = "new-token"
+        with self.assertRaisesMessage(CommandError, "Drive rejected the credentials"):
+            self.sync("folder")
+        # the folder isn't marked as synced, so the next run picks up the new file
+        self.assertEqual(DriveFolderSync.objects.get().page_token, page_token)
+
+    def test_token_expiring_during_sync_stops_sync(self):
+        self.sync("folder", add=True, user="test@email.com")
+        self.drive.add_file(
+            "new", self.content["wagtail_2.png"], "wagtail_2.png", ["folder"]
+        )
+        self.drive.add_file(
+            "new_canon",
+            self.content["Canon_40D.jpg"],
+            "canon_2.jpg",
+            ["folder"],
+            mime_type="image/jpeg",
+        )
+
+        def expire_token(*args, **kwargs):
+            self.drive.oauth_token = "new-token"
+            return fetch_drive_file(*args, **kwargs)
+
+        with mock.patch(
+            "wagtail_image_import.sync.fetch_drive_file", side_effect=expire_token
+        ), mock.patch("wagtail_image_import.sync.logger") as logger:
+            with self.assertRaisesMessage(
+                CommandError, "Drive rejected the credentials"
+            ):
+                self.sync("folder")
+        # the files aren't each reported as failed imports
+        logger.exception.assert_not_called()
+        self.assertFalse(
+            DriveIDMapping.objects.filter(drive_id__in=["new", "new_canon"]).exists()
+        )
+
+    def test_unsynced_folder(self):
+        with self.assertRaises(CommandError):
+            self.sync("folder")
@@ -1,15 +1,21 @@
+import hashlib
+import json
 import os.path
 import shutil
+from unittest import mock
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from wagtail.core.models import Collection
 from wagtail.images.models import UploadedImage
 from wagtail.tests.utils import WagtailTestUtils
 
+from wagtail_image_import.importing import get_s3_copy_parameters
+from wagtail_image_import.metadata import extract_file_metadata
 from wagtail_image_import.models import DriveIDMapping
 from wagtail_image_import.utils import get_most_likely_duplicate
 
@@ -55,6 +61,22 @@ class TestViews(TestCase, WagtailTestUtils):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "wagtail_image_import/import.html")
         self.assertEqual(response.context["drive_parent"], "root")
+        self.assertContains(response, 'data-max-concurrent-imports="3"')
+        self.assertContains(response, 'data-import-batch-size="10"')
+
+    @override_settings(WAGTAILIMAGEIMPORT_BACKGROUND_IMPORTS=True)
+    def test_import_view_get_background_imports_not_batched(self):
+        response = self.client.get(reverse("wagtail_image_import:import"))
+        self.assertContains(response, 'data-import-batch-size="1"')
+
+    @override_settings(
+        WAGTAILIMAGEIMPORT_MAX_CONCURRENT_IMPORTS=6,
+        WAGTAILIMAGEIMPORT_MAX_BUFFERED_BYTES=50000000,
+    )
+    def test_import_view_get_concurrency_settings(self):
+        response = self.client.get(reverse("wagtail_image_import:import"))
+        self.assertContains(response, 'data-max-concurrent-imports="6"')
+        self.assertContains(response, 'data-max-buffered-bytes="50000000"')
 
     def test_import_view_post_valid_new_image(self):
         # test that an imported new image gets created
@@ -89,6 +111,60 @@ class TestViews(TestCase, WagtailTestUtils):
         self.assertEqual(created_image.driveidmapping.drive_id, "2")
         self.assertEqual(created_image.collection_id, 1)
 
+    @override_settings(WAGTAILIMAGEIMPORT_NEAR_DUPLICATE_DISTANCE=6)
+    def test_import_view_post_extracts_metadata_once(self):
+        with mock.patch(
+            "wagtail_image_import.importing.extract_file_metadata",
+            wraps=extract_file_metadata,
+        ) as view_extract, mock.patch(
+            "wagtail_image_import.models.extract_file_metadata"
+        ) as model_extract, mock.patch(
+            "wagtail_image_import.models.compute_perceptual_hash"
+        ) as model_hash:
+            response = self.client.post(
+                reverse("wagtail_image_import:import"),
+                {
+                    "name": "new_image",
+                    "collection": 1,
+                    "image_file": self.canon_file,
+                    "action": "keep",
+                },
+            )
+        self.assertEqual(view_extract.call_count, 1)
+        model_extract.assert_not_called()
+        # the perceptual hash is taken from the upload, not read back from storage
+        model_hash.assert_not_called()
+
+        created_image = CustomImage.objects.get(id=response.json()["image_id"])
+        self.canon_file.seek(0)
+        contents = self.canon_file.read()
+        self.assertEqual(created_image.file_size, len(contents))
+        self.assertEqual(created_image.file_hash, hashlib.sha1(contents).hexdigest())
+        self.assertEqual(created_image.md5_hash, hashlib.md5(contents).hexdigest())
+        self.assertEqual(created_image.exif_datetime, "2008:07:31 10:38:11")
+        self.assertEqual(len(created_image.perceptual_hash), 16)
+
+    def test_import_view_post_skips_perceptual_hash(self):
+        # without near duplicate detection, the hash is left for backfill_duplicate_fields
+        with mock.patch(
+            "wagtail_image_import.importing.compute_perceptual_hash"
+        ) as view_hash, mock.patch(
+            "wagtail_image_import.models.compute_perceptual_hash"
+        ) as model_hash:
+            response = self.client.post(
+                reverse("wagtail_image_import:import"),
+                {
+                    "name": "new_image",
+                    "collection": 1,
+                    "image_file": self.canon_file,
+                    "action": "keep",
+                },
+            )
+        view_hash.assert_not_called()
+        model_hash.assert_not_called()
+        created_image = CustomImage.objects.get(id=response.json()["image_id"])
+        self.assertEqual(created_image.perceptual_hash, "")
+
     def test_import_view_post_new_image_invalid_info(self):
         # test that an imported new image with invalid collection
         # gets an uploaded image response instead
@@ -121,6 +197,49 @@ class TestViews(TestCase, WagtailTestUtils):
         )
         self.assertIn("form", response_json)
 
+    @override_settings(WAGTAILIMAGEIMPORT_LAZY_EDIT_FORMS=True)
+    def test_import_view_post_lazy_edit_form(self):
+        response = self.client.post(
+            reverse("wagtail_image_import:import"),
+            {
+                "name": "new_image",
+                "collection": 1,
+                "image_file": self.canon_file,
+                "action": "keep",
+            },
+        )
+        response_json = response.json()
+        id = response_json["image_id"]
+        self.assertNotIn("form", response_json)
+        self.assertEqual(
+            response_json["form_url"], "/admin/image-import/edit-form/{}/".format(id)
+        )
+
+        response = self.client.get(response_json["form_url"])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('name="image-{}-title"'.format(id), response.json()["form"])
+
+    @override_settings(WAGTAILIMAGEIMPORT_LAZY_EDIT_FORMS=True)
+    def test_import_view_post_lazy_uploaded_image_form(self):
+        response = self.client.post(
+            reverse("wagtail_image_import:import"),
+            {
+                "name": "new_image",
+                "collection": 1000000,
+                "image_file": self.canon_file,
+                "action": "keep",
+            },
+        )
+        response_json = response.json()
+        id = response_json["uploaded_image_id"]
+        self.assertNotIn("form", response_json)
+
+        response = self.client.get(response_json["form_url"])
+        self.assertEqual(response.status_code, 200)
+        form = response.json()["form"]
+        self.assertIn('name="uploaded-image-{}-title"'.format(id), form)
+        self.assertIn('value="new_image"', form)
+
     def test_import_view_post_valid_replacement_image(self):
         # test that an imported replacement image gets updated
         id = self.wagtail_1_image.id
@@ -154,6 +273,27 @@ class TestViews(TestCase, WagtailTestUtils):
         self.assertEqual(updated_image.driveidmapping.drive_id, "2")
         self.assertIn("Canon_40D.jpg", updated_image.file.name)
 
+    def test_import_view_post_replacement_image_missing(self):
+        # the image chosen for replacement may have been deleted since duplicates were found
+        response = self.client.post(
+            reverse("wagtail_image_import:import"),
+            {
+                "name": "replacement",
+                "collection": 1,
+                "image_file": self.canon_file,
+                "action": "replace",
+                "wagtail_id": self.wagtail_1_image.id + 1000,
+                "drive_id": "2",
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        response_json = response.json()
+        self.assertEqual(response_json["success"], False)
+        self.assertEqual(
+            response_json["error"], "The image to replace no longer exists"
+        )
+        self.assertEqual(CustomImage.objects.count(), 1)
+
     def test_create_from_uploaded_view(self):
         # test that an image can be created from an UploadedImage instance
         id = str(self.uploaded_image.id)
@@ -177,6 +317,76 @@ class TestViews(TestCase, WagtailTestUtils):
         self.assertEqual(created_image.title, "new_image")
         self.assertEqual(created_image.driveidmapping.drive_id, "2")
 
+    @override_settings(WAGTAILIMAGEIMPORT_NEAR_DUPLICATE_DISTANCE=6)
+    def test_create_from_uploaded_view_moves_file(self):
+        # an import which needs additional input records the file's metadata as it is stored
+        response = self.client.post(
+            reverse("wagtail_image_import:import"),
+            {
+                "name": "new_image",
+                "collection": 1000000,
+                "image_file": self.canon_file,
+                "action": "keep",
+            },
+        )
+        id = str(response.json()["uploaded_image_id"])
+        uploaded_image = UploadedImage.objects.get(id=id)
+        uploaded_path = uploaded_image.file.path
+
+        with mock.patch(
+            "wagtail_image_import.importing.extract_file_metadata"
+        ) as extract, mock.patch(
+            "wagtail_image_import.models.extract_file_metadata"
+        ) as model_extract, mock.patch(
+            "wagtail_image_import.models.compute_perceptual_hash"
+        ) as model_perceptual_hash:
+            response = self.client.post(
+                reverse("wagtail_image_import:create_from_uploaded_image", args=[id]),
+                {
+                    "uploaded-image-" + id + "-title": "new_image",
+                    "uploaded-image-" + id + "-collection": 1,
+                },
+            )
+        extract.assert_not_called()
+        model_extract.assert_not_called()
+        model_perceptual_hash.assert_not_called()
+
+        created_image = CustomImage.objects.get(id=response.json()["image_id"])
+        self.assertFalse(os.path.exists(uploaded_path))
+        self.assertFalse(UploadedImage.objects.filter(id=id).exists())
+        self.canon_file.seek(0)
+        contents = self.canon_file.read()
+        with created_image.open_file() as f:
+            self.assertEqual(f.read(), contents)
+        self.assertEqual(created_image.file_hash, hashlib.sha1(contents).hexdigest())
+        self.assertEqual(created_image.md5_hash, hashlib.md5(contents).hexdigest())
+        self.assertEqual(created_image.exif_datetime, "2008:07:31 10:38:11")
+        self.assertEqual(len(created_image.perceptual_hash), 16)
+        self.assertEqual((created_image.width, created_image.height), (100, 68))
+
+    def test_s3_copy_parameters(self):
+        # files copied within S3 are stored with the target storage's parameters, as uploads would be
+        storage = mock.Mock(
+            default_acl="public-read", default_content_type="application/octet-stream"
+        )
+        storage.get_object_parameters.return_value = {
+            "CacheControl": "max-age=86400",
+            "ServerSideEncryption": "AES256",
+        }
+        self.assertEqual(
+            get_s3_copy_parameters(storage, "original_images/Canon_40D.jpg"),
+            {
+                "CacheControl": "max-age=86400",
+                "ServerSideEncryption": "AES256",
+                "ContentType": "image/jpeg",
+                "ACL": "public-read",
+                "MetadataDirective": "REPLACE",
+            },
+        )
+        storage.get_object_parameters.assert_called_once_with(
+            "original_images/Canon_40D.jpg"
+        )
+
     def test_edit_view(self):
         # test that an image can be edited after creation
         id = self.wagtail_1_image.id
@@ -197,3 +407,277 @@ class TestViews(TestCase, WagtailTestUtils):
         edited_image = CustomImage.objects.get(id=id)
         self.assertEqual(edited_image.collection_id, 2)
         self.assertEqual(edited_image.title, "edited_image")
+
+    def test_find_duplicates_view(self):
+        response = self.client.post(
+            reverse("wagtail_image_import:find_duplicates"),
+            data=[
+                {"id": "1", "name": "renamed.png"},
+                {"id": "2", "name": "wagtail_1.png"},
+                {"id": "3", "name": "new_image.png"},
+            ],
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response_json = response.json()
+        self.assertEqual(set(response_json), {"1", "2"})
+        self.assertEqual(response_json["1"]["wagtail_id"], self.wagtail_1_image.id)
+        self.assertEqual(response_json["2"]["title"], "wagtail_1.png")
+        self.assertIn("thumbnail", response_json["1"])
+
+    @override_settings(WAGTAILIMAGEIMPORT_DUPLICATE_STREAM_BATCH_SIZE=1)
+    def test_find_duplicates_view_streaming(self):
+        response = self.client.post(
+            reverse("wagtail_image_import:find_duplicates"),
+            data=[
+                {"id": "1", "name": "renamed.png"},
+                {"id": "2", "name": "new_image.png"},
+                {"id": "3", "name": "wagtail_1.png"},
+            ],
+            content_type="application/json",
+            HTTP_ACCEPT="application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        lines = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+        self.assertEqual([line.get("id") for line in lines], ["1", "3", None])
+        self.assertEqual(lines[0]["duplicate"]["wagtail_id"], self.wagtail_1_image.id)
+        self.assertEqual(lines[1]["duplicate"]["title"], "wagtail_1.png")
+        self.assertEqual(lines[2], {"done": True})
+
+    def test_find_duplicates_view_thumbnails(self):
+        # a missing thumbnail is deferred to the thumbnail view rather than generated
+        image_data_list = [{"id": "1", "name": "wagtail_1.png"}]
+        response = self.client.post(
+            reverse("wagtail_image_import:find_duplicates"),
+            data=image_data_list,
+            content_type="application/json",
+        )
+        thumbnail_url = reverse(
+            "wagtail_image_import:thumbnail", args=(self.wagtail_1_image.id,)
+        )
+        self.assertEqual(response.json()["1"]["thumbnail"], thumbnail_url)
+        self.assertFalse(self.wagtail_1_image.renditions.exists())
+
+        response = self.client.get(thumbnail_url)
+        rendition = self.wagtail_1_image.renditions.get(filter_spec="max-165x165")
+        self.assertRedirects(
+            response, rendition.url, fetch_redirect_response=False
+        )
+
+        # once it exists, the rendition is fetched in bulk with the duplicates
+        response = self.client.post(
+            reverse("wagtail_image_import:find_duplicates"),
+            data=image_data_list,
+            content_type="application/json",
+        )
+        self.assertEqual(response.json()["1"]["thumbnail"], rendition.url)
+
+    def test_find_duplicates_view_unchanged(self):
+        response = self.client.post(
+            reverse("wagtail_image_import:import"),
+            {
+                "name": "canon",
+                "collection": 1,
+                "image_file": self.canon_file,
+                "action": "keep",
+                "drive_id": "2",
+                "md5_checksum": "abc",
+                "head_revision_id": "rev1",
+            },
+        )
+        mapping = DriveIDMapping.objects.get(image_id=response.json()["image_id"])
+        self.assertEqual(mapping.md5_checksum, "abc")
+        self.assertEqual(mapping.head_revision_id, "rev1")
+        self.assertEqual(mapping.modified_time, "")
+        self.assertEqual(mapping.file_hash, mapping.image.file_hash)
+
+        def find_duplicate(image_data):
+            response = self.client.post(
+                reverse("wagtail_image_import:find_duplicates"),
+                data=[image_data],
+                content_type="application/json",
+            )
+            return response.json()[image_data["id"]]
+
+        # a matching checksum or revision means the file hasn't changed since it was imported
+        self.assertTrue(find_duplicate({"id": "2", "md5Checksum": "abc"})["unchanged"])
+        self.assertTrue(
+            find_duplicate({"id": "2", "headRevisionId": "rev1"})["unchanged"]
+        )
+        changed_data = {"id": "2", "md5Checksum": "def", "headRevisionId": "rev2"}
+        self.assertFalse(find_duplicate(changed_data)["unchanged"])
+        # the image without a recorded ledger can't be known to be unchanged
+        self.assertFalse(find_duplicate({"id": "1", "name": "x"})["unchanged"])
+
+        # nor can an image whose file has been replaced since
+        mapping.image.file_hash = "changed"
+        mapping.image.save()
+        self.assertFalse(find_duplicate({"id": "2", "md5Checksum": "abc"})["unchanged"])
+
+    def test_import_bulk_view(self):
+        wagtail_2_file = SimpleUploadedFile(
+            name="wagtail_2.png",
+            content=open(TEST_DATA_DIR + "/wagtail_2.png", "rb").read(),
+            content_type="image/png",
+        )
+        invalid_file = SimpleUploadedFile(
+            name="invalid.png", content=b"not an image", content_type="image/png",
+        )
+        items = [
+            {"drive_id": "2", "name": "canon", "file": "file_0"},
+            {
+                "drive_id": "3",
+                "name": "replacement",
+                "file": "file_1",
+                "action": "replace",
+                "wagtail_id": self.wagtail_1_image.id,
+            },
+            {"drive_id": "4", "name": "invalid", "file": "file_2"},
+        ]
+        response = self.client.post(
+            reverse("wagtail_image_import:import_bulk"),
+            {
+                "items": json.dumps(items),
+                "collection": 1,
+                "file_0": self.canon_file,
+                "file_1": wagtail_2_file,
+                "file_2": invalid_file,
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+
+        results = response.json()["results"]
+        self.assertEqual([result["drive_id"] for result in results], ["2", "3", "4"])
+        self.assertEqual(
+            [result["success"] for result in results], [True, True, False]
+        )
+        self.assertNotIn("form", results[0])
+        self.assertEqual(
+            results[0]["form_url"],
+            reverse("wagtail_image_import:edit_form", args=(results[0]["image_id"],)),
+        )
+
+        created_image = CustomImage.objects.get(id=results[0]["image_id"])
+        self.assertEqual(created_image.title, "canon")
+        self.assertEqual(created_image.driveidmapping.drive_id, "2")
+        self.assertEqual(created_image.duplicate_fingerprint.drive_id, "2")
+        self.assertEqual(
+            results[0]["edit_action"],
+            "/admin/image-import/edit/{}/".format(created_image.id),
+        )
+
+        self.assertEqual(results[1]["image_id"], self.wagtail_1_image.id)
+        replaced_image = CustomImage.objects.get(id=self.wagtail_1_image.id)
+        self.assertIn("wagtail_2", replaced_image.file.name)
+        self.assertEqual(replaced_image.driveidmapping.drive_id, "3")
+        self.assertEqual(replaced_image.duplicate_fingerprint.drive_id, "3")
+        self.assertFalse(DriveIDMapping.objects.filter(drive_id="4").exists())
+
+    def get_stored_image_files(self):
+        return sorted(os.listdir(os.path.join(TEST_MEDIA_DIR, "original_images")))
+
+    def test_import_bulk_view_save_failure(self):
+        wagtail_2_file = SimpleUploadedFile(
+            name="wagtail_2.png",
+            content=open(TEST_DATA_DIR + "/wagtail_2.png", "rb").read(),
+            content_type="image/png",
+        )
+        items = [
+            {"drive_id": "2", "name": "broken", "file": "file_0"},
+            {"drive_id": "3", "name": "canon", "file": "file_1"},
+        ]
+        original_save = CustomImage.save
+
+        def save(image, *args, **kwargs):
+            if image.title == "broken":
+                raise DatabaseError("broken")
+            return original_save(image, *args, **kwargs)
+
+        with mock.patch.object(CustomImage, "save", save), self.assertLogs(
+            "wagtail_image_import.views", "ERROR"
+        ):
+            response = self.client.post(
+                reverse("wagtail_image_import:import_bulk"),
+                {
+                    "items": json.dumps(items),
+                    "collection": 1,
+                    "file_0": wagtail_2_file,
+                    "file_1": self.canon_file,
+                },
+            )
+        self.assertEqual(response.status_code, 200)
+
+        # the failed image doesn't roll back the other, or leave its file behind
+        results = response.json()["results"]
+        self.assertEqual(
+            results[0],
+            {"drive_id": "2", "success": False, "error": "Failed to import"},
+        )
+        self.assertEqual(results[1]["success"], True)
+        self.assertTrue(CustomImage.objects.filter(title="canon").exists())
+        self.assertFalse(DriveIDMapping.objects.filter(drive_id="2").exists())
+        self.assertEqual(
+            self.get_stored_image_files(), ["Canon_40D.jpg", "wagtail_1.png"]
+        )
+
+    def test_import_bulk_view_rollback_deletes_files(self):
+        items = [{"drive_id": "2", "name": "canon", "file": "file_0"}]
+        with mock.patch(
+            "wagtail_image_import.views.set_drive_id_mappings",
+            side_effect=DatabaseError,
+        ), self.assertRaises(DatabaseError):
+            self.client.post(
+                reverse("wagtail_image_import:import_bulk"),
+                {"items": json.dumps(items), "collection": 1, "file_0": self.canon_file},
+            )
+        self.assertFalse(CustomImage.objects.filter(title="canon").exists())
+        self.assertEqual(self.get_stored_image_files(), ["wagtail_1.png"])
+
+    def test_import_bulk_view_replacement_image_missing(self):
+        items = [
+            {
+                "drive_id": "2",
+                "name": "replacement",
+                "file": "file_0",
+                "action": "replace",
+                "wagtail_id": self.wagtail_1_image.id + 1000,
+            },
+        ]
+        response = self.client.post(
+            reverse("wagtail_image_import:import_bulk"),
+            {"items": json.dumps(items), "collection": 1, "file_0": self.canon_file},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {
+                    "drive_id": "2",
+                    "success": False,
+                    "error": "The image to replace no longer exists",
+                }
+            ],
+        )
+        self.assertEqual(CustomImage.objects.count(), 1)
+
+    def test_import_bulk_view_invalid_input(self):
+        url = reverse("wagtail_image_import:import_bulk")
+        for data in [
+            {},
+            {"items": "not json"},
+            {"items": json.dumps({"drive_id": "2"})},
+            {"items": json.dumps([{"drive_id": "2", "file": "file_0"}])},
+            # without a file, an OAuth token is needed to fetch the image from Drive
+            {"items": json.dumps([{"drive_id": "2"}])},
+        ]:
+            response = self.client.post(url, data)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["success"], False)
+        self.assertEqual(CustomImage.objects.count(), 1)
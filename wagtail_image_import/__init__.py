@@ -0,0 +1 @@
+default_app_config = "wagtail_image_import.apps.WagtailImageImportAppConfig"
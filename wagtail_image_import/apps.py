@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class WagtailImageImportAppConfig(AppConfig):
+    name = "wagtail_image_import"
+    label = "wagtail_image_import"
+    verbose_name = "Wagtail Image Import"
+
+    def ready(self):
+        from .signal_handlers import register_signal_handlers
+        from .utils import get_duplicate_scoring_plan
+
+        register_signal_handlers()
+        # validate the duplicate finding settings now, rather than on the first import
+        get_duplicate_scoring_plan()
@@ -0,0 +1,112 @@
+import PIL.Image
+from django.db import transaction
+from django.db.models import Q
+
+from wagtail.images import get_image_model
+
+from .duplicate_backends import get_duplicate_backend
+from .duplicate_cache import invalidate_images
+from .fingerprints import rebuild_fingerprints
+from .metadata import compute_perceptual_hash, extract_file_metadata
+from .models import BackfillProgress
+
+
+BACKFILL_FIELDS = ["md5_hash", "exif_datetime", "perceptual_hash"]
+
+# the errors raised for files which can't be read as images, which are recorded as failed rather than stopping
+# the backfill (PIL.UnidentifiedImageError is an OSError)
+UNREADABLE_FILE_ERRORS = (OSError, PIL.Image.DecompressionBombError)
+
+
+def get_backfill_queryset(refresh_all=False):
+    """
+    Returns the images whose DuplicateFindingMixin fields need filling in, or every image if refresh_all is set.
+    exif_datetime isn't checked, as it is legitimately empty for images without EXIF data
+    """
+    queryset = get_image_model().objects.all()
+    if not refresh_all:
+        queryset = queryset.filter(Q(md5_hash="") | Q(perceptual_hash=""))
+    return queryset.order_by("pk")
+
+
+def compute_duplicate_fields(image_files):
+    """
+    Reads each image file from storage, given a list of (image pk, file name), returning a list of
+    (image pk, dict of DuplicateFindingMixin field values), with None as the values of files which couldn't be read.
+    This is run in worker processes, so it only takes and returns picklable values
+    """
+    storage = get_image_model()._meta.get_field("file").storage
+    results = []
+    for pk, name in image_files:
+        try:
+            with storage.open(name, "rb") as f:
+                # the hashes are calculated from chunks as they are read, so the file is never held in memory
+                metadata = extract_file_metadata(f)
+                f.seek(0)
+                perceptual_hash = compute_perceptual_hash(f)
+        except UNREADABLE_FILE_ERRORS:
+            results.append((pk, None))
+            continue
+        results.append(
+            (
+                pk,
+                {
+                    "md5_hash": metadata.md5_hash,
+                    "exif_datetime": metadata.exif_datetime,
+                    "perceptual_hash": perceptual_hash,
+                },
+            )
+        )
+    return results
+
+
+def save_duplicate_fields(results):
+    """
+    Writes the values computed by compute_duplicate_fields in bulk, without saving each image, and refreshes their
+    duplicate fingerprints to match. Returns the number of images updated
+    """
+    values = {pk: field_values for pk, field_values in results if field_values}
+    if not values:
+        return 0
+    Image = get_image_model()
+    images = list(Image.objects.filter(pk__in=list(values)).only("pk", "title"))
+    for image in images:
+        for field, value in values[image.pk].items():
+            setattr(image, field, value)
+    with transaction.atomic():
+        invalidate_images(images)
+        Image.objects.bulk_update(images, BACKFILL_FIELDS)
+        # bulk updates don't send signals, so update the fingerprints directly
+        rebuild_fingerprints(Image.objects.filter(pk__in=list(values)))
+    get_duplicate_backend().refresh_images(list(values))
+    return len(images)
+
+
+def get_backfill_progress(name, restart=False):
+    progress, created = BackfillProgress.objects.get_or_create(name=name)
+    if restart:
+        reset_backfill_progress(progress)
+    return progress
+
+
+def reset_backfill_progress(progress):
+    """
+    Clears the checkpoint of a backfill, so that its next run starts from the first image rather than resuming
+    """
+    if progress.last_image_id:
+        progress.last_image_id = 0
+        progress.save()
+
+
+def get_backfill_batches(queryset, last_image_id, batch_size):
+    """
+    Yields lists of (image pk, file name) for the images in queryset after last_image_id, in pk order
+    """
+    while True:
+        batch = list(
+            queryset.filter(pk__gt=last_image_id).values_list("pk", "file")[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        last_image_id = batch[-1][0]
@@ -0,0 +1,134 @@
+import os
+import re
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from .models import ChunkedUpload
+
+
+DEFAULT_CHUNK_SIZE = 2 * 1024 * 1024
+
+# files larger than this are uploaded by the browser in chunks
+DEFAULT_THRESHOLD = 20 * 1024 * 1024
+
+# uploads which haven't been finalized after this long are assumed to have been abandoned
+UPLOAD_EXPIRY = timedelta(days=1)
+
+READ_SIZE = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class ChunkError(Exception):
+    pass
+
+
+def get_chunk_size():
+    return getattr(
+        settings, "WAGTAILIMAGEIMPORT_CHUNKED_UPLOAD_CHUNK_SIZE", DEFAULT_CHUNK_SIZE
+    )
+
+
+def get_chunked_upload_threshold():
+    return getattr(
+        settings, "WAGTAILIMAGEIMPORT_CHUNKED_UPLOAD_THRESHOLD", DEFAULT_THRESHOLD
+    )
+
+
+def get_max_upload_size():
+    """
+    Returns Wagtail's limit on the size of image files, or None if there is none
+    """
+    return getattr(settings, "WAGTAILIMAGES_MAX_UPLOAD_SIZE", 10 * 1024 * 1024)
+
+
+def validate_upload_size(size):
+    """
+    Raises ChunkError if a file of this many bytes can't be imported, so that it is rejected before its chunks
+    are sent rather than once they have all been written
+    """
+    if size <= 0:
+        raise ChunkError("The file is empty")
+    max_upload_size = get_max_upload_size()
+    if max_upload_size is not None and size > max_upload_size:
+        raise ChunkError(
+            "The file is too large. Maximum filesize: {}".format(
+                filesizeformat(max_upload_size)
+            )
+        )
+
+
+def get_upload_path(upload):
+    """
+    Returns the path of the temporary file an upload's chunks are written to. This must be on storage shared by
+    every server handling the upload's requests
+    """
+    directory = getattr(
+        settings,
+        "WAGTAILIMAGEIMPORT_CHUNKED_UPLOAD_DIR",
+        os.path.join(tempfile.gettempdir(), "wagtail_image_import_uploads"),
+    )
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, upload.upload_id.hex)
+
+
+def parse_content_range(header):
+    """
+    Returns the (start, end) byte offsets, inclusive, and the total size given by a Content-Range header
+    """
+    match = CONTENT_RANGE_RE.match(header or "")
+    if not match:
+        raise ChunkError("Invalid Content-Range header")
+    start, end, total = (int(group) for group in match.groups())
+    if end < start or end >= total:
+        raise ChunkError("Invalid Content-Range header")
+    validate_upload_size(total)
+    return start, end, total
+
+
+def write_chunk(upload, start, end, stream):
+    """
+    Appends the bytes from start to end (inclusive) of an upload, read from stream, to its temporary file. Chunks
+    must arrive in order: a chunk starting anywhere other than at the end of the bytes already received is rejected.
+    The upload should be locked with select_for_update, so that retried requests for the same chunk can't both
+    write it
+    """
+    if start != upload.received:
+        raise ChunkError("Expected a chunk starting at byte {}".format(upload.received))
+    if end >= upload.size or end - start + 1 > get_chunk_size():
+        raise ChunkError("Chunk out of range")
+
+    remaining = end - start + 1
+    with open(get_upload_path(upload), "ab") as f:
+        # discard anything left over from a chunk which was cut off before it was acknowledged
+        f.truncate(start)
+        while remaining:
+            data = stream.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            f.write(data)
+            remaining -= len(data)
+    if remaining:
+        raise ChunkError("Incomplete chunk")
+
+    upload.received = end + 1
+    upload.save(update_fields=["received"])
+
+
+def delete_upload(upload):
+    try:
+        os.remove(get_upload_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def delete_expired_uploads():
+    for upload in ChunkedUpload.objects.filter(
+        created_at__lt=timezone.now() - UPLOAD_EXPIRY
+    ):
+        delete_upload(upload)
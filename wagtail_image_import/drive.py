@@ -0,0 +1,240 @@
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import TemporaryUploadedFile
+
+try:
+    from google.auth import crypt, jwt
+except ImportError:  # pragma: no cover
+    crypt = jwt = None
+
+
+DEFAULT_DRIVE_API_URL = "https://www.googleapis.com/drive/v3/"
+
+DEFAULT_TOKEN_URL = "https://oauth2.googleapis.com/token"
+
+DRIVE_SCOPE = "https://www.googleapis.com/auth/drive.readonly"
+
+# the lifetime requested for access tokens minted for service accounts, which Google caps at an hour
+SERVICE_ACCOUNT_TOKEN_LIFETIME = 60 * 60
+
+CHUNK_SIZE = 256 * 1024
+
+# the minimum number of bytes between progress updates, to avoid writing to the cache for every chunk
+PROGRESS_INTERVAL = 1024 * 1024
+
+FETCH_TIMEOUT = 30
+
+# Drive thumbnail links are served from these hosts (and their subdomains); thumbnails are only fetched from
+# these or the host of the configured Drive API, as the links are supplied by the browser
+DRIVE_THUMBNAIL_HOSTS = ["googleusercontent.com", "google.com", "googleapis.com"]
+
+MAX_THUMBNAIL_SIZE = 5 * 1024 * 1024
+
+
+class DriveFetchError(Exception):
+    pass
+
+
+class DriveAuthError(DriveFetchError):
+    """
+    Raised when Google rejects the credentials used to access Drive, for example because an access token has
+    expired
+    """
+
+
+def get_drive_api_url(path):
+    api_url = getattr(settings, "WAGTAILIMAGEIMPORT_DRIVE_API_URL", DEFAULT_DRIVE_API_URL)
+    return urllib.parse.urljoin(api_url, path)
+
+
+def open_drive_url(url, oauth_token):
+    request = urllib.request.Request(
+        url, headers={"Authorization": "Bearer " + oauth_token}
+    )
+    try:
+        return urllib.request.urlopen(request, timeout=FETCH_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 401:
+            raise DriveAuthError(
+                "The Drive access token is invalid or has expired: {}".format(e)
+            )
+        raise DriveFetchError(str(e))
+    except (urllib.error.URLError, OSError) as e:
+        raise DriveFetchError(str(e))
+
+
+def get_drive_json(path, oauth_token, **params):
+    """
+    Returns the decoded response of a Drive API request for metadata, such as a list of files or changes
+    """
+    url = get_drive_api_url(path)
+    if params:
+        url += "?" + urllib.parse.urlencode(params)
+    response = open_drive_url(url, oauth_token)
+    with response:
+        try:
+            return json.load(response)
+        except (OSError, ValueError) as e:
+            raise DriveFetchError(str(e))
+
+
+def get_token_url():
+    return getattr(settings, "WAGTAILIMAGEIMPORT_GOOGLE_TOKEN_URL", DEFAULT_TOKEN_URL)
+
+
+def request_access_token(**params):
+    """
+    Exchanges a grant (such as a refresh token) for a Drive access token at Google's OAuth token endpoint
+    """
+    request = urllib.request.Request(
+        get_token_url(), data=urllib.parse.urlencode(params).encode()
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+            return json.load(response)["access_token"]
+    except urllib.error.HTTPError as e:
+        if e.code in (400, 401):
+            raise DriveAuthError("Google rejected the credentials: {}".format(e))
+        raise DriveFetchError(str(e))
+    except (urllib.error.URLError, OSError, ValueError, KeyError) as e:
+        raise DriveFetchError(str(e))
+
+
+def refresh_access_token(refresh_token):
+    """
+    Returns a new Drive access token from an OAuth refresh token, issued to the client given by the
+    WAGTAILIMAGEIMPORT_GOOGLE_OAUTH_CLIENT_SECRET setting, so that unattended syncs aren't limited by the lifetime
+    of an access token
+    """
+    client_secret = json.loads(settings.WAGTAILIMAGEIMPORT_GOOGLE_OAUTH_CLIENT_SECRET)[
+        "web"
+    ]
+    return request_access_token(
+        grant_type="refresh_token",
+        refresh_token=refresh_token,
+        client_id=client_secret["client_id"],
+        client_secret=client_secret["client_secret"],
+    )
+
+
+def get_service_account_access_token(key_file):
+    """
+    Returns a new Drive access token for the service account whose JSON key is in key_file. The folders to sync
+    must be shared with the service account's email address. Needs the google-auth package to sign the request
+    """
+    if jwt is None:
+        raise DriveAuthError(
+            "The google-auth package is needed to use a service account: "
+            "pip install wagtail-image-import[service-account]"
+        )
+    try:
+        signer = crypt.RSASigner.from_service_account_file(key_file)
+        with open(key_file) as f:
+            client_email = json.load(f)["client_email"]
+    except (OSError, ValueError, KeyError) as e:
+        raise DriveAuthError("Could not read the service account key: {}".format(e))
+    now = int(time.time())
+    assertion = jwt.encode(
+        signer,
+        {
+            "iss": client_email,
+            "scope": DRIVE_SCOPE,
+            "aud": get_token_url(),
+            "iat": now,
+            "exp": now + SERVICE_ACCOUNT_TOKEN_LIFETIME,
+        },
+    )
+    return request_access_token(
+        grant_type="urn:ietf:params:oauth:grant-type:jwt-bearer",
+        assertion=assertion.decode(),
+    )
+
+
+def fetch_drive_file(drive_id, oauth_token, name, progress_callback=None):
+    """
+    Streams the contents of a Drive file in chunks into a temporary file, which is returned as an uploaded file
+    so that it can be passed to the image form in place of a file uploaded from the browser
+    """
+    response = open_drive_url(
+        get_drive_api_url(
+            "files/{}?alt=media".format(urllib.parse.quote(drive_id, safe=""))
+        ),
+        oauth_token,
+    )
+    with response:
+        total = int(response.headers.get("Content-Length") or 0) or None
+        image_file = TemporaryUploadedFile(
+            name, response.headers.get_content_type(), total, None
+        )
+        loaded = 0
+        reported = 0
+        try:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                image_file.write(chunk)
+                loaded += len(chunk)
+                if progress_callback and loaded - reported >= PROGRESS_INTERVAL:
+                    progress_callback(loaded, total)
+                    reported = loaded
+        except OSError as e:
+            image_file.close()
+            raise DriveFetchError(str(e))
+    if progress_callback:
+        progress_callback(loaded, total)
+    image_file.size = loaded
+    image_file.seek(0)
+    return image_file
+
+
+def is_drive_thumbnail_url(url):
+    parsed_url = urllib.parse.urlparse(url)
+    host = parsed_url.hostname or ""
+    if host == urllib.parse.urlparse(get_drive_api_url("")).hostname:
+        return True
+    return parsed_url.scheme == "https" and any(
+        host == allowed_host or host.endswith("." + allowed_host)
+        for allowed_host in DRIVE_THUMBNAIL_HOSTS
+    )
+
+
+def fetch_drive_thumbnail(url, oauth_token):
+    """
+    Returns the contents of a Drive thumbnail, given its thumbnailLink
+    """
+    if not is_drive_thumbnail_url(url):
+        raise DriveFetchError("Not a Drive thumbnail link: {}".format(url))
+    response = open_drive_url(url, oauth_token)
+    with response:
+        try:
+            content = response.read(MAX_THUMBNAIL_SIZE + 1)
+        except OSError as e:
+            raise DriveFetchError(str(e))
+    if len(content) > MAX_THUMBNAIL_SIZE:
+        raise DriveFetchError("Thumbnail too large: {}".format(url))
+    return content
+
+
+def get_fetch_progress_cache_key(user, drive_id):
+    return "wagtail_image_import:drive_fetch_progress:{}:{}".format(user.pk, drive_id)
+
+
+def set_fetch_progress(user, drive_id, loaded, total):
+    """
+    Records how much of a Drive file has been fetched for the drive_fetch_progress view. The progress is kept in
+    Django's default cache, which must be shared by every process serving the site - such as Redis or Memcached,
+    rather than the per-process local memory cache - or the progress view may not see the fetch
+    """
+    cache.set(
+        get_fetch_progress_cache_key(user, drive_id),
+        {"loaded": loaded, "total": total},
+        timeout=60 * 60,
+    )
+
+
+def get_fetch_progress(user, drive_id):
+    return cache.get(get_fetch_progress_cache_key(user, drive_id))
@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .fingerprints import FINGERPRINT_FIELDS
+from .models import DuplicateFingerprint
+
+
+DEFAULT_DUPLICATE_BACKEND = (
+    "wagtail_image_import.duplicate_backends.DatabaseDuplicateBackend"
+)
+
+DEFAULT_INDEX_MAX_AGE = 300
+
+# the maximum number of values passed to a single "__in" lookup, to stay below database parameter limits
+QUERY_CHUNK_SIZE = 500
+
+
+class BaseDuplicateBackend:
+    """
+    Finds the images matching the lookup values of a mapped field, for DuplicateScoringPlan to score. Backends are
+    told of changes to images' fingerprints through refresh_images and remove_images, so that those keeping their
+    own index of fingerprints can keep it current
+    """
+
+    def get_matches(self, db_field, lookup, queryset, values):
+        """
+        Returns a dict of {value: {matching image pk: similarity}} for the given lookup values of db_field, where
+        lookup is the field's DuplicateFingerprint column or image model lookup, and queryset is a template
+        queryset of (pk, value) for its matches
+        """
+        raise NotImplementedError
+
+    def refresh_images(self, pks):
+        """
+        Called after the fingerprints of the images with the given pks have been created or changed
+        """
+
+    def remove_images(self, pks):
+        """
+        Called after the images with the given pks have been deleted
+        """
+
+
+class DatabaseDuplicateBackend(BaseDuplicateBackend):
+    """
+    Looks up matches with one query per field (per chunk of values), using the indexes of the DuplicateFingerprint
+    table, or of the image model for fields without a fingerprint column
+    """
+
+    def get_matches(self, db_field, lookup, queryset, values):
+        # exact matches have a similarity of 1
+        matches = defaultdict(dict)
+        for values_chunk in chunked(sorted(values), QUERY_CHUNK_SIZE):
+            for pk, value in queryset.filter(**{lookup + "__in": values_chunk}):
+                matches[str(value)][pk] = 1
+        return matches
+
+
+class InMemoryDuplicateBackend(DatabaseDuplicateBackend):
+    """
+    Keeps an index of every fingerprint column value to the pks of the images with it in each process, so that
+    fields with a fingerprint column are matched without querying the database. The index is loaded on first use,
+    kept current as images are saved and deleted in this process (once their transaction commits), and reloaded once
+    it is older than WAGTAILIMAGEIMPORT_DUPLICATE_INDEX_MAX_AGE seconds, to pick up changes made by other processes.
+    Fields without a fingerprint column are still looked up in the database
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # maps each fingerprint column to a dict of {value: tuple of image pks}
+        self.index = None
+        # maps each image pk to its indexed {column: value}, to find its entries when it changes
+        self.image_values = None
+        self.loaded_at = None
+
+    def get_max_age(self):
+        return getattr(
+            settings,
+            "WAGTAILIMAGEIMPORT_DUPLICATE_INDEX_MAX_AGE",
+            DEFAULT_INDEX_MAX_AGE,
+        )
+
+    def load(self):
+        index = {column: defaultdict(tuple) for column in FINGERPRINT_FIELDS.values()}
+        image_values = {}
+        columns = list(FINGERPRINT_FIELDS.values())
+        for row in DuplicateFingerprint.objects.values_list(
+            "image_id", *columns
+        ).iterator():
+            pk, values = row[0], dict(zip(columns, row[1:]))
+            image_values[pk] = values
+            for column, value in values.items():
+                if value:
+                    index[column][value] += (pk,)
+        self.index, self.image_values = index, image_values
+        self.loaded_at = time.monotonic()
+
+    def get_index(self):
+        with self.lock:
+            if self.index is None or (
+                time.monotonic() - self.loaded_at > self.get_max_age()
+            ):
+                self.load()
+            return self.index
+
+    def get_matches(self, db_field, lookup, queryset, values):
+        if db_field not in FINGERPRINT_FIELDS:
+            return super().get_matches(db_field, lookup, queryset, values)
+        column_index = self.get_index()[lookup]
+        return {
+            value: dict.fromkeys(column_index[value], 1)
+            for value in values
+            if value in column_index
+        }
+
+    def unindex(self, pk):
+        for column, value in self.image_values.pop(pk, {}).items():
+            if not value:
+                continue
+            pks = tuple(
+                other_pk for other_pk in self.index[column][value] if other_pk != pk
+            )
+            if pks:
+                self.index[column][value] = pks
+            else:
+                del self.index[column][value]
+
+    def refresh_images(self, pks):
+        # the index is only updated once the change is committed, so that images saved in a transaction which is
+        # rolled back aren't left in it
+        pks = list(pks)
+        transaction.on_commit(lambda: self.apply_refresh(pks))
+
+    def remove_images(self, pks):
+        pks = list(pks)
+        transaction.on_commit(lambda: self.apply_removal(pks))
+
+    def apply_refresh(self, pks):
+        if self.index is None:
+            # nothing to update until the index is loaded
+            return
+        columns = list(FINGERPRINT_FIELDS.values())
+        rows = list(
+            DuplicateFingerprint.objects.filter(image_id__in=list(pks)).values_list(
+                "image_id", *columns
+            )
+        )
+        with self.lock:
+            for pk in pks:
+                self.unindex(pk)
+            for row in rows:
+                pk, values = row[0], dict(zip(columns, row[1:]))
+                self.image_values[pk] = values
+                for column, value in values.items():
+                    if value:
+                        self.index[column][value] += (pk,)
+
+    def apply_removal(self, pks):
+        if self.index is None:
+            return
+        with self.lock:
+            for pk in pks:
+                self.unindex(pk)
+
+
+_duplicate_backend = None
+
+
+def get_duplicate_backend():
+    """
+    Returns the duplicate matching backend given by the dotted path in WAGTAILIMAGEIMPORT_DUPLICATE_BACKEND, which
+    defaults to DatabaseDuplicateBackend. One instance is kept per process, so that a backend's index lasts
+    between requests
+    """
+    global _duplicate_backend
+    if _duplicate_backend is None:
+        backend_path = getattr(
+            settings, "WAGTAILIMAGEIMPORT_DUPLICATE_BACKEND", DEFAULT_DUPLICATE_BACKEND
+        )
+        try:
+            backend_class = import_string(backend_path)
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                "WAGTAILIMAGEIMPORT_DUPLICATE_BACKEND '{}' could not be imported: {}".format(
+                    backend_path, e
+                )
+            )
+        _duplicate_backend = backend_class()
+    return _duplicate_backend
+
+
+def reset_duplicate_backend(setting, **kwargs):
+    global _duplicate_backend
+    if setting in (
+        "WAGTAILIMAGEIMPORT_DUPLICATE_BACKEND",
+        "WAGTAILIMAGEIMPORT_DUPLICATE_INDEX_MAX_AGE",
+    ):
+        _duplicate_backend = None
+
+
+def chunked(items, size):
+    for index in range(0, len(items), size):
+        yield items[index : index + size]
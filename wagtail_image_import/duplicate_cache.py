@@ -0,0 +1,301 @@
+import hashlib
+import json
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .fingerprints import (
+    FINGERPRINT_FIELDS,
+    get_fingerprint_values,
+    normalize_fingerprint_value,
+)
+from .models import DuplicateFingerprint
+
+
+KEY_PREFIX = "wagtail_image_import:duplicates:"
+
+# the tag of entries which may be affected by any change to any image - used when the fields being compared
+# can't be traced back to precise tags, as with fuzzy title or near duplicate matching
+GLOBAL_TAG = "all"
+
+DEFAULT_LOCAL_CACHE_SIZE = 1000
+
+DEFAULT_TIMEOUT = 60 * 60 * 24
+
+# cached payloads for Drive items without a duplicate are stored as this, to tell them apart from cache misses
+NO_DUPLICATE = {}
+
+MISSING = object()
+
+
+class LocalLRUCache:
+    """
+    A size-bounded, in-process cache evicting the least recently used keys, with the subset of the Django cache
+    API used for duplicate payloads
+    """
+
+    def __init__(self, max_size=DEFAULT_LOCAL_CACHE_SIZE):
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        values = {}
+        with self.lock:
+            for key in keys:
+                if key in self.data:
+                    self.data.move_to_end(key)
+                    values[key] = self.data[key]
+        return values
+
+    def set_many(self, data, timeout=None):
+        with self.lock:
+            for key, value in data.items():
+                self.data[key] = value
+                self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+local_cache = LocalLRUCache()
+
+
+def get_cache_backend():
+    """
+    Returns the cache set by WAGTAILIMAGEIMPORT_DUPLICATE_CACHE: "local" for a cache in each process, or the alias
+    of a Django cache to share cached payloads between processes. If unset, payloads aren't cached. The "local"
+    cache is only invalidated by changes made in its own process, so is only suitable for sites served by a
+    single process
+    """
+    cache_setting = getattr(settings, "WAGTAILIMAGEIMPORT_DUPLICATE_CACHE", None)
+    if not cache_setting:
+        return None
+    if cache_setting == "local":
+        local_cache.max_size = getattr(
+            settings,
+            "WAGTAILIMAGEIMPORT_DUPLICATE_CACHE_SIZE",
+            DEFAULT_LOCAL_CACHE_SIZE,
+        )
+        return local_cache
+    return caches[cache_setting]
+
+
+def get_tag_key(tag):
+    return KEY_PREFIX + "tag:" + hashlib.sha1(tag.encode()).hexdigest()
+
+
+def get_field_tag(db_field, value):
+    return "field:{}:{}".format(db_field, value)
+
+
+def get_image_tag(image_pk):
+    return "image:{}".format(image_pk)
+
+
+def invalidate_tags(tags):
+    """
+    Invalidates all cached payloads which depend on any of tags, by giving the tags new versions. Payloads
+    which can't be traced back to precise tags depend on GLOBAL_TAG, which is invalidated by every change
+    """
+    backend = get_cache_backend()
+    if backend is None:
+        return
+    backend.set_many(
+        {get_tag_key(tag): uuid.uuid4().hex for tag in set(tags) | {GLOBAL_TAG}},
+        timeout=None,
+    )
+
+
+def get_fingerprint_tags(values):
+    """
+    Returns the field tags for a dict of DuplicateFingerprint column values
+    """
+    return [
+        get_field_tag(db_field, values[column])
+        for db_field, column in FINGERPRINT_FIELDS.items()
+        if values.get(column)
+    ]
+
+
+def invalidate_image(image):
+    """
+    Invalidates the payloads of Drive items which matched image, or may match it now. This must be called
+    before the image's fingerprint is updated, so that payloads matching its previous values are found too
+    """
+    invalidate_images([image])
+
+
+def invalidate_images(images):
+    """
+    Invalidates the payloads affected by changes to many images at once, as for invalidate_image
+    """
+    if get_cache_backend() is None:
+        return
+    tags = []
+    for image in images:
+        tags += [get_image_tag(image.pk)] + get_fingerprint_tags(
+            get_fingerprint_values(image)
+        )
+    for previous_values in DuplicateFingerprint.objects.filter(
+        image_id__in=[image.pk for image in images]
+    ).values():
+        tags += get_fingerprint_tags(previous_values)
+    invalidate_tags(tags)
+
+
+def invalidate_drive_ids(drive_ids):
+    """
+    Invalidates the payloads affected by setting the Drive IDs of many images, given a dict of
+    {image pk: drive id}. As with invalidate_image, this must be called before the fingerprints are updated
+    """
+    if get_cache_backend() is None:
+        return
+    previous_drive_ids = DuplicateFingerprint.objects.filter(
+        image_id__in=list(drive_ids)
+    ).values_list("drive_id", flat=True)
+    invalidate_tags(
+        [get_image_tag(pk) for pk in drive_ids]
+        + [
+            get_field_tag(
+                "driveidmapping__drive_id",
+                normalize_fingerprint_value("drive_id", drive_id),
+            )
+            for drive_id in set(drive_ids.values()) | set(previous_drive_ids)
+            if drive_id
+        ]
+    )
+
+
+class DuplicatePayloadCache:
+    """
+    Caches the duplicate review payload for each Drive item, keyed by a hash of its mapped field values and the
+    duplicate finding settings. Each entry records the versions of the tags it depends on - the tag of each field
+    value it was looked up by, and of its matched image - and is only used while none of those tags have
+    been invalidated since
+    """
+
+    def __init__(
+        self,
+        backend,
+        field_mapping,
+        field_weighting,
+        lookup_values,
+        options,
+        revision_values=None,
+    ):
+        self.backend = backend
+        self.field_mapping = field_mapping
+        # a function returning the {db field: lookup value} of a Drive item
+        self.lookup_values = lookup_values
+        # an optional function returning other values of a Drive item which its payload depends on, such as
+        # the state of the Drive file, compared against the ledger of the image it was imported as
+        self.revision_values = revision_values
+        self.signature = json.dumps(
+            [field_mapping, field_weighting, options], sort_keys=True, default=str
+        )
+        # matches on other fields can't be traced back to the changes which would affect them
+        self.precise = (
+            all(db_field in FINGERPRINT_FIELDS for db_field in field_mapping.values())
+            and not options.get("near_duplicates")
+        )
+
+    def get_key(self, image_data):
+        key_values = [self.signature, sorted(self.lookup_values(image_data).items())]
+        if self.revision_values is not None:
+            key_values.append(sorted(self.revision_values(image_data).items()))
+        key_data = json.dumps(key_values, default=str)
+        return KEY_PREFIX + "payload:" + hashlib.sha1(key_data.encode()).hexdigest()
+
+    def get_field_tags(self, image_data):
+        if not self.precise:
+            return [GLOBAL_TAG]
+        return [
+            get_field_tag(db_field, value)
+            for db_field, value in self.lookup_values(image_data).items()
+        ]
+
+    def get_versions(self, tag_keys):
+        """
+        Returns the current versions of tag_keys, giving a version to any tag without one - either because it
+        has never been invalidated, or because it has been evicted
+        """
+        versions = self.backend.get_many(list(tag_keys))
+        new_versions = {
+            tag_key: uuid.uuid4().hex for tag_key in tag_keys if tag_key not in versions
+        }
+        if new_versions:
+            self.backend.set_many(new_versions, timeout=None)
+            versions.update(new_versions)
+        return versions
+
+    def get_many(self, image_data_list):
+        """
+        Returns a list of the cached payload of each item in image_data_list (NO_DUPLICATE for items cached as
+        having no duplicate, or MISSING), and the versions of the tags the payloads depend on. Payloads computed
+        for missing items must be stored with these versions, taken before they were computed, so that changes
+        made while they are computed aren't missed
+        """
+        keys = [self.get_key(image_data) for image_data in image_data_list]
+        entries = self.backend.get_many(keys)
+        tag_keys = {
+            tag_key for entry in entries.values() for tag_key in entry["tags"]
+        } | {
+            get_tag_key(tag)
+            for image_data in image_data_list
+            for tag in self.get_field_tags(image_data)
+        }
+        versions = self.get_versions(tag_keys)
+        payloads = []
+        for key in keys:
+            entry = entries.get(key)
+            if entry is not None and all(
+                versions.get(tag_key) == version
+                for tag_key, version in entry["tags"].items()
+            ):
+                payloads.append(entry["payload"])
+            else:
+                payloads.append(MISSING)
+        return payloads, versions
+
+    def set_many(self, image_data_list, payloads, versions):
+        item_tag_keys = []
+        for image_data, payload in zip(image_data_list, payloads):
+            tags = self.get_field_tags(image_data)
+            if payload and self.precise:
+                tags.append(get_image_tag(payload["wagtail_id"]))
+            item_tag_keys.append([get_tag_key(tag) for tag in tags])
+        # the versions of the tags of matched images can only be taken now they are known
+        versions = {
+            **self.get_versions(
+                {
+                    tag_key
+                    for tag_keys in item_tag_keys
+                    for tag_key in tag_keys
+                    if tag_key not in versions
+                }
+            ),
+            **versions,
+        }
+
+        timeout = getattr(
+            settings, "WAGTAILIMAGEIMPORT_DUPLICATE_CACHE_TIMEOUT", DEFAULT_TIMEOUT
+        )
+        self.backend.set_many(
+            {
+                self.get_key(image_data): {
+                    "payload": payload or NO_DUPLICATE,
+                    "tags": {tag_key: versions[tag_key] for tag_key in tag_keys},
+                }
+                for image_data, payload, tag_keys in zip(
+                    image_data_list, payloads, item_tag_keys
+                )
+            },
+            timeout=timeout,
+        )
@@ -0,0 +1,108 @@
+import re
+import unicodedata
+
+from django.utils import timezone
+
+from wagtail.images import get_image_model
+
+from .models import DriveIDMapping, DuplicateFingerprint
+
+
+# maps the image model lookups usable in WAGTAILIMAGEIMPORT_FIELD_MAPPING to their DuplicateFingerprint columns
+FINGERPRINT_FIELDS = {
+    "driveidmapping__drive_id": "drive_id",
+    "md5_hash": "md5_hash",
+    "exif_datetime": "exif_datetime",
+    "title": "title",
+}
+
+
+def normalize_title(title):
+    """
+    Normalizes a title for comparison, so that differences in case, unicode representation and whitespace are ignored
+    """
+    title = unicodedata.normalize("NFKC", str(title)).casefold()
+    return re.sub(r"\s+", " ", title).strip()
+
+
+def normalize_fingerprint_value(column, value):
+    if column == "title":
+        value = normalize_title(value)
+    else:
+        value = str(value)
+    return value[: DuplicateFingerprint._meta.get_field(column).max_length]
+
+
+def get_fingerprint_values(image):
+    """
+    Returns the fingerprint column values taken from the image itself (the Drive ID comes from its DriveIDMapping)
+    """
+    return {
+        column: normalize_fingerprint_value(column, getattr(image, column, "") or "")
+        for column in ["title", "md5_hash", "exif_datetime", "perceptual_hash"]
+    }
+
+
+def update_fingerprint(image):
+    values = get_fingerprint_values(image)
+    if not DuplicateFingerprint.objects.filter(image_id=image.pk).update(
+        updated_at=timezone.now(), **values
+    ):
+        drive_id = (
+            DriveIDMapping.objects.filter(image_id=image.pk)
+            .values_list("drive_id", flat=True)
+            .first()
+        )
+        DuplicateFingerprint.objects.create(
+            image_id=image.pk, drive_id=drive_id or "", **values
+        )
+
+
+def update_fingerprint_drive_id(image_id, drive_id):
+    if not DuplicateFingerprint.objects.filter(image_id=image_id).update(
+        drive_id=drive_id
+    ):
+        update_fingerprint(get_image_model().objects.get(pk=image_id))
+
+
+def set_fingerprint_drive_ids(drive_ids):
+    """
+    Sets the Drive IDs of many existing fingerprints at once, given a dict of {image pk: drive id}
+    """
+    fingerprints = list(
+        DuplicateFingerprint.objects.filter(image_id__in=list(drive_ids))
+    )
+    for fingerprint in fingerprints:
+        fingerprint.drive_id = drive_ids[fingerprint.image_id]
+    DuplicateFingerprint.objects.bulk_update(fingerprints, ["drive_id"])
+
+
+def rebuild_fingerprints(queryset, batch_size=1000):
+    """
+    Recreates the fingerprints of every image in queryset in batches, returning the number of images processed
+    """
+    count = 0
+    queryset = queryset.select_related("driveidmapping").order_by("pk")
+    last_pk = None
+    while True:
+        batch_qs = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        batch = list(batch_qs[:batch_size])
+        if not batch:
+            return count
+        fingerprints = []
+        for image in batch:
+            try:
+                drive_id = image.driveidmapping.drive_id
+            except DriveIDMapping.DoesNotExist:
+                drive_id = ""
+            fingerprints.append(
+                DuplicateFingerprint(
+                    image_id=image.pk, drive_id=drive_id, **get_fingerprint_values(image)
+                )
+            )
+        DuplicateFingerprint.objects.filter(
+            image_id__in=[image.pk for image in batch]
+        ).delete()
+        DuplicateFingerprint.objects.bulk_create(fingerprints)
+        count += len(batch)
+        last_pk = batch[-1].pk
@@ -0,0 +1,95 @@
+import re
+
+from django.conf import settings
+
+from .fingerprints import normalize_title
+from .models import TitleNGram
+
+
+# map a Drive field to this pseudo-field in WAGTAILIMAGEIMPORT_FIELD_MAPPING to match it against titles by
+# similarity rather than equality - for example, {"name": "fuzzy_title"}
+FUZZY_TITLE_FIELD = "fuzzy_title"
+
+NGRAM_SIZE = 3
+
+DEFAULT_THRESHOLD = 0.8
+
+
+def is_fuzzy_title_matching_enabled():
+    field_mapping = getattr(settings, "WAGTAILIMAGEIMPORT_FIELD_MAPPING", {})
+    return FUZZY_TITLE_FIELD in field_mapping.values()
+
+
+def get_fuzzy_title_threshold():
+    return getattr(
+        settings, "WAGTAILIMAGEIMPORT_FUZZY_TITLE_THRESHOLD", DEFAULT_THRESHOLD
+    )
+
+
+def get_title_ngrams(title):
+    """
+    Returns the set of character trigrams of a normalized title, ignoring punctuation, so that "IMG_1234.jpg"
+    and "IMG_1234 (1).jpg" share most of their trigrams
+    """
+    title = re.sub(r"[\W_]+", " ", normalize_title(title)).strip()
+    if not title:
+        return set()
+    padded = " " * (NGRAM_SIZE - 1) + title + " "
+    return {
+        padded[index : index + NGRAM_SIZE]
+        for index in range(len(padded) - NGRAM_SIZE + 1)
+    }
+
+
+def get_similarity(ngrams, other_ngrams):
+    """
+    Returns the Dice coefficient of two sets of trigrams, from 0 (no trigrams shared) to 1 (identical)
+    """
+    if not ngrams or not other_ngrams:
+        return 0
+    return 2 * len(ngrams & other_ngrams) / (len(ngrams) + len(other_ngrams))
+
+
+def update_title_ngrams(image_id, title):
+    """
+    Brings the indexed trigrams of an image in line with its title, writing only the trigrams which changed
+    """
+    ngrams = get_title_ngrams(title)
+    existing_ngrams = set(
+        TitleNGram.objects.filter(image_id=image_id).values_list("ngram", flat=True)
+    )
+    if existing_ngrams - ngrams:
+        TitleNGram.objects.filter(
+            image_id=image_id, ngram__in=existing_ngrams - ngrams
+        ).delete()
+    TitleNGram.objects.bulk_create(
+        [
+            TitleNGram(image_id=image_id, ngram=ngram)
+            for ngram in ngrams - existing_ngrams
+        ]
+    )
+
+
+def rebuild_title_ngrams(queryset, batch_size=1000):
+    """
+    Recreates the indexed trigrams of every image in queryset in batches, returning the number of images processed
+    """
+    count = 0
+    queryset = queryset.order_by("pk")
+    last_pk = None
+    while True:
+        batch_qs = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        batch = list(batch_qs.values_list("pk", "title")[:batch_size])
+        if not batch:
+            return count
+        TitleNGram.objects.filter(image_id__in=[pk for pk, title in batch]).delete()
+        TitleNGram.objects.bulk_create(
+            [
+                TitleNGram(image_id=pk, ngram=ngram)
+                for pk, title in batch
+                for ngram in get_title_ngrams(title)
+            ],
+            batch_size=batch_size,
+        )
+        count += len(batch)
+        last_pk = batch[-1][0]
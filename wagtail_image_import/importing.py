@@ -0,0 +1,402 @@
+import hashlib
+import json
+import logging
+import mimetypes
+import os.path
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
+
+from wagtail.images import get_image_model
+from wagtail.images.forms import get_image_form
+from wagtail.images.models import UploadedImage
+
+try:
+    from storages.backends.s3boto3 import S3Boto3Storage
+    from storages.utils import clean_name, safe_join
+except ImportError:  # pragma: no cover
+    S3Boto3Storage = None
+
+from .drive import CHUNK_SIZE, fetch_drive_file, set_fetch_progress
+from .indexing import deferred_search_indexing
+from .instrumentation import stage
+from .metadata import (
+    apply_file_metadata,
+    compute_perceptual_hash,
+    extract_file_metadata,
+    is_perceptual_hashing_enabled,
+)
+from .models import LEDGER_FIELDS, DriveIDMapping, UploadedImageMetadata
+from .utils import get_duplicate_scoring_plan
+
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_POLICIES = ["skip", "replace", "keep"]
+
+
+def get_ledger_values(import_data):
+    """
+    Returns the Drive file state sent with an import (md5_checksum, head_revision_id and modified_time), to be
+    recorded against the imported image's DriveIDMapping
+    """
+    return {field: import_data.get(field) or "" for field in LEDGER_FIELDS.values()}
+
+
+def get_import_form(user, import_data, image_file):
+    """
+    Builds a form for validating an imported image file, where import_data contains the action, wagtail_id, name
+    and collection sent for the import. If the image to replace no longer exists, the form has an error on its
+    file, so that the import is rejected
+    """
+    ImageForm = get_image_form(get_image_model())
+
+    wagtail_id = import_data.get("wagtail_id")
+    if import_data["action"] == "replace" and wagtail_id:
+        try:
+            existing_image = get_image_model().objects.get(pk=wagtail_id)
+        except (get_image_model().DoesNotExist, ValueError):
+            form = ImageForm(
+                {"title": import_data.get("name", "")},
+                {"file": image_file},
+                user=user,
+            )
+            form.full_clean()
+            form.add_error("file", "The image to replace no longer exists")
+            return form
+        return ImageForm(
+            {
+                "title": existing_image.title,
+                "collection": existing_image.collection.id,
+            },
+            {"file": image_file,},
+            user=user,
+            instance=existing_image,
+        )
+    else:
+
+        return ImageForm(
+            {
+                "title": import_data.get("name", ""),
+                "collection": import_data.get("collection"),
+            },
+            {"file": image_file,},
+            user=user,
+        )
+
+
+def save_imported_image(user, form):
+    image = form.save(commit=False)
+    image.uploaded_by_user = user
+    metadata = extract_file_metadata(image.file)
+    perceptual_hash = None
+    if hasattr(image, "set_file_metadata") and is_perceptual_hashing_enabled():
+        # hash the upload while it is at hand, rather than reading the stored file back when the image is saved
+        with stage("perceptual_hash"):
+            perceptual_hash = compute_perceptual_hash(image.file)
+        image.file.seek(0)
+    apply_file_metadata(image, metadata, perceptual_hash=perceptual_hash)
+    with stage("storage_write", bytes=image.file.size):
+        # write the file as saving the image would, so that the write is timed apart from the rest of the save
+        image.file.save(image.file.name, image.file.file, save=False)
+    try:
+        with stage("image_save"), deferred_search_indexing(user):
+            image.save()
+    except Exception:
+        # don't leave the written file behind in storage if the image can't be saved
+        image.file.storage.delete(image.file.name)
+        raise
+    return image
+
+
+def import_image_file(user, import_data, image_file, uploaded_image=None):
+    """
+    Validates and saves an imported image file, returning a compact result for it. If a field other than the file
+    fails validation, the file is kept as an UploadedImage (reusing uploaded_image if the file is already stored as
+    one) to be completed by the user
+    """
+    drive_id = import_data.get("drive_id")
+    form = get_import_form(user, import_data, image_file)
+    with stage("form_validation", bytes=image_file.size):
+        is_valid = form.is_valid()
+    if is_valid:
+        image = save_imported_image(user, form)
+        if drive_id:
+            with stage("mapping_upsert"):
+                DriveIDMapping.objects.update_or_create(
+                    image=image,
+                    defaults={
+                        "drive_id": drive_id,
+                        "file_hash": image.file_hash,
+                        **get_ledger_values(import_data),
+                    },
+                )
+        return get_image_result(drive_id, image)
+    elif "file" in form.errors:
+        # The uploaded file is invalid; reject it now
+        return get_failure_result(drive_id, "\n".join(form.errors["file"]))
+    else:
+        # Some other field of the image form has failed validation, e.g. a required metadata field
+        # on a custom image model. Store the image as an UploadedImage instead so that it will
+        # become a proper Image when the edit form is successfully filled in
+        uploaded_image = store_uploaded_image(user, image_file, uploaded_image)
+        return get_uploaded_image_result(drive_id, uploaded_image, form)
+
+
+def store_uploaded_image(user, image_file, uploaded_image=None):
+    """
+    Stores an image file which needs additional input as an UploadedImage (unless it is already stored as
+    uploaded_image), recording the metadata of the file while it is at hand so that it needn't be read back from
+    storage when the UploadedImage is made into an image
+    """
+    if uploaded_image is None:
+        uploaded_image = UploadedImage.objects.create(
+            file=image_file, uploaded_by_user=user
+        )
+    metadata = extract_file_metadata(image_file)
+    perceptual_hash = ""
+    if (
+        hasattr(get_image_model(), "set_file_metadata")
+        and is_perceptual_hashing_enabled()
+    ):
+        perceptual_hash = compute_perceptual_hash(image_file)
+        image_file.seek(0)
+    UploadedImageMetadata.objects.update_or_create(
+        uploaded_image=uploaded_image,
+        defaults={"perceptual_hash": perceptual_hash, **metadata._asdict()},
+    )
+    return uploaded_image
+
+
+def is_s3_storage(storage):
+    # get_object_parameters is needed to copy files with the storage's settings, and was added in django-storages 1.10
+    return (
+        S3Boto3Storage is not None
+        and isinstance(storage, S3Boto3Storage)
+        and hasattr(storage, "get_object_parameters")
+    )
+
+
+def get_s3_key(storage, name):
+    return safe_join(storage.location, clean_name(name))
+
+
+def get_s3_copy_parameters(storage, name):
+    """
+    Returns the parameters for copying a file to name in an S3Boto3Storage, so that the copy is stored as the
+    storage would store an upload - with its ACL, cache control, encryption and content type - rather than with
+    the source's metadata
+    """
+    params = storage.get_object_parameters(name)
+    if "ContentType" not in params:
+        params["ContentType"] = (
+            mimetypes.guess_type(name)[0] or storage.default_content_type
+        )
+    if "ACL" not in params and storage.default_acl:
+        params["ACL"] = storage.default_acl
+    params["MetadataDirective"] = "REPLACE"
+    return params
+
+
+def move_stored_file(source_storage, source_name, target_storage, target_name):
+    """
+    Moves a stored file to target_name in target_storage without passing its contents through this process, if
+    the storages allow it: by renaming it if both are filesystem storages, or by copying it within S3 if both are
+    S3 storages from django-storages. Returns the name the file was stored under, or None if it can't be moved,
+    in which case it should be copied with the storages' open and save
+    """
+    if isinstance(source_storage, FileSystemStorage) and isinstance(
+        target_storage, FileSystemStorage
+    ):
+        target_name = target_storage.get_available_name(target_name)
+        target_path = target_storage.path(target_name)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        file_move_safe(source_storage.path(source_name), target_path)
+        if target_storage.file_permissions_mode is not None:
+            os.chmod(target_path, target_storage.file_permissions_mode)
+        return target_name
+    if is_s3_storage(source_storage) and is_s3_storage(target_storage):
+        target_name = target_storage.get_available_name(target_name)
+        target_storage.bucket.Object(get_s3_key(target_storage, target_name)).copy(
+            {
+                "Bucket": source_storage.bucket.name,
+                "Key": get_s3_key(source_storage, source_name),
+            },
+            ExtraArgs=get_s3_copy_parameters(target_storage, target_name),
+        )
+        source_storage.delete(source_name)
+        return target_name
+    return None
+
+
+def promote_uploaded_image(uploaded_image, image):
+    """
+    Makes the file of an UploadedImage the file of image, moving it within storage where possible rather than
+    downloading and uploading it again, and reusing the metadata recorded when the UploadedImage was stored.
+    Returns whether the file was moved, in which case the UploadedImage no longer has a file to delete
+    """
+    try:
+        recorded = UploadedImageMetadata.objects.get(uploaded_image=uploaded_image)
+    except UploadedImageMetadata.DoesNotExist:
+        recorded = None
+
+    if recorded and recorded.width:
+        # with its dimensions already set, the image won't open the file to read them when it is assigned
+        image.width, image.height = recorded.width, recorded.height
+
+    source = uploaded_image.file
+    file_name = os.path.basename(source.name)
+    with stage("storage_write", bytes=recorded.size if recorded else source.size):
+        moved_name = move_stored_file(
+            source.storage,
+            source.name,
+            image.file.storage,
+            image.file.field.generate_filename(image, file_name),
+        )
+        if moved_name:
+            image.file = moved_name
+        else:
+            image.file.save(file_name, source.file, save=False)
+
+    if recorded:
+        apply_file_metadata(
+            image,
+            recorded.get_file_metadata(),
+            perceptual_hash=recorded.perceptual_hash or None,
+        )
+    else:
+        with image.open_file() as f:
+            apply_file_metadata(image, extract_file_metadata(f))
+    return moved_name is not None
+
+
+def get_image_result(drive_id, image):
+    return {
+        "drive_id": drive_id,
+        "success": True,
+        "image_id": int(image.id),
+        "edit_action": reverse("wagtail_image_import:edit", args=(image.id,)),
+        "delete_action": reverse("wagtailimages:delete_multiple", args=(image.id,)),
+    }
+
+
+def get_uploaded_image_result(drive_id, uploaded_image, form):
+    return {
+        "drive_id": drive_id,
+        "error": "The image was uploaded, but needs additional input to be saved. Errors: "
+        + "\n".join(
+            [
+                field + ": " + error
+                for field, error_list in form.errors.items()
+                for error in error_list
+            ]
+        ),
+        "success": True,
+        "uploaded_image_id": uploaded_image.id,
+        "edit_action": reverse(
+            "wagtail_image_import:create_from_uploaded_image",
+            args=(uploaded_image.id,),
+        ),
+        "delete_action": reverse(
+            "wagtailimages:delete_upload_multiple", args=(uploaded_image.id,),
+        ),
+    }
+
+
+def get_failure_result(drive_id, error):
+    return {"drive_id": drive_id, "success": False, "error": error}
+
+
+def fetch_drive_file_for_user(user, drive_id, oauth_token, name):
+    def report_progress(loaded, total):
+        set_fetch_progress(user, drive_id, loaded, total)
+
+    return fetch_drive_file(
+        drive_id, oauth_token, name, progress_callback=report_progress
+    )
+
+
+def get_local_file_data(path):
+    """
+    Returns the Drive-like data of a local file used to find its duplicates: its name, md5Checksum and, if a JSON
+    sidecar file (as in Google Takeout exports) gives them, its title and Drive id
+    """
+    image_data = {"name": os.path.basename(path)}
+    sidecar_path = path + ".json"
+    if os.path.exists(sidecar_path):
+        with open(sidecar_path) as f:
+            sidecar = json.load(f)
+        image_data["name"] = sidecar.get("title") or image_data["name"]
+        if sidecar.get("id"):
+            image_data["id"] = sidecar["id"]
+    if "md5Checksum" in get_duplicate_scoring_plan().field_mapping:
+        md5_hash = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                md5_hash.update(chunk)
+        image_data["md5Checksum"] = md5_hash.hexdigest()
+    return image_data
+
+
+def import_local_file(user_pk, path, collection_id, duplicate_policy):
+    """
+    Imports an image from a local file as an import from Drive would be, first looking for its most likely duplicate
+    and skipping the file, replacing the duplicate or keeping both according to duplicate_policy. This is run in
+    the worker processes of the import_files command, so it only takes and returns picklable values
+    """
+    try:
+        return import_local_file_as_user(
+            get_user_model().objects.get(pk=user_pk),
+            path,
+            collection_id,
+            duplicate_policy,
+        )
+    except Exception:
+        # one bad file shouldn't stop the rest of the import
+        logger.exception("Importing %s failed", path)
+        return get_failure_result(None, "Failed to import")
+
+
+def apply_duplicate_policy(image_data, import_data, duplicate_policy):
+    """
+    Looks for the most likely duplicate of a file, given its Drive data, and returns the result of skipping the file
+    if it has one and duplicate_policy is "skip". Otherwise returns None, having updated import_data to replace the
+    duplicate if it has one and duplicate_policy is "replace"
+    """
+    (duplicate,) = get_duplicate_scoring_plan().get_most_likely_duplicates(
+        [image_data]
+    )
+    if duplicate is None:
+        return None
+    if duplicate_policy == "skip":
+        return {
+            "drive_id": import_data["drive_id"],
+            "success": True,
+            "skipped": True,
+            "image_id": duplicate.pk,
+        }
+    if duplicate_policy == "replace":
+        import_data.update(action="replace", wagtail_id=duplicate.pk)
+    return None
+
+
+def import_local_file_as_user(user, path, collection_id, duplicate_policy):
+    image_data = get_local_file_data(path)
+    import_data = {
+        "drive_id": image_data.get("id"),
+        "name": image_data["name"],
+        "collection": collection_id,
+        "action": "keep",
+    }
+    skipped_result = apply_duplicate_policy(image_data, import_data, duplicate_policy)
+    if skipped_result:
+        return skipped_result
+    with open(path, "rb") as f:
+        result = import_image_file(
+            user, import_data, File(f, name=os.path.basename(path))
+        )
+    result["replaced"] = import_data["action"] == "replace"
+    return result
@@ -0,0 +1,111 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from wagtail.images import get_image_model
+from wagtail.search.backends import get_search_backends
+from wagtail.search.signal_handlers import (
+    post_save_signal_handler as search_post_save_signal_handler,
+)
+
+from .models import PendingSearchIndexUpdate
+
+
+# the number of images sent to the search backends in each add_bulk call
+INDEX_CHUNK_SIZE = 100
+
+# the user whose saves are being queued for indexing in each thread, set by deferred_search_indexing
+_deferral = threading.local()
+_signal_handler_lock = threading.Lock()
+
+
+def is_search_indexing_deferred():
+    return getattr(settings, "WAGTAILIMAGEIMPORT_DEFER_SEARCH_INDEXING", False)
+
+
+def queue_search_index_update(image, user=None):
+    PendingSearchIndexUpdate.objects.update_or_create(
+        image_id=image.pk, defaults={"user": user}
+    )
+
+
+def post_save_image_search_signal_handler(instance, **kwargs):
+    """
+    Takes the place of Wagtail's post_save search indexing of images, queueing the images saved within
+    deferred_search_indexing and indexing any others as Wagtail would
+    """
+    if getattr(_deferral, "active", False):
+        queue_search_index_update(instance, _deferral.user)
+    else:
+        search_post_save_signal_handler(instance, **kwargs)
+
+
+def replace_search_signal_handler():
+    """
+    Swaps Wagtail's post_save search indexing of the image model for post_save_image_search_signal_handler. This
+    is done on first use rather than when the app is ready, as wagtail.search connects its handlers after this
+    app's are registered. If the image model isn't indexed automatically, there is nothing to replace
+    """
+    with _signal_handler_lock:
+        Image = get_image_model()
+        if post_save.disconnect(search_post_save_signal_handler, sender=Image):
+            post_save.connect(post_save_image_search_signal_handler, sender=Image)
+
+
+@contextmanager
+def deferred_search_indexing(user=None):
+    """
+    If deferred indexing has been turned on, images saved within this block are queued for indexing by
+    flush_search_index_updates, rather than indexed by Wagtail as they are saved
+    """
+    if not is_search_indexing_deferred():
+        yield
+        return
+    replace_search_signal_handler()
+    previous = getattr(_deferral, "active", False), getattr(_deferral, "user", None)
+    _deferral.active, _deferral.user = True, user
+    try:
+        yield
+    finally:
+        _deferral.active, _deferral.user = previous
+
+
+def update_search_index(image, user=None):
+    """
+    Reindexes an image after it has been changed through the import views. If deferred indexing has been
+    turned on, the image is only queued here, to be indexed in bulk by flush_search_index_updates
+    """
+    if is_search_indexing_deferred():
+        queue_search_index_update(image, user)
+    else:
+        for backend in get_search_backends():
+            backend.add(image)
+
+
+def flush_search_index_updates(user=None, chunk_size=INDEX_CHUNK_SIZE):
+    """
+    Adds queued images to the search backends with add_bulk, chunk_size images at a time, and returns the number
+    of images indexed. If user is given, only the images queued by that user's session are indexed
+    """
+    Image = get_image_model()
+    # updates queued while flushing are left for the next flush, as the image may have changed again since it
+    # was loaded
+    flush_started = timezone.now()
+    pending = PendingSearchIndexUpdate.objects.filter(queued_at__lte=flush_started)
+    if user is not None:
+        pending = pending.filter(user=user)
+
+    indexed = 0
+    while True:
+        image_ids = list(pending.values_list("image_id", flat=True)[:chunk_size])
+        if not image_ids:
+            return indexed
+        images = list(Image.get_indexed_objects().filter(pk__in=image_ids))
+        if images:
+            for backend in get_search_backends():
+                backend.add_bulk(Image, images)
+        pending.filter(image_id__in=image_ids).delete()
+        indexed += len(images)
@@ -0,0 +1,167 @@
+import functools
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import Signal
+
+
+logger = logging.getLogger(__name__)
+
+# sent as each stage of an instrumented view finishes, with the view's name as the sender and the keyword
+# arguments stage (the stage's name), duration (in seconds), queries (the number of database queries made) and
+# bytes (the number of bytes of file or request data processed, or 0)
+stage_finished = Signal()
+
+_local = threading.local()
+
+
+class Stage:
+    def __init__(self, name, bytes=0):
+        self.name = name
+        self.bytes = bytes
+        self.duration = 0
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # counts queries as a database execute wrapper, which unlike connection.queries works without DEBUG
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "duration": self.duration,
+            "queries": self.queries,
+            "bytes": self.bytes,
+        }
+
+
+class ViewTimings:
+    """
+    The stages recorded during a request to an instrumented view. Stages may be nested - "total" covers the
+    whole view - so their durations can overlap
+    """
+
+    def __init__(self, view_name):
+        self.view_name = view_name
+        self.stages = []
+
+    def add(self, stage):
+        self.stages.append(stage)
+        stage_finished.send(sender=self.view_name, **stage.as_dict())
+
+    @contextmanager
+    def activate(self, total):
+        """
+        Records the stages run in this thread as stages of this view, counting the queries made towards the total
+        stage
+        """
+        previous_timings = getattr(_local, "timings", None)
+        _local.timings = self
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(total))
+                yield
+        finally:
+            _local.timings = previous_timings
+
+    def finish(self, total, start):
+        total.duration = time.perf_counter() - start
+        self.add(total)
+        logger.info(
+            "%s took %.1fms",
+            self.view_name,
+            total.duration * 1000,
+            extra={
+                "view": self.view_name,
+                "stages": [stage.as_dict() for stage in self.stages],
+            },
+        )
+
+    def stream(self, streaming_content, total, start):
+        """
+        Yields the chunks of a streaming response, recording the stages run as each is generated - which happens
+        after the view has returned - and finishing the timings once the response has been sent
+        """
+        iterator = iter(streaming_content)
+        try:
+            while True:
+                with self.activate(total):
+                    chunk = next(iterator, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.finish(total, start)
+
+    def get_server_timing(self):
+        """
+        Returns the value of a Server-Timing header for the stages, with the durations of repeated stages summed
+        """
+        durations = {}
+        for stage in self.stages:
+            durations[stage.name] = durations.get(stage.name, 0) + stage.duration
+        return ", ".join(
+            "{};dur={:.1f}".format(name, duration * 1000)
+            for name, duration in durations.items()
+        )
+
+
+@contextmanager
+def stage(name, bytes=0):
+    """
+    Times a stage of the instrumented view running in this thread, yielding the Stage so that bytes can be set
+    once known. Outside instrumented views, such as in the import worker, stages aren't recorded
+    """
+    timings = getattr(_local, "timings", None)
+    current = Stage(name, bytes)
+    if timings is None:
+        yield current
+        return
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(current))
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            current.duration = time.perf_counter() - start
+    timings.add(current)
+
+
+def instrumented(view_name):
+    """
+    Records the stages of a view, logging them once the response is ready, and adding them to its Server-Timing
+    header if WAGTAILIMAGEIMPORT_SERVER_TIMING is set. The stages of a streaming response are recorded as its
+    content is generated, and logged once it has been sent, so have no Server-Timing header
+    """
+
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapped_view(request, *args, **kwargs):
+            timings = ViewTimings(view_name)
+            total = Stage(
+                "total", bytes=int(request.META.get("CONTENT_LENGTH") or 0)
+            )
+            start = time.perf_counter()
+            with timings.activate(total):
+                response = view_func(request, *args, **kwargs)
+
+            if response.streaming:
+                response.streaming_content = timings.stream(
+                    response.streaming_content, total, start
+                )
+                return response
+            timings.finish(total, start)
+            if getattr(settings, "WAGTAILIMAGEIMPORT_SERVER_TIMING", False):
+                response["Server-Timing"] = timings.get_server_timing()
+            return response
+
+        return wrapped_view
+
+    return decorator
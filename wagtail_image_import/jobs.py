@@ -0,0 +1,175 @@
+import logging
+import os.path
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+
+from wagtail.images.models import UploadedImage
+
+from .drive import DriveFetchError
+from .importing import (
+    fetch_drive_file_for_user,
+    get_failure_result,
+    get_ledger_values,
+    import_image_file,
+)
+from .models import LEDGER_FIELDS, ImportJob
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_RETENTION_DAYS = 7
+
+
+def enqueue_import_job(user, import_data, image_file=None, oauth_token=""):
+    """
+    Queues an import to be run by the run_import_worker command. An uploaded image_file is stored as an
+    UploadedImage until the job runs; otherwise the file will be fetched from Drive using oauth_token
+    """
+    uploaded_image = None
+    if image_file is not None:
+        uploaded_image = UploadedImage.objects.create(
+            file=image_file, uploaded_by_user=user
+        )
+    action = import_data.get("action", "keep")
+    wagtail_id = import_data.get("wagtail_id")
+    return ImportJob.objects.create(
+        user=user,
+        drive_id=import_data.get("drive_id") or "",
+        name=import_data.get("name", ""),
+        action=action,
+        wagtail_id=int(wagtail_id) if action == "replace" and wagtail_id else None,
+        collection_id=import_data.get("collection") or None,
+        uploaded_image=uploaded_image,
+        **get_ledger_values(import_data),
+        oauth_token="" if uploaded_image else oauth_token,
+    )
+
+
+def claim_import_jobs(limit):
+    """
+    Marks up to limit pending jobs as running, and returns their pks
+    """
+    with transaction.atomic():
+        queryset = ImportJob.objects.filter(status=ImportJob.STATUS_PENDING).order_by(
+            "pk"
+        )
+        if connection.features.has_select_for_update_skip_locked:
+            # let several workers claim jobs at the same time without blocking each other
+            queryset = queryset.select_for_update(skip_locked=True)
+        pks = list(queryset.values_list("pk", flat=True)[:limit])
+        ImportJob.objects.filter(pk__in=pks).update(
+            status=ImportJob.STATUS_RUNNING, started_at=timezone.now()
+        )
+    return pks
+
+
+def requeue_stale_import_jobs(started_before):
+    """
+    Returns jobs left running since before started_before (for example by a worker which was killed) to the queue
+    """
+    return ImportJob.objects.filter(
+        status=ImportJob.STATUS_RUNNING, started_at__lt=started_before
+    ).update(status=ImportJob.STATUS_PENDING, started_at=None)
+
+
+def get_job_retention():
+    """
+    Returns how long finished jobs are kept for the browser to fetch their results before being pruned
+    """
+    return timedelta(
+        days=getattr(
+            settings,
+            "WAGTAILIMAGEIMPORT_IMPORT_JOB_RETENTION_DAYS",
+            DEFAULT_JOB_RETENTION_DAYS,
+        )
+    )
+
+
+def prune_import_jobs(finished_before):
+    """
+    Deletes the jobs which finished before finished_before, along with any uploaded file a job still holds for an
+    image its user never completed. Returns the number of jobs deleted
+    """
+    jobs = ImportJob.objects.filter(
+        status__in=[ImportJob.STATUS_SUCCEEDED, ImportJob.STATUS_FAILED],
+        finished_at__lt=finished_before,
+    )
+    for uploaded_image in UploadedImage.objects.filter(
+        pk__in=jobs.filter(uploaded_image__isnull=False).values("uploaded_image")
+    ):
+        uploaded_image.file.delete(save=False)
+        uploaded_image.delete()
+    deleted, _ = jobs.delete()
+    return deleted
+
+
+def run_import_job(job_pk):
+    job = ImportJob.objects.select_related("user", "uploaded_image").get(pk=job_pk)
+    import_data = {
+        "drive_id": job.drive_id,
+        "name": job.name,
+        "action": job.action,
+        "wagtail_id": job.wagtail_id,
+        "collection": job.collection_id,
+        **{field: getattr(job, field) for field in LEDGER_FIELDS.values()},
+    }
+    try:
+        if job.uploaded_image:
+            result = import_uploaded_image(job, import_data)
+        elif job.oauth_token:
+            image_file = fetch_drive_file_for_user(
+                job.user, job.drive_id, job.oauth_token, job.name
+            )
+            try:
+                result = import_image_file(job.user, import_data, image_file)
+            finally:
+                image_file.close()
+        else:
+            result = get_failure_result(job.drive_id, "The file to import is missing")
+    except DriveFetchError:
+        result = get_failure_result(job.drive_id, "Failed to import from Google")
+    except Exception:
+        logger.exception("Import job %d failed", job.pk)
+        result = get_failure_result(job.drive_id, "Failed to import")
+
+    job.status = (
+        ImportJob.STATUS_SUCCEEDED if result["success"] else ImportJob.STATUS_FAILED
+    )
+    job.set_result(result)
+    # whether the job succeeded or failed, its token and stored file are no longer needed, so don't keep them
+    job.oauth_token = ""
+    job.finished_at = timezone.now()
+    job.save(
+        update_fields=[
+            "status",
+            "result",
+            "oauth_token",
+            "uploaded_image",
+            "finished_at",
+        ]
+    )
+    return result
+
+
+def import_uploaded_image(job, import_data):
+    uploaded_image = job.uploaded_image
+    result = None
+    try:
+        with uploaded_image.file.open("rb") as f:
+            result = import_image_file(
+                job.user,
+                import_data,
+                File(f, name=os.path.basename(uploaded_image.file.name)),
+                uploaded_image=uploaded_image,
+            )
+    finally:
+        if result is None or "uploaded_image_id" not in result:
+            # the UploadedImage is only kept if the user still needs to complete the image
+            uploaded_image.file.delete(save=False)
+            uploaded_image.delete()
+            job.uploaded_image = None
+    return result
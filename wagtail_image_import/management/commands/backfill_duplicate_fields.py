@@ -0,0 +1,119 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from wagtail.images import get_image_model
+
+from wagtail_image_import.backfill import (
+    compute_duplicate_fields,
+    get_backfill_batches,
+    get_backfill_progress,
+    get_backfill_queryset,
+    reset_backfill_progress,
+    save_duplicate_fields,
+)
+from wagtail_image_import.management.commands.run_import_worker import (
+    initialize_worker_process,
+)
+from wagtail_image_import.models import DuplicateFindingMixin
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills in the md5_hash, exif_datetime and perceptual_hash of existing images by reading their files in "
+        "parallel, saving progress so that an interrupted run can be resumed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=4,
+            help="Number of worker processes to read files in, or 0 to read them in this process",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of images each worker reads at a time, and which are written in each bulk update",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recompute the fields of every image, rather than only those with missing hashes",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start again from the first image, rather than resuming an interrupted run",
+        )
+
+    def handle(self, *args, **options):
+        if not issubclass(get_image_model(), DuplicateFindingMixin):
+            raise CommandError(
+                "The image model doesn't use DuplicateFindingMixin, so has no fields to backfill"
+            )
+
+        processes = options["processes"]
+        progress = get_backfill_progress(
+            "duplicate_fields:all" if options["all"] else "duplicate_fields",
+            restart=options["restart"],
+        )
+        if progress.last_image_id:
+            self.stdout.write(
+                "Resuming after image %d (use --restart to start again)"
+                % progress.last_image_id
+            )
+        batches = get_backfill_batches(
+            get_backfill_queryset(refresh_all=options["all"]),
+            progress.last_image_id,
+            options["batch_size"],
+        )
+
+        executor = None
+        if processes:
+            connections.close_all()
+            executor = ProcessPoolExecutor(
+                max_workers=processes, initializer=initialize_worker_process
+            )
+        self.verbosity = options["verbosity"]
+        self.updated = self.failed = 0
+        try:
+            # keep each worker busy, but save the results in order, so that every image before the saved
+            # progress has always been written
+            pending = deque()
+            for batch in batches:
+                if not executor:
+                    self.save_batch(progress, batch, compute_duplicate_fields(batch))
+                    continue
+                pending.append(
+                    (batch, executor.submit(compute_duplicate_fields, batch))
+                )
+                if len(pending) >= processes * 2:
+                    batch, future = pending.popleft()
+                    self.save_batch(progress, batch, future.result())
+            while pending:
+                batch, future = pending.popleft()
+                self.save_batch(progress, batch, future.result())
+        finally:
+            if executor:
+                executor.shutdown()
+        # the run got through every image, so the next run checks them all again rather than resuming after the
+        # last one, which would skip any images whose hashes were emptied since
+        reset_backfill_progress(progress)
+
+        self.stdout.write(
+            "Backfilled %d images, %d of whose files could not be read"
+            % (self.updated + self.failed, self.failed)
+        )
+
+    def save_batch(self, progress, batch, results):
+        updated = save_duplicate_fields(results)
+        self.updated += updated
+        self.failed += len(batch) - updated
+        progress.last_image_id = batch[-1][0]
+        progress.save()
+        if self.verbosity > 1:
+            self.stdout.write("Backfilled images up to %d" % progress.last_image_id)
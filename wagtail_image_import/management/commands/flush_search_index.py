@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from wagtail_image_import.indexing import INDEX_CHUNK_SIZE, flush_search_index_updates
+
+
+class Command(BaseCommand):
+    help = "Adds images queued for search indexing by the import views to the search backends in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=INDEX_CHUNK_SIZE,
+            help="Number of images to send to the search backends at a time",
+        )
+
+    def handle(self, *args, **options):
+        indexed = flush_search_index_updates(chunk_size=options["chunk_size"])
+        self.stdout.write("Indexed %d images" % indexed)
@@ -0,0 +1,127 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from wagtail.core.models import Collection
+from wagtail.images.fields import ALLOWED_EXTENSIONS
+
+from wagtail_image_import.importing import DUPLICATE_POLICIES, import_local_file
+from wagtail_image_import.management.commands.run_import_worker import (
+    initialize_worker_process,
+)
+
+
+def find_image_files(directory, extensions):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1][1:].lower() in extensions:
+                yield os.path.join(root, name)
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports every image in a local directory, such as a Google Takeout export, checking each for duplicates "
+        "as imports from Drive are"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "directory", help="Directory to import images from, recursively"
+        )
+        parser.add_argument(
+            "--user",
+            required=True,
+            help="Username of the user to import the images as",
+        )
+        parser.add_argument(
+            "--collection",
+            type=int,
+            help="ID of the collection to add new images to. Defaults to the root collection",
+        )
+        parser.add_argument(
+            "--duplicates",
+            choices=DUPLICATE_POLICIES,
+            default="skip",
+            help="Whether to skip files with a duplicate, replace the duplicate's file, or keep both (default: skip)",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=4,
+            help="Number of worker processes to import files in, or 0 to import them in this process",
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(**{User.USERNAME_FIELD: options["user"]})
+        except User.DoesNotExist:
+            raise CommandError("User '%s' does not exist" % options["user"])
+        if not os.path.isdir(options["directory"]):
+            raise CommandError("'%s' is not a directory" % options["directory"])
+        collection_id = options["collection"] or Collection.get_first_root_node().pk
+
+        self.verbosity = options["verbosity"]
+        paths = list(find_image_files(options["directory"], ALLOWED_EXTENSIONS))
+        import_file = partial(
+            import_local_file,
+            user.pk,
+            collection_id=collection_id,
+            duplicate_policy=options["duplicates"],
+        )
+        processes = options["processes"]
+        executor = None
+        if processes:
+            connections.close_all()
+            executor = ProcessPoolExecutor(
+                max_workers=processes, initializer=initialize_worker_process
+            )
+
+        counts = {"imported": 0, "replaced": 0, "skipped": 0, "failed": 0}
+        imported_bytes = 0
+        start = time.perf_counter()
+        try:
+            if executor:
+                results = executor.map(import_file, paths, chunksize=10)
+            else:
+                results = map(import_file, paths)
+            for index, (path, result) in enumerate(zip(paths, results), 1):
+                if not result["success"]:
+                    counts["failed"] += 1
+                    self.stderr.write("%s: %s" % (path, result["error"]))
+                elif result.get("skipped"):
+                    counts["skipped"] += 1
+                else:
+                    counts["replaced" if result["replaced"] else "imported"] += 1
+                    imported_bytes += os.path.getsize(path)
+                if self.verbosity > 1 or index % 100 == 0:
+                    self.stdout.write(self.get_progress(index, len(paths), start))
+        finally:
+            if executor:
+                executor.shutdown()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            "Imported {imported}, replaced {replaced}, skipped {skipped} and failed to import {failed} "
+            "of {total} files in {elapsed:.1f}s ({rate:.1f} files/s, {throughput:.1f} MB/s)".format(
+                total=len(paths),
+                elapsed=elapsed,
+                rate=len(paths) / elapsed if elapsed else 0,
+                throughput=imported_bytes / elapsed / 1024 / 1024 if elapsed else 0,
+                **counts
+            )
+        )
+
+    def get_progress(self, done, total, start):
+        elapsed = time.perf_counter() - start
+        return "%d/%d files (%.1f files/s)" % (
+            done,
+            total,
+            done / elapsed if elapsed else 0,
+        )
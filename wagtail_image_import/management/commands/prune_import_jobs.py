@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from wagtail_image_import.jobs import get_job_retention, prune_import_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes background import jobs which finished more than WAGTAILIMAGEIMPORT_IMPORT_JOB_RETENTION_DAYS "
+        "days ago, along with any files they still hold"
+    )
+
+    def handle(self, *args, **options):
+        pruned = prune_import_jobs(timezone.now() - get_job_retention())
+        self.stdout.write("Deleted %d import jobs" % pruned)
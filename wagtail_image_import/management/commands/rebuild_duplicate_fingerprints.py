@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from wagtail.images import get_image_model
+
+from wagtail_image_import.fingerprints import rebuild_fingerprints
+from wagtail_image_import.fuzzy_titles import (
+    is_fuzzy_title_matching_enabled,
+    rebuild_title_ngrams,
+)
+
+
+class Command(BaseCommand):
+    help = "Creates or refreshes the duplicate fingerprints of all existing images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of images to process per batch",
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_fingerprints(
+            get_image_model().objects.all(), batch_size=options["batch_size"]
+        )
+        self.stdout.write("Rebuilt duplicate fingerprints for %d images" % count)
+        if is_fuzzy_title_matching_enabled():
+            count = rebuild_title_ngrams(
+                get_image_model().objects.all(), batch_size=options["batch_size"]
+            )
+            self.stdout.write("Rebuilt title n-grams for %d images" % count)
@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from wagtail_image_import.jobs import (
+    claim_import_jobs,
+    get_job_retention,
+    prune_import_jobs,
+    requeue_stale_import_jobs,
+    run_import_job,
+)
+
+
+def initialize_worker_process():
+    # processes which aren't forked from the command need Django set up, and forked processes
+    # must not share the parent's database connections
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Runs queued background image imports"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=4,
+            help="Number of worker processes to run imports in, or 0 to run them in this process",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait before checking for new jobs when the queue is empty",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=3600,
+            help="Seconds after which jobs still marked as running are assumed to have been abandoned and requeued",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty, instead of waiting for new jobs",
+        )
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        requeued = requeue_stale_import_jobs(
+            timezone.now() - timedelta(seconds=options["stale_after"])
+        )
+        if requeued:
+            self.stdout.write("Requeued %d abandoned import jobs" % requeued)
+        pruned = prune_import_jobs(timezone.now() - get_job_retention())
+        if pruned:
+            self.stdout.write("Deleted %d old import jobs" % pruned)
+
+        executor = None
+        if processes:
+            connections.close_all()
+            executor = ProcessPoolExecutor(
+                max_workers=processes, initializer=initialize_worker_process
+            )
+        try:
+            while True:
+                job_pks = claim_import_jobs(max(processes, 1) * 2)
+                if not job_pks:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+                if executor:
+                    results = executor.map(run_import_job, job_pks)
+                else:
+                    results = map(run_import_job, job_pks)
+                for job_pk, result in zip(job_pks, results):
+                    self.stdout.write(
+                        "Import job %d %s"
+                        % (job_pk, "succeeded" if result["success"] else "failed")
+                    )
+        finally:
+            if executor:
+                executor.shutdown()
@@ -0,0 +1,152 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from wagtail.core.models import Collection
+
+from wagtail_image_import.drive import (
+    DriveAuthError,
+    DriveFetchError,
+    get_service_account_access_token,
+    refresh_access_token,
+)
+from wagtail_image_import.importing import DUPLICATE_POLICIES
+from wagtail_image_import.models import DriveFolderSync
+from wagtail_image_import.sync import sync_folder
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports the images added to or changed in synced Google Drive folders since they were last synced, "
+        "replacing the images previously imported from changed files"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "folder_ids",
+            nargs="*",
+            help="Drive IDs of the folders to sync. Defaults to every synced folder",
+        )
+        parser.add_argument(
+            "--add",
+            action="store_true",
+            help="Start syncing the given folders, importing every image in them",
+        )
+        parser.add_argument(
+            "--user",
+            help="Username of the user to import the images of added folders as",
+        )
+        parser.add_argument(
+            "--collection",
+            type=int,
+            help="ID of the collection to import the images of added folders into. Defaults to the root collection",
+        )
+        parser.add_argument(
+            "--duplicates",
+            choices=DUPLICATE_POLICIES,
+            default="skip",
+            help="Whether to skip new files with a duplicate, replace the duplicate's file, or keep both (default: skip)",
+        )
+        parser.add_argument(
+            "--oauth-token",
+            default=os.environ.get("WAGTAILIMAGEIMPORT_DRIVE_OAUTH_TOKEN"),
+            help="OAuth access token for the Drive API, which expires after about an hour. Defaults to the "
+            "WAGTAILIMAGEIMPORT_DRIVE_OAUTH_TOKEN environment variable",
+        )
+        parser.add_argument(
+            "--refresh-token",
+            default=os.environ.get("WAGTAILIMAGEIMPORT_DRIVE_REFRESH_TOKEN"),
+            help="OAuth refresh token, issued to the WAGTAILIMAGEIMPORT_GOOGLE_OAUTH_CLIENT_SECRET client, to get "
+            "a new access token from on each run. Defaults to the WAGTAILIMAGEIMPORT_DRIVE_REFRESH_TOKEN "
+            "environment variable",
+        )
+        parser.add_argument(
+            "--service-account-file",
+            default=os.environ.get("WAGTAILIMAGEIMPORT_DRIVE_SERVICE_ACCOUNT_FILE"),
+            help="Path to the JSON key of a service account to get a new access token for on each run. Defaults "
+            "to the WAGTAILIMAGEIMPORT_DRIVE_SERVICE_ACCOUNT_FILE environment variable",
+        )
+
+    def get_oauth_token(self, options):
+        """
+        Returns the access token to sync with: a new one for the service account or refresh token if given, so
+        that scheduled syncs keep working, or else the given access token
+        """
+        try:
+            if options["service_account_file"]:
+                return get_service_account_access_token(
+                    options["service_account_file"]
+                )
+            if options["refresh_token"]:
+                return refresh_access_token(options["refresh_token"])
+        except DriveFetchError as e:
+            raise CommandError("Could not get a Drive access token: %s" % e)
+        if options["oauth_token"]:
+            return options["oauth_token"]
+        raise CommandError(
+            "Drive credentials are needed, from --service-account-file, --refresh-token or --oauth-token (or "
+            "their environment variables)"
+        )
+
+    def handle(self, *args, **options):
+        oauth_token = self.get_oauth_token(options)
+        if options["add"]:
+            self.add_folders(options)
+
+        folder_syncs = DriveFolderSync.objects.select_related("user").order_by("pk")
+        if options["folder_ids"]:
+            folder_syncs = folder_syncs.filter(folder_id__in=options["folder_ids"])
+            missing = set(options["folder_ids"]) - {
+                folder_sync.folder_id for folder_sync in folder_syncs
+            }
+            if missing:
+                raise CommandError(
+                    "Not synced: %s. Use --add to start syncing them"
+                    % ", ".join(sorted(missing))
+                )
+
+        for folder_sync in folder_syncs:
+            try:
+                results = sync_folder(folder_sync, oauth_token, options["duplicates"])
+            except DriveAuthError as e:
+                raise CommandError(
+                    "Drive rejected the credentials while syncing %s, so the sync was stopped: %s. Access "
+                    "tokens expire after about an hour, so use --refresh-token or --service-account-file for "
+                    "scheduled syncs" % (folder_sync.folder_id, e)
+                )
+            except DriveFetchError as e:
+                self.stderr.write(
+                    "Failed to list changes to %s: %s" % (folder_sync.folder_id, e)
+                )
+                continue
+            counts = {"imported": 0, "replaced": 0, "skipped": 0, "failed": 0}
+            for result in results:
+                if not result["success"]:
+                    counts["failed"] += 1
+                    self.stderr.write("%s: %s" % (result["drive_id"], result["error"]))
+                elif result.get("skipped"):
+                    counts["skipped"] += 1
+                else:
+                    counts["replaced" if result["replaced"] else "imported"] += 1
+            self.stdout.write(
+                "Synced {folder_id}: imported {imported}, replaced {replaced}, skipped {skipped} and failed to "
+                "import {failed} files".format(folder_id=folder_sync.folder_id, **counts)
+            )
+
+    def add_folders(self, options):
+        if not options["folder_ids"]:
+            raise CommandError("Give the Drive IDs of the folders to add")
+        if not options["user"]:
+            raise CommandError("--user is needed to add folders")
+        User = get_user_model()
+        try:
+            user = User.objects.get(**{User.USERNAME_FIELD: options["user"]})
+        except User.DoesNotExist:
+            raise CommandError("User '%s' does not exist" % options["user"])
+        collection_id = options["collection"] or Collection.get_first_root_node().pk
+        for folder_id in options["folder_ids"]:
+            DriveFolderSync.objects.get_or_create(
+                folder_id=folder_id,
+                defaults={"user": user, "collection_id": collection_id},
+            )
@@ -0,0 +1,163 @@
+import hashlib
+import math
+import statistics
+from collections import namedtuple
+
+import PIL.ExifTags
+import PIL.Image
+from django.conf import settings
+
+from .instrumentation import stage
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+FileMetadata = namedtuple(
+    "FileMetadata",
+    ["file_hash", "md5_hash", "size", "width", "height", "exif_datetime"],
+)
+
+CHUNK_SIZE = 64 * 1024
+
+EXIF_DATETIME_TAG = next(
+    key for key, descriptor in PIL.ExifTags.TAGS.items() if descriptor == "DateTime"
+)
+
+# perceptual hashes are taken from the lowest HASH_SIZE x HASH_SIZE frequencies of the DCT of the image scaled down
+# to HASH_IMAGE_SIZE x HASH_IMAGE_SIZE greyscale pixels, giving a 64 bit hash
+HASH_SIZE = 8
+HASH_IMAGE_SIZE = 32
+
+# the DCT-II basis for the low frequencies, as rows of [frequency][pixel]
+DCT_BASIS = [
+    [
+        math.cos(math.pi * frequency * (2 * pixel + 1) / (2 * HASH_IMAGE_SIZE))
+        for pixel in range(HASH_IMAGE_SIZE)
+    ]
+    for frequency in range(HASH_SIZE)
+]
+
+
+def extract_file_metadata(f, chunk_size=CHUNK_SIZE):
+    """
+    Extracts all the metadata needed on import from a seekable file, reading its contents only once: the SHA-1
+    hash Wagtail uses as file_hash, the md5 hash, the size, and the dimensions and EXIF DateTime of the image.
+    Pillow opens images lazily, so the dimensions and EXIF data only cost a read of the image headers
+    """
+    f.seek(0)
+    with stage("exif"):
+        width, height, exif_datetime = get_image_info(f)
+
+    f.seek(0)
+    sha1_hash = hashlib.sha1()
+    md5_hash = hashlib.md5()
+    size = 0
+    with stage("file_hashing") as hashing:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha1_hash.update(chunk)
+            md5_hash.update(chunk)
+            size += len(chunk)
+        hashing.bytes = size
+    f.seek(0)
+
+    return FileMetadata(
+        file_hash=sha1_hash.hexdigest(),
+        md5_hash=md5_hash.hexdigest(),
+        size=size,
+        width=width,
+        height=height,
+        exif_datetime=exif_datetime,
+    )
+
+
+def get_image_info(f):
+    """
+    Returns the width, height and EXIF DateTime of an image file without decoding the image data
+    """
+    try:
+        image = PIL.Image.open(f)
+    except OSError:
+        return None, None, ""
+    # some formats (such as PNG) override getexif to decode the whole image looking for trailing EXIF data, so
+    # use the base implementation, which only reads EXIF data found in the headers
+    exif = PIL.Image.Image.getexif(image)
+    return image.width, image.height, str(exif.get(EXIF_DATETIME_TAG, ""))
+
+
+def apply_file_metadata(image, metadata, perceptual_hash=None):
+    """
+    Sets the file_size and file_hash of image from metadata, and passes the metadata (and the perceptual hash, if
+    already known) on to images using DuplicateFindingMixin so that it is not extracted again when the image is saved
+    """
+    image.file_size = metadata.size
+    image.file_hash = metadata.file_hash
+    if hasattr(image, "set_file_metadata"):
+        image.set_file_metadata(metadata, perceptual_hash=perceptual_hash)
+
+
+def is_perceptual_hashing_enabled():
+    """
+    Perceptual hashes are only read when looking for near duplicates, and take a full decode of the image, so they
+    are only computed as images are saved if WAGTAILIMAGEIMPORT_NEAR_DUPLICATE_DISTANCE is set. Otherwise they are
+    left for the backfill_duplicate_fields command to fill in
+    """
+    return (
+        getattr(settings, "WAGTAILIMAGEIMPORT_NEAR_DUPLICATE_DISTANCE", None)
+        is not None
+    )
+
+
+def compute_perceptual_hash(f):
+    """
+    Returns the 64 bit DCT perceptual hash of an image file as a hex string, or an empty string if the file can't
+    be read as an image. Unlike a hash of the file contents, the hashes of resized, recompressed or lightly
+    edited copies of an image differ in only a few bits, so near duplicates can be found by Hamming distance
+    """
+    try:
+        image = PIL.Image.open(f)
+        # let decoders which support it (such as JPEG) decode a scaled down image directly, which is much
+        # faster than decoding the full image only to resize it
+        image.draft("L", (HASH_IMAGE_SIZE * 4, HASH_IMAGE_SIZE * 4))
+        image = image.convert("L")
+        # cheaply shrink large images before the final, more expensive, resampling
+        image.thumbnail((HASH_IMAGE_SIZE * 4, HASH_IMAGE_SIZE * 4))
+        image = image.resize((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), PIL.Image.LANCZOS)
+    except OSError:
+        return ""
+    pixels = list(image.getdata())
+
+    if numpy is not None:
+        basis = numpy.array(DCT_BASIS)
+        grid = numpy.array(pixels, dtype=float).reshape(
+            HASH_IMAGE_SIZE, HASH_IMAGE_SIZE
+        )
+        frequencies = (basis @ grid @ basis.T).flatten()
+        bits = frequencies > numpy.median(frequencies)
+    else:
+        rows = [
+            pixels[index : index + HASH_IMAGE_SIZE]
+            for index in range(0, len(pixels), HASH_IMAGE_SIZE)
+        ]
+        # the DCT is separable: transform the rows, then the columns of the result
+        row_frequencies = [
+            [sum(b * p for b, p in zip(basis_row, row)) for basis_row in DCT_BASIS]
+            for row in rows
+        ]
+        frequencies = [
+            sum(
+                b * row_frequencies[pixel][column]
+                for pixel, b in enumerate(basis_row)
+            )
+            for basis_row in DCT_BASIS
+            for column in range(HASH_SIZE)
+        ]
+        median = statistics.median(frequencies)
+        bits = [frequency > median for frequency in frequencies]
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | bool(bit)
+    return "{:016x}".format(value)
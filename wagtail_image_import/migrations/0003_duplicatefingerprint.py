@@ -0,0 +1,68 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+from wagtail.images import get_image_model_string
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wagtail_image_import", "0002_driveidmapping"),
+        migrations.swappable_dependency(get_image_model_string()),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="driveidmapping",
+            name="drive_id",
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.CreateModel(
+            name="DuplicateFingerprint",
+            fields=[
+                (
+                    "image",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="duplicate_fingerprint",
+                        serialize=False,
+                        to=get_image_model_string(),
+                    ),
+                ),
+                ("drive_id", models.CharField(blank=True, default="", max_length=100)),
+                ("md5_hash", models.CharField(blank=True, default="", max_length=32)),
+                (
+                    "exif_datetime",
+                    models.CharField(blank=True, default="", max_length=100),
+                ),
+                ("title", models.CharField(blank=True, default="", max_length=255)),
+            ],
+            options={
+                "verbose_name": "Duplicate Fingerprint",
+                "verbose_name_plural": "Duplicate Fingerprints",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="duplicatefingerprint",
+            index=models.Index(
+                fields=["drive_id", "image"], name="wii_fingerprint_drive_id"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="duplicatefingerprint",
+            index=models.Index(
+                fields=["md5_hash", "image"], name="wii_fingerprint_md5_hash"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="duplicatefingerprint",
+            index=models.Index(
+                fields=["exif_datetime", "image"], name="wii_fingerprint_exif"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="duplicatefingerprint",
+            index=models.Index(fields=["title", "image"], name="wii_fingerprint_title"),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wagtail_image_import", "0005_pendingsearchindexupdate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="duplicatefingerprint",
+            name="perceptual_hash",
+            field=models.CharField(blank=True, default="", max_length=16),
+        ),
+        migrations.AddField(
+            model_name="duplicatefingerprint",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
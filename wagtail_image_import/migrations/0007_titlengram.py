@@ -0,0 +1,49 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+from wagtail.images import get_image_model_string
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wagtail_image_import", "0006_perceptual_hash"),
+        migrations.swappable_dependency(get_image_model_string()),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TitleNGram",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ngram", models.CharField(max_length=3)),
+                (
+                    "image",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=get_image_model_string(),
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Title N-Gram",
+                "verbose_name_plural": "Title N-Grams",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="titlengram",
+            index=models.Index(fields=["ngram", "image"], name="wii_title_ngram"),
+        ),
+        migrations.AlterUniqueTogether(
+            name="titlengram", unique_together={("image", "ngram")},
+        ),
+    ]
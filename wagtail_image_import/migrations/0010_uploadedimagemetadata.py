@@ -0,0 +1,45 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wagtailimages", "0022_uploadedimage"),
+        ("wagtail_image_import", "0009_chunkedupload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadedImageMetadata",
+            fields=[
+                (
+                    "uploaded_image",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="+",
+                        serialize=False,
+                        to="wagtailimages.UploadedImage",
+                    ),
+                ),
+                ("file_hash", models.CharField(max_length=40)),
+                ("md5_hash", models.CharField(max_length=32)),
+                ("size", models.PositiveIntegerField()),
+                ("width", models.IntegerField(blank=True, null=True)),
+                ("height", models.IntegerField(blank=True, null=True)),
+                (
+                    "exif_datetime",
+                    models.CharField(blank=True, default="", max_length=100),
+                ),
+                (
+                    "perceptual_hash",
+                    models.CharField(blank=True, default="", max_length=16),
+                ),
+            ],
+            options={
+                "verbose_name": "Uploaded Image Metadata",
+                "verbose_name_plural": "Uploaded Image Metadata",
+            },
+        ),
+    ]
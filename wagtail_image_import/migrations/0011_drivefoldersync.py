@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wagtailcore", "0026_group_collection_permission"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("wagtail_image_import", "0010_uploadedimagemetadata"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DriveFolderSync",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("folder_id", models.CharField(max_length=100, unique=True)),
+                (
+                    "page_token",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("last_synced_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "collection",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="wagtailcore.collection",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Drive Folder Sync",
+                "verbose_name_plural": "Drive Folder Syncs",
+            },
+        ),
+    ]
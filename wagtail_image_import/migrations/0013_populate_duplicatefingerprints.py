@@ -0,0 +1,66 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+from wagtail.images import get_image_model_string
+
+
+BATCH_SIZE = 1000
+
+
+def normalize_title(title):
+    # a frozen copy of wagtail_image_import.fingerprints.normalize_title, so that later changes to it don't
+    # change what this migration does
+    title = unicodedata.normalize("NFKC", str(title)).casefold()
+    return re.sub(r"\s+", " ", title).strip()
+
+
+def populate_fingerprints(apps, schema_editor):
+    """
+    Creates the missing duplicate fingerprints of images which existed before fingerprints were kept, so that
+    duplicates are found in existing libraries without running rebuild_duplicate_fingerprints
+    """
+    Image = apps.get_model(get_image_model_string())
+    DriveIDMapping = apps.get_model("wagtail_image_import", "DriveIDMapping")
+    DuplicateFingerprint = apps.get_model("wagtail_image_import", "DuplicateFingerprint")
+
+    def get_value(column, value):
+        if column == "title":
+            value = normalize_title(value)
+        max_length = DuplicateFingerprint._meta.get_field(column).max_length
+        return str(value or "")[:max_length]
+
+    fingerprinted_ids = set(
+        DuplicateFingerprint.objects.values_list("image_id", flat=True)
+    )
+    drive_ids = dict(DriveIDMapping.objects.values_list("image_id", "drive_id"))
+    fingerprints = []
+    for image in Image.objects.order_by("pk").iterator():
+        if image.pk in fingerprinted_ids:
+            continue
+        fingerprints.append(
+            DuplicateFingerprint(
+                image_id=image.pk,
+                drive_id=get_value("drive_id", drive_ids.get(image.pk)),
+                **{
+                    column: get_value(column, getattr(image, column, ""))
+                    for column in ["title", "md5_hash", "exif_datetime", "perceptual_hash"]
+                }
+            )
+        )
+        if len(fingerprints) >= BATCH_SIZE:
+            DuplicateFingerprint.objects.bulk_create(fingerprints)
+            fingerprints = []
+    DuplicateFingerprint.objects.bulk_create(fingerprints)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wagtail_image_import", "0012_drive_file_ledger"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_fingerprints, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,29 @@
-import hashlib
-import PIL, PIL.ExifTags
+import json
+import uuid
 
+from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext as _
 
 from wagtail.images import get_image_model_string
 
+from .instrumentation import stage
+from .metadata import (
+    FileMetadata,
+    compute_perceptual_hash,
+    extract_file_metadata,
+    is_perceptual_hashing_enabled,
+)
+
+
+# maps the Drive fields recorded when a file is imported, which change whenever its contents do, to the names of
+# the fields (and import data) they are recorded in
+LEDGER_FIELDS = {
+    "md5Checksum": "md5_checksum",
+    "headRevisionId": "head_revision_id",
+    "modifiedTime": "modified_time",
+}
+
 
 class DriveIDMapping(models.Model):
     """
@@ -13,18 +31,329 @@ class DriveIDMapping(models.Model):
     """
 
     image = models.OneToOneField(get_image_model_string(), on_delete=models.CASCADE)
-    drive_id = models.CharField(max_length=100)
+    drive_id = models.CharField(max_length=100, db_index=True)
+
+    # the state of the Drive file when the image was imported from it, used to skip reimporting unchanged files
+    md5_checksum = models.CharField(max_length=32, blank=True, default="")
+    head_revision_id = models.CharField(max_length=255, blank=True, default="")
+    modified_time = models.CharField(max_length=40, blank=True, default="")
+    # the file_hash of the image's file as imported, so that a file replaced since isn't mistaken for the import
+    file_hash = models.CharField(max_length=40, blank=True, default="")
 
     def __str__(self):
         return "{}: {}-{}".format(
             self._meta.verbose_name, self.image.title, self.drive_id
         )
 
+    def is_unchanged(self, file_data, image_file_hash):
+        """
+        Returns whether the Drive file given by file_data is the one the image was imported from, unchanged since,
+        and the image (whose current file_hash is image_file_hash) still has the file imported from it
+        """
+        if self.drive_id != file_data.get("id"):
+            return False
+        if not self.file_hash or self.file_hash != image_file_hash:
+            return False
+        return any(
+            getattr(self, field) and getattr(self, field) == file_data.get(drive_field)
+            for drive_field, field in LEDGER_FIELDS.items()
+        )
+
     class Meta:
         verbose_name = _("Drive ID Mapping")
         verbose_name_plural = "Drive ID Mappings"
 
 
+class DriveFolderSync(models.Model):
+    """
+    A Drive folder mirrored into a collection by the sync_drive_folders command, with the Drive changes page token
+    to list the changes made since it was last synced from
+    """
+
+    folder_id = models.CharField(max_length=100, unique=True)
+    collection = models.ForeignKey(
+        "wagtailcore.Collection", on_delete=models.CASCADE, related_name="+"
+    )
+    # the user the synced images are imported as
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    # empty until the first sync, which imports every image in the folder
+    page_token = models.CharField(max_length=255, blank=True, default="")
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "{}: {}".format(self._meta.verbose_name, self.folder_id)
+
+    class Meta:
+        verbose_name = _("Drive Folder Sync")
+        verbose_name_plural = "Drive Folder Syncs"
+
+
+class DuplicateFingerprint(models.Model):
+    """
+    An indexed copy of the fields of an image used for identifying duplicates, kept in sync by signal handlers
+    """
+
+    image = models.OneToOneField(
+        get_image_model_string(),
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="duplicate_fingerprint",
+    )
+    drive_id = models.CharField(max_length=100, blank=True, default="")
+    md5_hash = models.CharField(max_length=32, blank=True, default="")
+    exif_datetime = models.CharField(max_length=100, blank=True, default="")
+    # the normalized title - see fingerprints.normalize_title
+    title = models.CharField(max_length=255, blank=True, default="")
+    perceptual_hash = models.CharField(max_length=16, blank=True, default="")
+    # used to update in-memory near duplicate indexes with only the fingerprints changed since they were built
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return "{}: {}".format(self._meta.verbose_name, self.image_id)
+
+    class Meta:
+        verbose_name = _("Duplicate Fingerprint")
+        verbose_name_plural = "Duplicate Fingerprints"
+        # each index also covers the image id, so lookups can be answered from the index alone
+        indexes = [
+            models.Index(fields=["drive_id", "image"], name="wii_fingerprint_drive_id"),
+            models.Index(fields=["md5_hash", "image"], name="wii_fingerprint_md5_hash"),
+            models.Index(
+                fields=["exif_datetime", "image"], name="wii_fingerprint_exif"
+            ),
+            models.Index(fields=["title", "image"], name="wii_fingerprint_title"),
+        ]
+
+
+class TitleNGram(models.Model):
+    """
+    An entry in the inverted index of title trigrams used for fuzzy title matching - see fuzzy_titles.py
+    """
+
+    image = models.ForeignKey(
+        get_image_model_string(), on_delete=models.CASCADE, related_name="+"
+    )
+    ngram = models.CharField(max_length=3)
+
+    def __str__(self):
+        return "{}: {} ({})".format(self._meta.verbose_name, self.ngram, self.image_id)
+
+    class Meta:
+        verbose_name = _("Title N-Gram")
+        verbose_name_plural = "Title N-Grams"
+        unique_together = [("image", "ngram")]
+        # covers the image id, so posting lists can be read from the index alone
+        indexes = [models.Index(fields=["ngram", "image"], name="wii_title_ngram")]
+
+
+class ImportJob(models.Model):
+    """
+    An import queued to be run in the background by the run_import_worker management command
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _("Pending")),
+        (STATUS_RUNNING, _("Running")),
+        (STATUS_SUCCEEDED, _("Succeeded")),
+        (STATUS_FAILED, _("Failed")),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True
+    )
+    drive_id = models.CharField(max_length=100, blank=True, default="")
+    name = models.CharField(max_length=255, blank=True, default="")
+    action = models.CharField(max_length=20, default="keep")
+    wagtail_id = models.PositiveIntegerField(null=True, blank=True)
+    collection = models.ForeignKey(
+        "wagtailcore.Collection",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    # the file to import, stored until the job runs - if empty, the file is fetched from Drive using the oauth_token
+    uploaded_image = models.ForeignKey(
+        "wagtailimages.UploadedImage",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    md5_checksum = models.CharField(max_length=32, blank=True, default="")
+    head_revision_id = models.CharField(max_length=255, blank=True, default="")
+    modified_time = models.CharField(max_length=40, blank=True, default="")
+    oauth_token = models.TextField(blank=True, default="")
+    # the JSON encoded import result, as returned by the import views
+    result = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "{}: {} ({})".format(self._meta.verbose_name, self.name, self.status)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    def get_result(self):
+        return json.loads(self.result) if self.result else {}
+
+    def set_result(self, result):
+        self.result = json.dumps(result)
+
+    class Meta:
+        verbose_name = _("Import Job")
+        verbose_name_plural = "Import Jobs"
+
+
+class ChunkedUpload(models.Model):
+    """
+    A file being uploaded from the browser in chunks, which are appended to a temporary file until the upload is
+    finalized and the file imported with the stored import data
+    """
+
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    drive_id = models.CharField(max_length=100, blank=True, default="")
+    name = models.CharField(max_length=255, blank=True, default="")
+    action = models.CharField(max_length=20, default="keep")
+    wagtail_id = models.PositiveIntegerField(null=True, blank=True)
+    collection = models.ForeignKey(
+        "wagtailcore.Collection",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    md5_checksum = models.CharField(max_length=32, blank=True, default="")
+    head_revision_id = models.CharField(max_length=255, blank=True, default="")
+    modified_time = models.CharField(max_length=40, blank=True, default="")
+    size = models.BigIntegerField()
+    # the number of bytes written to the temporary file so far
+    received = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "{}: {} ({}/{})".format(
+            self._meta.verbose_name, self.name, self.received, self.size
+        )
+
+    def get_import_data(self):
+        return {
+            "drive_id": self.drive_id,
+            "name": self.name,
+            "action": self.action,
+            "wagtail_id": self.wagtail_id,
+            "collection": self.collection_id,
+            **{field: getattr(self, field) for field in LEDGER_FIELDS.values()},
+        }
+
+    class Meta:
+        verbose_name = _("Chunked Upload")
+        verbose_name_plural = "Chunked Uploads"
+
+
+class UploadedImageMetadata(models.Model):
+    """
+    The metadata of an UploadedImage's file, extracted while the file was at hand during the import, so that the
+    file needn't be read again when the UploadedImage is made into an image
+    """
+
+    uploaded_image = models.OneToOneField(
+        "wagtailimages.UploadedImage",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="+",
+    )
+    file_hash = models.CharField(max_length=40)
+    md5_hash = models.CharField(max_length=32)
+    size = models.PositiveIntegerField()
+    width = models.IntegerField(null=True, blank=True)
+    height = models.IntegerField(null=True, blank=True)
+    exif_datetime = models.CharField(max_length=100, blank=True, default="")
+    perceptual_hash = models.CharField(max_length=16, blank=True, default="")
+
+    def __str__(self):
+        return "{}: {}".format(self._meta.verbose_name, self.uploaded_image_id)
+
+    def get_file_metadata(self):
+        return FileMetadata(
+            file_hash=self.file_hash,
+            md5_hash=self.md5_hash,
+            size=self.size,
+            width=self.width,
+            height=self.height,
+            exif_datetime=self.exif_datetime,
+        )
+
+    class Meta:
+        verbose_name = _("Uploaded Image Metadata")
+        verbose_name_plural = "Uploaded Image Metadata"
+
+
+class PendingSearchIndexUpdate(models.Model):
+    """
+    An image waiting to be added to the search backends in bulk, rather than being indexed as part of the request
+    which changed it
+    """
+
+    image = models.OneToOneField(
+        get_image_model_string(),
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="+",
+    )
+    # the user whose import session changed the image, so that their session can flush its own updates
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    queued_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "{}: {}".format(self._meta.verbose_name, self.image_id)
+
+    class Meta:
+        verbose_name = _("Pending Search Index Update")
+        verbose_name_plural = "Pending Search Index Updates"
+
+
+class BackfillProgress(models.Model):
+    """
+    How far a run of the backfill_duplicate_fields command has got through the images, in pk order, so that an
+    interrupted run can carry on where it stopped
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    last_image_id = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "{}: {} ({})".format(
+            self._meta.verbose_name, self.name, self.last_image_id
+        )
+
+    class Meta:
+        verbose_name = _("Backfill Progress")
+        verbose_name_plural = "Backfill Progress"
+
+
 class DuplicateFindingMixin(models.Model):
     """
     Exposes additional fields for duplicate finding if applied to a custom image model
@@ -34,30 +363,89 @@ class DuplicateFindingMixin(models.Model):
 
     exif_datetime = models.CharField(max_length=100, blank=True, default="")
 
+    perceptual_hash = models.CharField(max_length=16, blank=True, default="")
+
+    _file_metadata = None
+    _perceptual_hash = None
+    # the (file name, file hash) of the image when it was loaded from the database
+    _loaded_file_state = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(DuplicateFindingMixin, cls).from_db(db, field_names, values)
+        loaded_values = dict(zip(field_names, values))
+        if "file" in loaded_values and "file_hash" in loaded_values:
+            instance._loaded_file_state = (
+                loaded_values["file"],
+                loaded_values["file_hash"],
+            )
+        return instance
+
     def save(self, *args, **kwargs):
         update_fields = kwargs.get("update_fields", [])
-        update_file = not bool(update_fields) or ("file" in update_fields)
-        update_exif = not bool(update_fields) or (
-            update_file or "exif_datetime" in update_fields
-        )
-        update_md5_hash = not bool(update_fields) or (
-            update_file or "md5_hash" in update_fields
+        if update_fields:
+            update_file = "file" in update_fields
+            update_exif = update_file or "exif_datetime" in update_fields
+            update_md5_hash = update_file or "md5_hash" in update_fields
+            update_perceptual_hash = update_file or "perceptual_hash" in update_fields
+        else:
+            # metadata edits (such as titles, tags or focal points) leave the file as it is, so only extract
+            # its metadata again if the file has changed
+            file_changed = self.has_file_changed()
+            update_exif = update_md5_hash = update_perceptual_hash = file_changed
+        if update_exif or update_md5_hash:
+            metadata = self.get_file_metadata()
+            if update_exif:
+                self.exif_datetime = metadata.exif_datetime
+            if update_md5_hash:
+                self.md5_hash = metadata.md5_hash
+        if update_perceptual_hash:
+            if self._perceptual_hash is not None:
+                self.perceptual_hash = self._perceptual_hash
+            elif is_perceptual_hashing_enabled():
+                self.perceptual_hash = self.get_perceptual_hash()
+            else:
+                # clear the hash of the old file, for backfill_duplicate_fields to replace
+                self.perceptual_hash = ""
+        self._file_metadata = None
+        self._perceptual_hash = None
+        result = super(DuplicateFindingMixin, self).save(*args, **kwargs)
+        self._loaded_file_state = (self.file.name, self.file_hash)
+        return result
+
+    def has_file_changed(self):
+        """
+        Returns whether the file may differ from the one the md5_hash and exif_datetime were extracted from
+        """
+        if (
+            self._state.adding
+            or self._loaded_file_state is None
+            or self._file_metadata is not None
+            or not self.md5_hash
+        ):
+            return True
+        return not self.file._committed or self._loaded_file_state != (
+            self.file.name,
+            self.file_hash,
         )
-        if update_exif:
-            self.exif_datetime = self._get_exif_datetime()
-        if update_md5_hash:
-            self.md5_hash = self._get_md5_hash()
-        return super(DuplicateFindingMixin, self).save(*args, **kwargs)
-
-    def _get_exif_datetime(self):
-        for key, descriptor in PIL.ExifTags.TAGS.items():
-            if descriptor == "DateTime":
-                return PIL.Image.open(self.file).getexif().get(key, "")
-
-    def _get_md5_hash(self):
-        with self.open_file() as f:
-            md5_hash = hashlib.md5(f.read()).hexdigest()
-        return md5_hash
+
+    def set_file_metadata(self, metadata, perceptual_hash=None):
+        """
+        Provides already extracted FileMetadata, and optionally the perceptual hash, for the next save, so the file
+        does not need to be read again
+        """
+        self._file_metadata = metadata
+        self._perceptual_hash = perceptual_hash
+
+    def get_file_metadata(self):
+        if self._file_metadata is None:
+            with self.open_file() as f:
+                self._file_metadata = extract_file_metadata(f)
+        return self._file_metadata
+
+    def get_perceptual_hash(self):
+        with stage("perceptual_hash"), self.open_file() as f:
+            return compute_perceptual_hash(f)
 
     class Meta:
         abstract = True
@@ -0,0 +1,197 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.utils import timezone
+
+from wagtail.images import get_image_model
+
+from .drive import DriveFetchError, fetch_drive_thumbnail
+from .metadata import compute_perceptual_hash
+from .models import DuplicateFingerprint
+
+
+# the index is rebuilt from scratch at this interval, in case a fingerprint change was missed by the incremental
+# updates (for example, one committed by a long running transaction after the index was last updated)
+INDEX_REBUILD_INTERVAL = timedelta(hours=1)
+
+# incremental updates also fetch fingerprints changed this long before the previous update, to allow for
+# transactions committed after it with earlier timestamps. Reapplying a fingerprint has no effect
+INDEX_UPDATE_OVERLAP = timedelta(minutes=1)
+
+# the number of Drive thumbnails downloaded at once when hashing them
+THUMBNAIL_FETCH_THREADS = 8
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    A Burkhard-Keller tree of integer hashes, for finding all hashes within a Hamming distance of a given hash
+    without comparing against every hash. Each child of a node is keyed by its distance from that node, so by
+    the triangle inequality a search only needs to descend into children whose keys are within the search
+    distance of the distance to the node
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+        node = self.root
+        while True:
+            node_value, items, children = node
+            distance = hamming_distance(value, node_value)
+            if distance == 0:
+                items.append(item)
+                return
+            if distance not in children:
+                children[distance] = (value, [item], {})
+                return
+            node = children[distance]
+
+    def search(self, value, max_distance):
+        """
+        Returns a list of (distance, value, item) for every item whose value is within max_distance of value
+        """
+        results = []
+        if self.root is None:
+            return results
+        nodes = [self.root]
+        while nodes:
+            node_value, items, children = nodes.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                results.extend((distance, node_value, item) for item in items)
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+        return results
+
+
+class PerceptualHashIndex:
+    """
+    An in-memory BK-tree of the perceptual hashes in the DuplicateFingerprint table. Before each search, only the
+    fingerprints changed since the last search are loaded. Items can't be removed from a BK-tree, so replaced
+    hashes are left in the tree and filtered out of results, until they make up half of the tree or the rebuild
+    interval passes and the tree is rebuilt. Deleted images may also be returned, so results must be checked
+    against the database
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tree = None
+
+    def reset(self):
+        with self.lock:
+            self.tree = None
+
+    def rebuild(self):
+        self.tree = BKTree()
+        self.hashes = {}
+        self.built_at = timezone.now()
+        self.updated_at = self.built_at
+        self.add_fingerprints(
+            DuplicateFingerprint.objects.exclude(perceptual_hash="")
+        )
+
+    def update(self):
+        now = timezone.now()
+        if (
+            self.tree is None
+            or now - self.built_at > INDEX_REBUILD_INTERVAL
+            or self.tree.size > 2 * len(self.hashes) + 100
+        ):
+            self.rebuild()
+            return
+        changed = DuplicateFingerprint.objects.filter(
+            updated_at__gte=self.updated_at - INDEX_UPDATE_OVERLAP
+        )
+        self.updated_at = now
+        self.add_fingerprints(changed)
+
+    def add_fingerprints(self, queryset):
+        for image_id, perceptual_hash in queryset.values_list(
+            "image_id", "perceptual_hash"
+        ).iterator():
+            value = int(perceptual_hash, 16) if perceptual_hash else None
+            if self.hashes.get(image_id) == value:
+                continue
+            if value is None:
+                self.hashes.pop(image_id, None)
+            else:
+                self.hashes[image_id] = value
+                self.tree.add(value, image_id)
+
+    def search(self, perceptual_hashes, max_distance):
+        """
+        Returns a list of the pks of the images with the nearest perceptual hash within max_distance of each
+        hex hash in perceptual_hashes (or None), breaking ties by the lowest pk
+        """
+        with self.lock:
+            self.update()
+            nearest = []
+            for perceptual_hash in perceptual_hashes:
+                if not perceptual_hash:
+                    nearest.append(None)
+                    continue
+                matches = [
+                    (distance, image_id)
+                    for distance, value, image_id in self.tree.search(
+                        int(perceptual_hash, 16), max_distance
+                    )
+                    # skip hashes which have since been replaced
+                    if self.hashes.get(image_id) == value
+                ]
+                nearest.append(min(matches)[1] if matches else None)
+            return nearest
+
+
+perceptual_hash_index = PerceptualHashIndex()
+
+
+def has_perceptual_hashes():
+    return any(
+        field.name == "perceptual_hash" for field in get_image_model()._meta.fields
+    )
+
+
+def get_drive_perceptual_hash(thumbnail_link, oauth_token):
+    if not thumbnail_link:
+        return ""
+    try:
+        content = fetch_drive_thumbnail(thumbnail_link, oauth_token)
+    except DriveFetchError:
+        return ""
+    return compute_perceptual_hash(io.BytesIO(content))
+
+
+def get_near_duplicates(image_data_list, oauth_token, max_distance):
+    """
+    Finds the image with the nearest perceptual hash to each item in image_data_list, by hashing the Drive
+    thumbnail of each item. Returns a list of images (or None where there is no image within max_distance)
+    in the same order
+    """
+    with ThreadPoolExecutor(max_workers=THUMBNAIL_FETCH_THREADS) as executor:
+        perceptual_hashes = list(
+            executor.map(
+                lambda image_data: get_drive_perceptual_hash(
+                    image_data.get("thumbnailLink"), oauth_token
+                ),
+                image_data_list,
+            )
+        )
+    image_ids = perceptual_hash_index.search(perceptual_hashes, max_distance)
+    images = (
+        get_image_model()
+        .objects.select_related("driveidmapping")
+        .in_bulk([image_id for image_id in image_ids if image_id is not None])
+    )
+    return [images.get(image_id) for image_id in image_ids]
@@ -0,0 +1,72 @@
+from django.db.models.signals import post_delete, post_save
+from django.test.signals import setting_changed
+
+from wagtail.images import get_image_model
+
+from .duplicate_backends import get_duplicate_backend, reset_duplicate_backend
+from .duplicate_cache import invalidate_drive_ids, invalidate_image
+from .fingerprints import update_fingerprint, update_fingerprint_drive_id
+from .fuzzy_titles import is_fuzzy_title_matching_enabled, update_title_ngrams
+from .models import DriveIDMapping, DuplicateFingerprint
+from .utils import reset_duplicate_scoring_plan
+
+
+FINGERPRINTED_IMAGE_FIELDS = {
+    "title",
+    "file",
+    "md5_hash",
+    "exif_datetime",
+    "perceptual_hash",
+}
+
+
+def post_save_image_signal_handler(instance, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not (
+        FINGERPRINTED_IMAGE_FIELDS & set(update_fields)
+    ):
+        return
+    invalidate_image(instance)
+    update_fingerprint(instance)
+    get_duplicate_backend().refresh_images([instance.pk])
+    if is_fuzzy_title_matching_enabled() and (
+        update_fields is None or "title" in update_fields
+    ):
+        update_title_ngrams(instance.pk, instance.title)
+
+
+def post_delete_image_signal_handler(instance, **kwargs):
+    invalidate_image(instance)
+    get_duplicate_backend().remove_images([instance.pk])
+
+
+def post_save_drive_id_mapping_signal_handler(instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_drive_ids({instance.image_id: instance.drive_id})
+    update_fingerprint_drive_id(instance.image_id, instance.drive_id)
+    get_duplicate_backend().refresh_images([instance.image_id])
+
+
+def post_delete_drive_id_mapping_signal_handler(instance, **kwargs):
+    invalidate_drive_ids({instance.image_id: instance.drive_id})
+    # only clear existing fingerprints: when the image itself is being deleted, its fingerprint is removed too
+    DuplicateFingerprint.objects.filter(image_id=instance.image_id).update(
+        drive_id=""
+    )
+    get_duplicate_backend().refresh_images([instance.image_id])
+
+
+def register_signal_handlers():
+    post_save.connect(post_save_image_signal_handler, sender=get_image_model())
+    post_delete.connect(post_delete_image_signal_handler, sender=get_image_model())
+    post_save.connect(
+        post_save_drive_id_mapping_signal_handler, sender=DriveIDMapping
+    )
+    post_delete.connect(
+        post_delete_drive_id_mapping_signal_handler, sender=DriveIDMapping
+    )
+    # recompile the duplicate scoring plan when its settings are overridden in tests
+    setting_changed.connect(reset_duplicate_scoring_plan)
+    setting_changed.connect(reset_duplicate_backend)
@@ -1 +1,2 @@
-!function(e){var t={};function n(a){if(t[a])return t[a].exports;var l=t[a]={i:a,l:!1,exports:{}};return e[a].call(l.exports,l,l.exports,n),l.l=!0,l.exports}n.m=e,n.c=t,n.d=function(e,t,a){n.o(e,t)||Object.defineProperty(e,t,{enumerable:!0,get:a})},n.r=function(e){"undefined"!=typeof Symbol&&Symbol.toStringTag&&Object.defineProperty(e,Symbol.toStringTag,{value:"Module"}),Object.defineProperty(e,"__esModule",{value:!0})},n.t=function(e,t){if(1&t&&(e=n(e)),8&t)return e;if(4&t&&"object"==typeof e&&e&&e.__esModule)return e;var a=Object.create(null);if(n.r(a),Object.defineProperty(a,"default",{enumerable:!0,value:e}),2&t&&"string"!=typeof e)for(var l in e)n.d(a,l,function(t){return e[t]}.bind(null,l));return a},n.n=function(e){var t=e&&e.__esModule?function(){return e.default}:function(){return e};return n.d(t,"a",t),t},n.o=function(e,t){return Object.prototype.hasOwnProperty.call(e,t)},n.p="",n(n.s=0)}([function(e,t){const n=window.React,a=window.ReactDOM,l=window.wagtail.components.Icon;function r(e){const[t,a]=n.useState([]),[l,r]=n.useState(void 0),[c,s]=n.useState(void 0),[u,p]=n.useState(e.collections[0][0]);return t&&t.length?l?n.createElement(i,{imageImports:t.map(e=>{const t=e.id;return l[t],imageImport={drive_id:t,name:e.name,progress:0,action:l[t]||"keep",thumbnail:e.thumbnailLink,wagtail_id:"replace"==l[t]?c[t].wagtail_id:null}}).filter(e=>!("cancel"==e.action)),csrfToken:e.csrfToken,collection:u,tagitOpts:e.tagitOpts,indexUrl:e.indexUrl}):n.createElement(d,{imageData:t,duplicateReviewUrl:e.duplicateReviewUrl,onConfirmDuplicateActions:r,onGetDuplicateData:s}):n.createElement(n.Fragment,null,n.createElement(m,{appId:e.appId,pickerApiKey:e.pickerApiKey,clientId:e.clientId,scope:"https://www.googleapis.com/auth/documents.readonly https://www.googleapis.com/auth/drive.readonly",onGetImageData:a,driveParent:e.driveParent||"root"}),n.createElement(o,{collections:e.collections,selected:u,onChange:e=>{p(e.target.value)}}))}function o(e){return n.createElement("div",{class:"field nice-padding import-selector"},n.createElement("label",{for:"id_addimage_collection"},"Add to collection:"),n.createElement("div",{class:"field-content"},n.createElement("select",{id:"id_addimage_collection",name:"collection",value:e.selected,onChange:e.onChange},e.collections.map(e=>n.createElement("option",{value:e[0]},e[1])))))}function i(e){const[t,a]=n.useState(!1),[l,r]=n.useState(e.imageImports),o=gapi.auth2.getAuthInstance().currentUser.get().getAuthResponse().access_token;function i(e,t,n){let a=[...l];a[n][e]=t,r(a)}function s(t,n){a(!0);var l=new XMLHttpRequest;l.addEventListener("load",r=>{i("progress",50,n),function(t,n,l){let r=new FormData;r.append("drive_id",n.drive_id),r.append("wagtail_id",n.wagtail_id),r.append("action",n.action),r.append("name",n.name),r.append("collection",e.collection),r.append("image_file",t);var o=new XMLHttpRequest;o.addEventListener("load",async e=>{let t=await o.response;t=JSON.parse(t),i("imported",!0,l),a(!1),i("error",t.error,l),i("form",t.form,l),i("edit_action",t.edit_action,l),i("delete_action",t.delete_action,l),i("progress",100,l)}),o.addEventListener("error",async e=>{a(!1),i("error","Failed to upload to Wagtail",l)}),o.upload.addEventListener("progress",e=>{e.lengthComputable&&i("progress",Math.round(50+100*e.loaded/(2*e.total)),l)}),o.open("POST",window.location),o.setRequestHeader("X-CSRFToken",e.csrfToken),o.setRequestHeader("HTTP_X_REQUESTED_WITH","XMLHttpRequest"),o.send(r)}(new File([l.response],t.name),t,n)}),l.addEventListener("error",()=>{i("progress",0,n),a(!1),i("error","Failed to import from Google",n)}),l.addEventListener("progress",e=>{e.lengthComputable&&i("progress",Math.round(100*e.loaded/(2*e.total)),n)}),l.open("GET","https://www.googleapis.com/drive/v3/files/"+t.drive_id+"?alt=media"),l.responseType="blob",l.setRequestHeader("Authorization","Bearer "+o),l.send()}n.useEffect(()=>{if(!t){const e=l.findIndex(e=>!e.error&&!e.imported),t=l[e];t&&s(t,e)}},[t]);const d=l.reduce((e,t)=>e+t.progress/l.length,0),u=l.map((function(t,a){return t.finished?null:n.createElement(c,{key:t.id,imageImport:t,onFormResponseError:e=>{i("error",e.error,a),i("form",e.form,a),i("edit_action",e.edit_action,a),i("delete_action",e.delete_action,a)},onFormResponseSuccess:e=>{i("finished",!0,a),i("error",e.error,a),i("form",e.form,a),i("edit_action",e.edit_action,a),i("delete_action",e.delete_action,a)},onDeleteResponseLoad:e=>{i("finished",!0,a),i("error",e.error,a),i("form",e.form,a),i("edit_action",e.edit_action,a),i("delete_action",e.delete_action,a)},csrfToken:e.csrfToken,tagitOpts:e.tagitOpts})}));return n.createElement("div",{class:"nice-padding"},n.createElement("h2",null,"Image import"),n.createElement("div",{id:"overall-progress","aria-valuenow":Math.round(d),class:"progress progress-secondary active"},n.createElement("div",{class:"bar",style:{width:d+"%"}},Math.round(d)+"%")),u.filter(e=>null!==e).length>0?n.createElement("ul",{id:"upload-list",class:"upload-list multiple"},u):n.createElement("a",{href:e.indexUrl,class:"button button-return"},"Return to image index"))}function c(e){return n.createElement("li",{class:"row upload-uploading"},n.createElement("div",{class:"left col3"},n.createElement("div",{class:"preview"},n.createElement("div",{class:"thumb icon icon-image hasthumb"},n.createElement("img",{src:e.imageImport.thumbnail})),e.imageImport.imported?null:n.createElement("div",{class:"progress active"},n.createElement("div",{class:"bar",style:{width:e.imageImport.progress+"%"}},e.imageImport.progress,"%")))),n.createElement("div",{class:"right col9"},n.createElement("p",null,e.imageImport.name),n.createElement("p",{class:e.imageImport.error?"status-msg failure":"status-msg success"},e.imageImport.error||!e.imageImport.imported?e.imageImport.error:"Image successfully imported. Please update this image with a more appropriate title, if necessary. You may also delete the image completely if the import wasn't required."),e.imageImport.form?n.createElement(s,{imageImport:e.imageImport,onFormResponseError:e.onFormResponseError,onFormResponseSuccess:e.onFormResponseSuccess,onDeleteResponseLoad:e.onDeleteResponseLoad,csrfToken:e.csrfToken,tagitOpts:e.tagitOpts}):null))}function s(e){const t=n.useRef(null);return n.useLayoutEffect(()=>{if(t.current){const n=$(".tag_field input",t.current);if(n)return n.tagit(e.tagitOpts),()=>{n.tagit("destroy")}}},[e.imageImport.form]),n.createElement("form",{method:"POST",enctype:"multipart/form-data",novalidate:!0,ref:t,onSubmit:function(t){t.preventDefault();var n=new XMLHttpRequest;n.addEventListener("load",async t=>{t.preventDefault(),res=await n.response,res=JSON.parse(res),res.error?e.onFormResponseError(res):e.onFormResponseSuccess(res)}),n.open("POST",e.imageImport.edit_action),n.setRequestHeader("X-CSRFToken",e.csrfToken),n.setRequestHeader("HTTP_X_REQUESTED_WITH","XMLHttpRequest"),n.send(new FormData(t.target))}},n.createElement("ul",{class:"fields",dangerouslySetInnerHTML:{__html:e.imageImport.form}}),n.createElement("ul",{class:"fields"},n.createElement("li",null,n.createElement("input",{type:"hidden",name:"drive_id",value:e.imageImport.driveId}),n.createElement("input",{type:"submit",value:"Update",class:"button"}),n.createElement("button",{class:"delete button button-secondary no",onClick:function(t){t.preventDefault();var n=new XMLHttpRequest;n.addEventListener("load",async t=>{t.preventDefault(),res=await n.response,res=JSON.parse(res),e.onDeleteResponseLoad(res)}),n.open("POST",e.imageImport.edit_action),n.setRequestHeader("X-CSRFToken",e.csrfToken),n.setRequestHeader("HTTP_X_REQUESTED_WITH","XMLHttpRequest"),n.send()}},"Delete"))))}function d(e){const[t,a]=n.useState({}),[l,r]=n.useState({});if(n.useEffect(()=>{const t=JSON.stringify(e.imageData);fetch(e.duplicateReviewUrl,{method:"post",headers:{Accept:"application/json, text/plain, */*","Content-Type":"application/json"},body:t}).then(t=>{t.ok?t.json().then(t=>{a(t),e.onGetDuplicateData(t);let n=Object.keys(t),l={};for(let e=0;e<n.length;e++)l[n[e]]="replace";r(l),0==n.length&&e.onConfirmDuplicateActions({})}):console.error(t)}).catch(e=>{console.error(e)})},[e.selectedImageData]),t&&Object.keys(t).length>0){let a=!0;getGlobalAction=()=>a?l[Object.keys(l)[0]]:null,setGlobalAction=e=>{let t={};const n=Object.keys(l);for(let a=0;a<n.length;a++)t[n[a]]=e;r(t)};let o=[],i=null,c=null;const s=e.imageData.entries();for(const[e,d]of s){const e=d.id;if(e in t){c=l[e],a&&null!==i&&c!=i&&(a=!1);const s=t[e],m=d;o.push(n.createElement("tr",null,n.createElement("td",null,n.createElement(p,{driveDuplicate:m,wagtailDuplicate:s})),n.createElement(u,{action:c,onClick:t=>{let n={...l};n[e]=t.target.value,r(n)}}))),i=c}}return n.createElement(n.Fragment,null,n.createElement("div",{class:"nice-padding"},n.createElement("h2",{class:"icon icon-warning"},"Duplicates detected"),n.createElement("p",null,"Wagtail has detected images similar to the ones you have just chosen to upload"),n.createElement("p",null,"Please choose how you would like to proceed"),n.createElement("p",null,n.createElement("b",null,Object.keys(t).length," duplicates detected")),n.createElement("table",{class:"listing"},n.createElement("thead",null,n.createElement("tr",{class:"table-headers"},n.createElement("th",null),n.createElement("th",null,"Replace original image"),n.createElement("th",null,"Keep both images"),n.createElement("th",null,"Cancel upload"))),n.createElement("tbody",null,n.createElement("tr",null,n.createElement("td",null),n.createElement(u,{action:getGlobalAction(),onClick:e=>{setGlobalAction(e.target.value)}})),o))),n.createElement("footer",null,n.createElement("ul",null,n.createElement("li",{class:"actions"},n.createElement("button",{type:"submit",class:"button",onClick:()=>e.onConfirmDuplicateActions(l)},"Confirm all")))))}return n.createElement("div",{class:"nice-padding"},n.createElement(g,{message:"Identifying duplicates"}))}function u(e){return n.createElement(n.Fragment,null,n.createElement("td",null,n.createElement("input",{type:"radio",value:"replace",checked:"replace"==e.action,onClick:e.onClick})),n.createElement("td",null,n.createElement("input",{type:"radio",value:"keep",checked:"keep"==e.action,onClick:e.onClick})),n.createElement("td",null,n.createElement("input",{type:"radio",value:"cancel",checked:"cancel"==e.action,onClick:e.onClick})))}function p(e){return n.createElement("table",{class:"image-comparison"},n.createElement("thead",null,n.createElement("tr",{class:"image-headings"},n.createElement("th",null,"Original"),n.createElement("th",null,"New"))),n.createElement("tbody",null,n.createElement("tr",null,n.createElement("td",null,n.createElement("img",{src:e.wagtailDuplicate.thumbnail,width:"165",height:"165"})),n.createElement("td",null,n.createElement("img",{src:e.driveDuplicate.thumbnailLink,width:"165",height:"165"}))),n.createElement("tr",null,n.createElement("td",null,n.createElement("p",null,n.createElement("b",null,e.wagtailDuplicate.title))),n.createElement("td",null,n.createElement("p",null,n.createElement("b",null,e.driveDuplicate.name)))),n.createElement("tr",null,n.createElement("td",null,n.createElement("p",null,"Created at ",e.wagtailDuplicate.created_at)),n.createElement("td",null))))}function m(e){const[t,a]=n.useState(!1);function l(e,t,n){return e.type==google.picker.Type.PHOTO}function r(e,t,n){return e.type==google.picker.Type.jG}async function o(t){if(t.action==google.picker.Action.PICKED){const n=t.docs.filter(l),a=t.docs.filter(r);let o=new Array;if(a&&a.length){const e=`(mimeType contains 'image/') and (${a.reduce((e,t)=>e+`('${t.id}' in parents) or `,"").slice(0,-4)})`;let t=await gapi.client.drive.files.list({q:e,pageSize:1e3,fields:"nextPageToken, files(id, name, thumbnailLink, fileExtension, md5Checksum, size, imageMediaMetadata, webContentLink)"});o.push(...t.result.files)}if(n&&n.length)for(let e=0;e<n.length;e++){let t=await gapi.client.drive.files.get({fileId:n[e].id,fields:"id, name, thumbnailLink, fileExtension, md5Checksum, size, imageMediaMetadata, webContentLink"});o.push(t.result)}e.onGetImageData(o)}}return n.useEffect(()=>{gapi.load("client:auth2:picker",()=>{gapi.client.init({apiKey:e.pickerApiKey,clientId:e.clientId,discoveryDocs:["https://docs.googleapis.com/$discovery/rest?version=v1","https://www.googleapis.com/discovery/v1/apis/drive/v3/rest"],scope:e.scope}).then(()=>{a(!0)}).catch(e=>{console.error(e)})})},[]),t?n.createElement("div",{class:"nice-padding import-selector"},n.createElement("button",{class:"button bicolor icon icon-plus",onClick:function(){(function(){const t=gapi.auth2.getAuthInstance();return t.isSignedIn.get()?Promise.resolve(t.currentUser.get().getAuthResponse()):t.signIn({scope:e.scope}).then(e=>e.getAuthResponse())})().then(t=>function(t,n){let a=new google.picker.DocsView(google.picker.ViewId.DOCS_IMAGES);a.setSelectFolderEnabled(!0),a.setIncludeFolders(!0),a.setParent(e.driveParent),(new google.picker.PickerBuilder).setAppId(e.appId).enableFeature(google.picker.Feature.MULTISELECT_ENABLED).setDeveloperKey(e.pickerApiKey).setOAuthToken(t).addView(a).setCallback(n).build().setVisible(!0)}(t.access_token,o))}},"Select an image or folder in Drive")):n.createElement("div",{class:"nice-padding import-selector"},n.createElement(g,{message:"Loading Google API"}))}const g=e=>n.createElement("span",null,n.createElement(l,{name:"spinner",className:"c-spinner"}),e.message),f=document.querySelector("#importer");a.render(n.createElement(r,{appId:f.dataset.appId,pickerApiKey:f.dataset.pickerApiKey,clientId:f.dataset.clientId,duplicateReviewUrl:f.dataset.duplicateReviewUrl,csrfToken:document.querySelector("[name=csrfmiddlewaretoken]").value,collections:JSON.parse(f.dataset.collections),tagitOpts:{autocomplete:{source:f.dataset.autocompleteUrl}},driveParent:f.dataset.driveParent,indexUrl:f.dataset.indexUrl}),f)}]);
\ No newline at end of file
+(function(e){var t={};function n(a){if(t[a])return t[a].exports;var l=t[a]={i:a,l:!1,exports:{}};return e[a].call(l.exports,l,l.exports,n),l.l=!0,l.exports}n.m=e,n.c=t,n.d=function(e,t,a){n.o(e,t)||Object.defineProperty(e,t,{enumerable:!0,get:a})},n.r=function(e){typeof Symbol<`u`&&Symbol.toStringTag&&Object.defineProperty(e,Symbol.toStringTag,{value:`Module`}),Object.defineProperty(e,`__esModule`,{value:!0})},n.t=function(e,t){if(1&t&&(e=n(e)),8&t||4&t&&typeof e==`object`&&e&&e.__esModule)return e;var a=Object.create(null);if(n.r(a),Object.defineProperty(a,`default`,{enumerable:!0,value:e}),2&t&&typeof e!=`string`)for(var l in e)n.d(a,l,function(t){return e[t]}.bind(null,l));return a},n.n=function(e){var t=e&&e.__esModule?function(){return e.default}:function(){return e};return n.d(t,`a`,t),t},n.o=function(e,t){return Object.prototype.hasOwnProperty.call(e,t)},n.p=``,n(n.s=0)})([function(e,t){let React=window.React,ReactDOM=window.ReactDOM,Icon=window.wagtail.components.Icon;function Importer(props){let[selectedImageData,setSelectedImageData]=React.useState([]),[duplicateActions,setDuplicateActions]=React.useState(void 0),[duplicateData,setDuplicateData]=React.useState(void 0),[collection,setCollection]=React.useState(props.collections[0][0]);function getImageImports(){return selectedImageData.map(data=>{let id=data.id,duplicateAction=duplicateActions[id];return imageImport={drive_id:id,name:data.name,progress:0,action:duplicateActions[id]||`keep`,thumbnail:data.thumbnailLink,size:data.size,md5_checksum:data.md5Checksum||``,head_revision_id:data.headRevisionId||``,modified_time:data.modifiedTime||``,wagtail_id:duplicateActions[id]==`replace`?duplicateData[id].wagtail_id:null,unchanged:duplicateActions[id]==`replace`&&duplicateData[id].unchanged}}).filter(imageImport2=>imageImport2.action!=`cancel`)}return selectedImageData&&selectedImageData.length?duplicateActions?React.createElement(FileImporter,{imageImports:getImageImports(),csrfToken:props.csrfToken,collection,tagitOpts:props.tagitOpts,indexUrl:props.indexUrl,serverSideDriveFetch:props.serverSideDriveFetch,driveFetchProgressUrl:props.driveFetchProgressUrl,maxConcurrentImports:props.maxConcurrentImports,maxBufferedBytes:props.maxBufferedBytes,importJobsUrl:props.importJobsUrl,importJobPollInterval:props.importJobPollInterval,deferSearchIndexing:props.deferSearchIndexing,flushSearchIndexUrl:props.flushSearchIndexUrl,chunkedUploadUrl:props.chunkedUploadUrl,chunkedUploadThreshold:props.chunkedUploadThreshold,bulkImportUrl:props.bulkImportUrl,importBatchSize:props.importBatchSize}):React.createElement(DuplicateIdentifier,{imageData:selectedImageData,duplicateReviewUrl:props.duplicateReviewUrl,onConfirmDuplicateActions:setDuplicateActions,onGetDuplicateData:setDuplicateData}):React.createElement(React.Fragment,null,React.createElement(DriveSelector,{appId:props.appId,pickerApiKey:props.pickerApiKey,clientId:props.clientId,scope:`https://www.googleapis.com/auth/documents.readonly https://www.googleapis.com/auth/drive.readonly`,onGetImageData:setSelectedImageData,driveParent:props.driveParent||`root`}),React.createElement(CollectionSelector,{collections:props.collections,selected:collection,onChange:e=>{setCollection(e.target.value)}}))}function CollectionSelector(props){return React.createElement(`div`,{class:`field nice-padding import-selector`},React.createElement(`label`,{for:`id_addimage_collection`},`Add to collection:`),React.createElement(`div`,{class:`field-content`},React.createElement(`select`,{id:`id_addimage_collection`,name:`collection`,value:props.selected,onChange:props.onChange},props.collections.map(collection=>React.createElement(`option`,{value:collection[0]},collection[1])))))}let MAX_IMPORT_ATTEMPTS=3,RETRY_DELAY=1e3,RETRYABLE_UPLOAD_STATUSES=[502,503,504];function isRetryableUploadStatus(status){return RETRYABLE_UPLOAD_STATUSES.includes(status)}class ImportError extends Error{constructor(message,retryable){super(message),this.retryable=retryable}}function FileImporter(props){let[imageImports,setImageImports]=React.useState(props.imageImports),[finishedCount,setFinishedCount]=React.useState(0),startedImports=React.useRef(/* @__PURE__ */ new Set),activeImports=React.useRef(/* @__PURE__ */ new Set),bufferedBytes=React.useRef(0),pendingJobs=React.useRef(/* @__PURE__ */ new Map),jobPoller=React.useRef(null),chunkedUploads=React.useRef(/* @__PURE__ */ new Map),downloadedFiles=React.useRef(/* @__PURE__ */ new Map),importBatch=React.useRef([]),oauthToken=gapi.auth2.getAuthInstance().currentUser.get().getAuthResponse().access_token;function setImageParam(paramName,paramValue,index){setImageImports(imageImports2=>{let newImageImports=[...imageImports2];return newImageImports[index]={...newImageImports[index],[paramName]:paramValue},newImageImports})}function getBufferSize(imageImport2){return props.serverSideDriveFetch?0:parseInt(imageImport2.size)||0}function downloadFromDrive(newImport,index){return new Promise((resolve,reject)=>{var imageRequest=new XMLHttpRequest;imageRequest.addEventListener(`load`,e=>{imageRequest.status==200?(setImageParam(`progress`,50,index),resolve(new File([imageRequest.response],newImport.name))):reject(new ImportError(`Failed to import from Google`,imageRequest.status>=500||imageRequest.status==429))}),imageRequest.addEventListener(`error`,()=>{reject(new ImportError(`Failed to import from Google`,!0))}),imageRequest.addEventListener(`progress`,e=>{e.lengthComputable&&setImageParam(`progress`,Math.round(100*e.loaded/(2*e.total)),index)}),imageRequest.open(`GET`,`https://www.googleapis.com/drive/v3/files/`+newImport.drive_id+`?alt=media`),imageRequest.responseType=`blob`,imageRequest.setRequestHeader(`Authorization`,`Bearer `+oauthToken),imageRequest.send()})}function pollServerFetchProgress(newImport,index){let progressInterval=setInterval(()=>{fetch(props.driveFetchProgressUrl+`?drive_id=`+encodeURIComponent(newImport.drive_id),{credentials:`same-origin`}).then(res2=>res2.json()).then(progress=>{progress.total&&setImageParam(`progress`,Math.round(90*progress.loaded/progress.total),index)}).catch(error=>{console.error(error)})},1e3);return()=>{clearInterval(progressInterval)}}function appendLedgerFields(formData,newImport){formData.append(`md5_checksum`,newImport.md5_checksum),formData.append(`head_revision_id`,newImport.head_revision_id),formData.append(`modified_time`,newImport.modified_time)}function uploadToWagtail(imageFile,newImport,index){return new Promise((resolve,reject)=>{let formData=new FormData;formData.append(`drive_id`,newImport.drive_id),formData.append(`wagtail_id`,newImport.wagtail_id),formData.append(`action`,newImport.action),formData.append(`name`,newImport.name),formData.append(`collection`,props.collection),appendLedgerFields(formData,newImport),imageFile?formData.append(`image_file`,imageFile):formData.append(`oauth_token`,oauthToken);var request=new XMLHttpRequest;request.addEventListener(`load`,e=>{request.status==200?resolve(JSON.parse(request.response)):reject(new ImportError(`Failed to upload to Wagtail`,isRetryableUploadStatus(request.status)))}),request.addEventListener(`error`,e=>{reject(new ImportError(`Failed to upload to Wagtail`,!0))}),request.upload.addEventListener(`progress`,e=>{imageFile&&e.lengthComputable&&setImageParam(`progress`,Math.round(50+100*e.loaded/(2*e.total)),index)}),request.open(`POST`,window.location),request.setRequestHeader(`X-CSRFToken`,props.csrfToken),request.setRequestHeader(`X-Requested-With`,`XMLHttpRequest`),request.send(formData)})}function isBatchingImports(){return props.importBatchSize>1}function addToImportBatch(imageFile,newImport,index){return new Promise((resolve,reject)=>{importBatch.current.push({imageFile,newImport,index,resolve,reject}),activeImports.current.delete(index),importBatch.current.length>=props.importBatchSize&&sendImportBatch(),setFinishedCount(count=>count+1)})}function sendImportBatch(){let batch=importBatch.current.splice(0),formData=new FormData;formData.append(`collection`,props.collection);let items=batch.map(({imageFile,newImport},position)=>{let item={drive_id:newImport.drive_id,wagtail_id:newImport.wagtail_id,action:newImport.action,name:newImport.name,md5_checksum:newImport.md5_checksum,head_revision_id:newImport.head_revision_id,modified_time:newImport.modified_time};return imageFile&&(item.file=`file_`+position,formData.append(item.file,imageFile)),item});formData.append(`items`,JSON.stringify(items)),batch.some(({imageFile})=>!imageFile)&&formData.append(`oauth_token`,oauthToken);function rejectBatch(error){batch.forEach(({reject})=>reject(error))}var request=new XMLHttpRequest;request.addEventListener(`load`,e=>{if(request.status==200){let results=JSON.parse(request.response).results;batch.forEach(({resolve},position)=>resolve(results[position]))}else rejectBatch(new ImportError(`Failed to upload to Wagtail`,isRetryableUploadStatus(request.status)))}),request.addEventListener(`error`,e=>{rejectBatch(new ImportError(`Failed to upload to Wagtail`,!0))}),request.upload.addEventListener(`progress`,e=>{e.lengthComputable&&batch.forEach(({imageFile,index})=>{imageFile&&setImageParam(`progress`,Math.round(50+100*e.loaded/(2*e.total)),index)})}),request.open(`POST`,props.bulkImportUrl),request.setRequestHeader(`X-CSRFToken`,props.csrfToken),request.setRequestHeader(`X-Requested-With`,`XMLHttpRequest`),request.send(formData)}async function sendChunkedUploadRequest(url,options){let res2;try{res2=await fetch(url,{credentials:`same-origin`,...options,headers:{"X-CSRFToken":props.csrfToken,...options.headers}})}catch{throw new ImportError(`Failed to upload to Wagtail`,!0)}if(res2.status!=200&&res2.status!=409)throw new ImportError(`Failed to upload to Wagtail`,isRetryableUploadStatus(res2.status));return res2.json()}async function uploadInChunks(imageFile,newImport,index){let upload=chunkedUploads.current.get(index);if(upload)upload.received=(await sendChunkedUploadRequest(props.chunkedUploadUrl+upload.uploadId+`/`,{method:`GET`})).received;else{let formData=new FormData;formData.append(`drive_id`,newImport.drive_id),formData.append(`wagtail_id`,newImport.wagtail_id),formData.append(`action`,newImport.action),formData.append(`name`,newImport.name),formData.append(`collection`,props.collection),appendLedgerFields(formData,newImport),formData.append(`size`,imageFile.size);let res3=await sendChunkedUploadRequest(props.chunkedUploadUrl,{method:`POST`,body:formData});upload={uploadId:res3.upload_id,chunkSize:res3.chunk_size,received:res3.received},chunkedUploads.current.set(index,upload)}let uploadUrl=props.chunkedUploadUrl+upload.uploadId+`/`;for(;upload.received<imageFile.size;){let end=Math.min(upload.received+upload.chunkSize,imageFile.size);upload.received=(await sendChunkedUploadRequest(uploadUrl,{method:`PUT`,body:imageFile.slice(upload.received,end),headers:{"Content-Type":`application/octet-stream`,"Content-Range":`bytes `+upload.received+`-`+(end-1)+`/`+imageFile.size}})).received,setImageParam(`progress`,Math.round(50+50*upload.received/imageFile.size),index)}let res2=await sendChunkedUploadRequest(uploadUrl+`finish/`,{method:`POST`});return chunkedUploads.current.delete(index),res2}function pollImportJobs(){fetch(props.importJobsUrl+`?ids=`+Array.from(pendingJobs.current.keys()).join(`,`),{credentials:`same-origin`}).then(res2=>res2.json()).then(res2=>{Object.entries(res2.jobs).forEach(([jobId,job])=>{let onFinished=pendingJobs.current.get(parseInt(jobId));onFinished&&(job.status==`succeeded`||job.status==`failed`)&&(pendingJobs.current.delete(parseInt(jobId)),onFinished(job))}),pendingJobs.current.size===0&&(clearInterval(jobPoller.current),jobPoller.current=null)}).catch(error=>{console.error(error)})}function waitForImportJob(jobId){return new Promise(resolve=>{pendingJobs.current.set(jobId,resolve),jobPoller.current||=setInterval(pollImportJobs,props.importJobPollInterval)})}function setImportResult(res2,index){setImageParam(`imported`,!0,index),setImageParam(`error`,res2.error,index),setImageParam(`form`,res2.form,index),setImageParam(`form_url`,res2.form_url,index),setImageParam(`edit_action`,res2.edit_action,index),setImageParam(`delete_action`,res2.delete_action,index),setImageParam(`progress`,100,index)}async function runImport(newImport,index){if(newImport.unchanged){setImageParam(`imported`,!0,index),setImageParam(`message`,`Unchanged since it was last imported.`,index),setImageParam(`progress`,100,index);return}for(let attempt=1;;attempt++)try{let res2;if(props.serverSideDriveFetch&&isBatchingImports())res2=await addToImportBatch(null,newImport,index);else if(props.serverSideDriveFetch){let stopPolling=pollServerFetchProgress(newImport,index);try{res2=await uploadToWagtail(null,newImport,index)}finally{stopPolling()}}else{let imageFile=downloadedFiles.current.get(index);if(imageFile||=await downloadFromDrive(newImport,index),imageFile.size>props.chunkedUploadThreshold){downloadedFiles.current.set(index,imageFile);try{res2=await uploadInChunks(imageFile,newImport,index)}catch(error){throw(!error.retryable||attempt>=3)&&downloadedFiles.current.delete(index),error}downloadedFiles.current.delete(index)}else res2=isBatchingImports()?await addToImportBatch(imageFile,newImport,index):await uploadToWagtail(imageFile,newImport,index)}res2.job_id?(setImageParam(`progress`,90,index),waitForImportJob(res2.job_id).then(job=>setImportResult(job,index))):setImportResult(res2,index);return}catch(error){if(!error.retryable||attempt>=3){setImageParam(`progress`,0,index),setImageParam(`error`,error.message,index);return}await new Promise(resolve=>setTimeout(resolve,1e3*2**(attempt-1)))}}function startImport(newImport,index){let bufferSize=getBufferSize(newImport);startedImports.current.add(index),activeImports.current.add(index),bufferedBytes.current+=bufferSize,runImport(newImport,index).finally(()=>{activeImports.current.delete(index),bufferedBytes.current-=bufferSize,setFinishedCount(count=>count+1)})}React.useEffect(()=>{let waitingForMemory=!1;for(let index=0;index<imageImports.length&&!(activeImports.current.size>=props.maxConcurrentImports);index++){let imageImport2=imageImports[index];if(!startedImports.current.has(index)){if((activeImports.current.size>0||importBatch.current.length>0)&&bufferedBytes.current+getBufferSize(imageImport2)>props.maxBufferedBytes){waitingForMemory=!0;break}startImport(imageImport2,index)}}importBatch.current.length>0&&(activeImports.current.size===0||waitingForMemory)&&sendImportBatch()},[finishedCount]),React.useEffect(()=>{if(!props.deferSearchIndexing)return;function flushSearchIndex(){let formData=new FormData;formData.append(`csrfmiddlewaretoken`,props.csrfToken),navigator.sendBeacon(props.flushSearchIndexUrl,formData)}return window.addEventListener(`pagehide`,flushSearchIndex),()=>{window.removeEventListener(`pagehide`,flushSearchIndex)}},[]);function getDisplay(imageImport2,index){return imageImport2.finished?null:React.createElement(ImageImportDisplay,{key:imageImport2.id,imageImport:imageImport2,onFormResponseError:res2=>{setImageParam(`error`,res2.error,index),setImageParam(`form`,res2.form,index),setImageParam(`edit_action`,res2.edit_action,index),setImageParam(`delete_action`,res2.delete_action,index)},onFormResponseSuccess:res2=>{setImageParam(`finished`,!0,index),setImageParam(`error`,res2.error,index),setImageParam(`form`,res2.form,index),setImageParam(`edit_action`,res2.edit_action,index),setImageParam(`delete_action`,res2.delete_action,index)},onDeleteResponseLoad:res2=>{setImageParam(`finished`,!0,index),setImageParam(`error`,res2.error,index),setImageParam(`form`,res2.form,index),setImageParam(`edit_action`,res2.edit_action,index),setImageParam(`delete_action`,res2.delete_action,index)},onFormRequested:()=>{fetch(imageImport2.form_url,{credentials:`same-origin`}).then(res2=>res2.json()).then(res2=>{setImageParam(`form`,res2.form,index)}).catch(error=>{console.error(error)})},csrfToken:props.csrfToken,tagitOpts:props.tagitOpts})}let overallProgress=imageImports.reduce((total,imageImport2)=>total+imageImport2.progress/imageImports.length,0),imageList=imageImports.map(getDisplay);return React.createElement(`div`,{class:`nice-padding`},React.createElement(`h2`,null,`Image import`),React.createElement(`div`,{id:`overall-progress`,"aria-valuenow":Math.round(overallProgress),class:`progress progress-secondary active`},React.createElement(`div`,{class:`bar`,style:{width:overallProgress+`%`}},Math.round(overallProgress)+`%`)),imageList.filter(value=>value!==null).length>0?React.createElement(`ul`,{id:`upload-list`,class:`upload-list multiple`},imageList):null,overallProgress===100?React.createElement(`a`,{href:props.indexUrl,class:`button button-return`},`Return to image index`):null)}function ImageImportDisplay(props){return React.createElement(`li`,{class:`row upload-uploading`},React.createElement(`div`,{class:`left col3`},React.createElement(`div`,{class:`preview`},React.createElement(`div`,{class:`thumb icon icon-image hasthumb`},React.createElement(`img`,{src:props.imageImport.thumbnail})),props.imageImport.imported?null:React.createElement(`div`,{class:`progress active`},React.createElement(`div`,{class:`bar`,style:{width:props.imageImport.progress+`%`}},props.imageImport.progress,`%`)))),React.createElement(`div`,{class:`right col9`},React.createElement(`p`,null,props.imageImport.name),React.createElement(`p`,{class:props.imageImport.error?`status-msg failure`:`status-msg success`},props.imageImport.error||!props.imageImport.imported?props.imageImport.error:props.imageImport.message||`Image successfully imported. Please update this image with a more appropriate title, if necessary. You may also delete the image completely if the import wasn't required.`),props.imageImport.form?React.createElement(ImportUpdateForm,{imageImport:props.imageImport,onFormResponseError:props.onFormResponseError,onFormResponseSuccess:props.onFormResponseSuccess,onDeleteResponseLoad:props.onDeleteResponseLoad,csrfToken:props.csrfToken,tagitOpts:props.tagitOpts}):props.imageImport.form_url?React.createElement(`button`,{type:`button`,class:`button button-secondary`,onClick:props.onFormRequested},`Edit`):null))}function ImportUpdateForm(props){let updateForm=React.useRef(null);React.useLayoutEffect(()=>{if(updateForm.current){let field=$(`.tag_field input`,updateForm.current);if(field)return field.tagit(props.tagitOpts),()=>{field.tagit(`destroy`)}}},[props.imageImport.form]);function submitForm(e){e.preventDefault();var request=new XMLHttpRequest;request.addEventListener(`load`,async e2=>{e2.preventDefault(),res=await request.response,res=JSON.parse(res),res.error?props.onFormResponseError(res):props.onFormResponseSuccess(res)}),request.open(`POST`,props.imageImport.edit_action),request.setRequestHeader(`X-CSRFToken`,props.csrfToken),request.setRequestHeader(`X-Requested-With`,`XMLHttpRequest`),request.send(new FormData(e.target))}function deleteImage(e){e.preventDefault();var request=new XMLHttpRequest;request.addEventListener(`load`,async e2=>{e2.preventDefault(),res=await request.response,res=JSON.parse(res),props.onDeleteResponseLoad(res)}),request.open(`POST`,props.imageImport.delete_action),request.setRequestHeader(`X-CSRFToken`,props.csrfToken),request.setRequestHeader(`X-Requested-With`,`XMLHttpRequest`),request.send()}return React.createElement(`form`,{method:`POST`,enctype:`multipart/form-data`,novalidate:!0,ref:updateForm,onSubmit:submitForm},React.createElement(`ul`,{class:`fields`,dangerouslySetInnerHTML:{__html:props.imageImport.form}}),React.createElement(`ul`,{class:`fields`},React.createElement(`li`,null,React.createElement(`input`,{type:`hidden`,name:`drive_id`,value:props.imageImport.driveId}),React.createElement(`input`,{type:`submit`,value:`Update`,class:`button`}),React.createElement(`button`,{type:`button`,class:`delete button button-secondary no`,onClick:deleteImage},`Delete`))))}function DuplicateIdentifier(props){let[potentialDuplicates,setPotentialDuplicates]=React.useState({}),[duplicateActions,setDuplicateActions]=React.useState({}),[finished,setFinished]=React.useState(!1),[error,setError]=React.useState(null);if(React.useEffect(()=>{let data=JSON.stringify(props.imageData),found={},receivedAll=!1;function addResults(lines){let newActions={};for(let line of lines){let result=JSON.parse(line);result.done?(receivedAll=!0,setFinished(!0),props.onGetDuplicateData(found),Object.keys(found).length==0&&props.onConfirmDuplicateActions({})):(found[result.id]=result.duplicate,newActions[result.id]=`replace`)}Object.keys(newActions).length>0&&(setPotentialDuplicates({...found}),setDuplicateActions(actions=>({...newActions,...actions})))}async function readResults(res2){let reader=res2.body.getReader(),decoder=new TextDecoder,buffered=``;for(;;){let{done,value}=await reader.read();if(done)break;buffered+=decoder.decode(value,{stream:!0});let lines=buffered.split(`
+`);buffered=lines.pop(),addResults(lines.filter(line=>line))}}fetch(props.duplicateReviewUrl,{method:`post`,headers:{Accept:`application/x-ndjson`,"Content-Type":`application/json`,"X-Drive-OAuth-Token":gapi.auth2.getAuthInstance().currentUser.get().getAuthResponse().access_token},body:data}).then(res2=>{if(res2.ok)return readResults(res2);throw res2}).catch(error2=>{console.error(error2)}).finally(()=>{receivedAll||(setError(`Not every duplicate could be identified. Please check for duplicates yourself, or try again.`),setFinished(!0),props.onGetDuplicateData(found))})},[props.selectedImageData]),potentialDuplicates&&Object.keys(potentialDuplicates).length>0){let globalAction=!0;getGlobalAction=()=>globalAction?duplicateActions[Object.keys(duplicateActions)[0]]:null,setGlobalAction=newAction=>{let newActions={},ids=Object.keys(duplicateActions);for(let index=0;index<ids.length;index++)newActions[ids[index]]=newAction;setDuplicateActions(newActions)};let duplicateComparisons=[],pastAction=null,action=null,imageDataIterator=props.imageData.entries();for(let[index,value]of imageDataIterator){let id=value.id;if(id in potentialDuplicates){action=duplicateActions[id],globalAction&&pastAction!==null&&action!=pastAction&&(globalAction=!1);let wagtailDuplicate=potentialDuplicates[id],driveDuplicate=value;duplicateComparisons.push(React.createElement(`tr`,null,React.createElement(`td`,null,React.createElement(DuplicateComparison,{driveDuplicate,wagtailDuplicate})),React.createElement(DuplicateChoice,{action,onClick:e=>{let actions={...duplicateActions};actions[id]=e.target.value,setDuplicateActions(actions)}}))),pastAction=action}}return React.createElement(React.Fragment,null,React.createElement(`div`,{class:`nice-padding`},React.createElement(`h2`,{class:`icon icon-warning`},`Duplicates detected`),React.createElement(`p`,null,`Wagtail has detected images similar to the ones you have just chosen to upload`),React.createElement(`p`,null,`Please choose how you would like to proceed`),React.createElement(`p`,null,React.createElement(`b`,null,Object.keys(potentialDuplicates).length,` duplicates detected`)),error?React.createElement(`p`,{class:`status-msg failure`},error):null,React.createElement(`table`,{class:`listing`},React.createElement(`thead`,null,React.createElement(`tr`,{class:`table-headers`},React.createElement(`th`,null),React.createElement(`th`,null,`Replace original image`),React.createElement(`th`,null,`Keep both images`),React.createElement(`th`,null,`Cancel upload`))),React.createElement(`tbody`,null,React.createElement(`tr`,null,React.createElement(`td`,null),React.createElement(DuplicateChoice,{action:getGlobalAction(),onClick:e=>{setGlobalAction(e.target.value)}})),duplicateComparisons)),finished?null:React.createElement(LoadingSpinner,{message:`Identifying more duplicates`})),React.createElement(`footer`,null,React.createElement(`ul`,null,React.createElement(`li`,{class:`actions`},React.createElement(`button`,{type:`submit`,class:`button`,disabled:!finished,onClick:()=>props.onConfirmDuplicateActions(duplicateActions)},`Confirm all`)))))}else if(error)return React.createElement(React.Fragment,null,React.createElement(`div`,{class:`nice-padding`},React.createElement(`p`,{class:`status-msg failure`},error)),React.createElement(`footer`,null,React.createElement(`ul`,null,React.createElement(`li`,{class:`actions`},React.createElement(`button`,{type:`submit`,class:`button`,onClick:()=>props.onConfirmDuplicateActions({})},`Import all`)))));else return React.createElement(`div`,{class:`nice-padding`},React.createElement(LoadingSpinner,{message:`Identifying duplicates`}))}function DuplicateChoice(props){return React.createElement(React.Fragment,null,React.createElement(`td`,null,React.createElement(`input`,{type:`radio`,value:`replace`,checked:props.action==`replace`,onClick:props.onClick})),React.createElement(`td`,null,React.createElement(`input`,{type:`radio`,value:`keep`,checked:props.action==`keep`,onClick:props.onClick})),React.createElement(`td`,null,React.createElement(`input`,{type:`radio`,value:`cancel`,checked:props.action==`cancel`,onClick:props.onClick})))}function DuplicateComparison(props){return React.createElement(`table`,{class:`image-comparison`},React.createElement(`thead`,null,React.createElement(`tr`,{class:`image-headings`},React.createElement(`th`,null,`Original`),React.createElement(`th`,null,`New`))),React.createElement(`tbody`,null,React.createElement(`tr`,null,React.createElement(`td`,null,React.createElement(`img`,{src:props.wagtailDuplicate.thumbnail,width:`165`,height:`165`,loading:`lazy`})),React.createElement(`td`,null,React.createElement(`img`,{src:props.driveDuplicate.thumbnailLink,width:`165`,height:`165`}))),React.createElement(`tr`,null,React.createElement(`td`,null,React.createElement(`p`,null,React.createElement(`b`,null,props.wagtailDuplicate.title))),React.createElement(`td`,null,React.createElement(`p`,null,React.createElement(`b`,null,props.driveDuplicate.name)))),React.createElement(`tr`,null,React.createElement(`td`,null,React.createElement(`p`,null,`Created at `,props.wagtailDuplicate.created_at)),React.createElement(`td`,null,props.wagtailDuplicate.near_duplicate?React.createElement(`p`,null,`Similar image`):null,props.wagtailDuplicate.unchanged?React.createElement(`p`,null,`Unchanged since it was imported`):null))))}function DriveSelector(props){let[apiLoaded,setApiLoaded]=React.useState(!1);React.useEffect(()=>{gapi.load(`client:auth2:picker`,()=>{gapi.client.init({apiKey:props.pickerApiKey,clientId:props.clientId,discoveryDocs:[`https://docs.googleapis.com/$discovery/rest?version=v1`,`https://www.googleapis.com/discovery/v1/apis/drive/v3/rest`],scope:props.scope}).then(()=>{setApiLoaded(!0)}).catch(error=>{console.error(error)})})},[]);function authenticate(){let googleAuth=gapi.auth2.getAuthInstance();return googleAuth.isSignedIn.get()?Promise.resolve(googleAuth.currentUser.get().getAuthResponse()):googleAuth.signIn({scope:props.scope}).then(result=>result.getAuthResponse())}function showPicker(oauthToken,callback){let docsView=new google.picker.DocsView(google.picker.ViewId.DOCS_IMAGES);docsView.setSelectFolderEnabled(!0),docsView.setIncludeFolders(!0),docsView.setParent(props.driveParent),new google.picker.PickerBuilder().setAppId(props.appId).enableFeature(google.picker.Feature.MULTISELECT_ENABLED).setDeveloperKey(props.pickerApiKey).setOAuthToken(oauthToken).addView(docsView).setCallback(callback).build().setVisible(!0)}function isImage(element,index,array){return element.type==google.picker.Type.PHOTO}function isFolder(element,index,array){return element.type==google.picker.Type.jG}async function onSelect(data){if(data.action==google.picker.Action.PICKED){let images=data.docs.filter(isImage),folders=data.docs.filter(isFolder),imageData=[];if(folders&&folders.length){let q=`(mimeType contains 'image/') and (${folders.reduce((query,folder)=>query+`('${folder.id}' in parents) or `,``).slice(0,-4)})`,response=await gapi.client.drive.files.list({q,pageSize:1e3,fields:`nextPageToken, files(id, name, thumbnailLink, fileExtension, md5Checksum, headRevisionId, modifiedTime, size, imageMediaMetadata)`});imageData.push(...response.result.files)}if(images&&images.length)for(let index=0;index<images.length;index++){let response=await gapi.client.drive.files.get({fileId:images[index].id,fields:`id, name, thumbnailLink, fileExtension, md5Checksum, headRevisionId, modifiedTime, size, imageMediaMetadata`});imageData.push(response.result)}props.onGetImageData(imageData)}}function pick(){authenticate().then(auth=>showPicker(auth.access_token,onSelect))}return apiLoaded?React.createElement(`div`,{class:`nice-padding import-selector`},React.createElement(`button`,{class:`button bicolor icon icon-plus`,onClick:pick},`Select an image or folder in Drive`)):React.createElement(`div`,{class:`nice-padding import-selector`},React.createElement(LoadingSpinner,{message:`Loading Google API`}))}let LoadingSpinner=props=>React.createElement(`span`,null,React.createElement(Icon,{name:`spinner`,className:`c-spinner`}),props.message),domContainer=document.querySelector(`#importer`);ReactDOM.render(React.createElement(Importer,{appId:domContainer.dataset.appId,pickerApiKey:domContainer.dataset.pickerApiKey,clientId:domContainer.dataset.clientId,duplicateReviewUrl:domContainer.dataset.duplicateReviewUrl,csrfToken:document.querySelector(`[name=csrfmiddlewaretoken]`).value,collections:JSON.parse(domContainer.dataset.collections),tagitOpts:{autocomplete:{source:domContainer.dataset.autocompleteUrl}},driveParent:domContainer.dataset.driveParent,indexUrl:domContainer.dataset.indexUrl,serverSideDriveFetch:domContainer.dataset.serverSideDriveFetch==`true`,driveFetchProgressUrl:domContainer.dataset.driveFetchProgressUrl,maxConcurrentImports:parseInt(domContainer.dataset.maxConcurrentImports),maxBufferedBytes:parseInt(domContainer.dataset.maxBufferedBytes),importJobsUrl:domContainer.dataset.importJobsUrl,importJobPollInterval:parseInt(domContainer.dataset.importJobPollInterval),deferSearchIndexing:domContainer.dataset.deferSearchIndexing==`true`,flushSearchIndexUrl:domContainer.dataset.flushSearchIndexUrl,chunkedUploadUrl:domContainer.dataset.chunkedUploadUrl,chunkedUploadThreshold:parseInt(domContainer.dataset.chunkedUploadThreshold),bulkImportUrl:domContainer.dataset.bulkImportUrl,importBatchSize:parseInt(domContainer.dataset.importBatchSize)}),domContainer)}]);
\ No newline at end of file
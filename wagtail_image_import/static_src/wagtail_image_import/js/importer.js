@@ -19,10 +19,17 @@ function Importer(props) {
           progress: 0,
           action: duplicateActions[id] || "keep",
           thumbnail: data["thumbnailLink"],
+          size: data["size"],
+          md5_checksum: data["md5Checksum"] || "",
+          head_revision_id: data["headRevisionId"] || "",
+          modified_time: data["modifiedTime"] || "",
           wagtail_id:
             duplicateActions[id] == "replace"
               ? duplicateData[id]["wagtail_id"]
               : null,
+          // replacing an image with the unchanged file it was imported from would change nothing
+          unchanged:
+            duplicateActions[id] == "replace" && duplicateData[id]["unchanged"],
         });
       })
       .filter((imageImport) => !(imageImport["action"] == "cancel"));
@@ -65,6 +72,18 @@ function Importer(props) {
         collection={collection}
         tagitOpts={props.tagitOpts}
         indexUrl={props.indexUrl}
+        serverSideDriveFetch={props.serverSideDriveFetch}
+        driveFetchProgressUrl={props.driveFetchProgressUrl}
+        maxConcurrentImports={props.maxConcurrentImports}
+        maxBufferedBytes={props.maxBufferedBytes}
+        importJobsUrl={props.importJobsUrl}
+        importJobPollInterval={props.importJobPollInterval}
+        deferSearchIndexing={props.deferSearchIndexing}
+        flushSearchIndexUrl={props.flushSearchIndexUrl}
+        chunkedUploadUrl={props.chunkedUploadUrl}
+        chunkedUploadThreshold={props.chunkedUploadThreshold}
+        bulkImportUrl={props.bulkImportUrl}
+        importBatchSize={props.importBatchSize}
       />
     );
   }
@@ -90,107 +109,519 @@ function CollectionSelector(props) {
   );
 }
 
+const MAX_IMPORT_ATTEMPTS = 3;
+const RETRY_DELAY = 1000;
+
+// imports aren't idempotent, so they are only retried when the server can't have handled them
+const RETRYABLE_UPLOAD_STATUSES = [502, 503, 504];
+
+function isRetryableUploadStatus(status) {
+  return RETRYABLE_UPLOAD_STATUSES.includes(status);
+}
+
+class ImportError extends Error {
+  constructor(message, retryable) {
+    super(message);
+    this.retryable = retryable;
+  }
+}
+
 function FileImporter(props) {
-  const [currentlyImporting, setCurrentlyImporting] = React.useState(false);
   const [imageImports, setImageImports] = React.useState(props.imageImports);
+  // incremented whenever an import finishes, to schedule the next imports
+  const [finishedCount, setFinishedCount] = React.useState(0);
+  const startedImports = React.useRef(new Set());
+  const activeImports = React.useRef(new Set());
+  // the number of bytes expected to be held in memory by active imports
+  const bufferedBytes = React.useRef(0);
+  // callbacks for background import jobs which haven't finished, by job id
+  const pendingJobs = React.useRef(new Map());
+  const jobPoller = React.useRef(null);
+  // the ids of chunked uploads, and the files downloaded for them, by import index, so that
+  // a retried import resumes its upload instead of starting again
+  const chunkedUploads = React.useRef(new Map());
+  const downloadedFiles = React.useRef(new Map());
+  // imports waiting to be sent to the server together, in one request to the bulk import view
+  const importBatch = React.useRef([]);
   const oauthToken = gapi.auth2
     .getAuthInstance()
     .currentUser.get()
     .getAuthResponse().access_token;
 
   function setImageParam(paramName, paramValue, index) {
-    let newImageImports = [...imageImports];
-    newImageImports[index][paramName] = paramValue;
-    setImageImports(newImageImports);
+    setImageImports((imageImports) => {
+      let newImageImports = [...imageImports];
+      newImageImports[index] = {
+        ...newImageImports[index],
+        [paramName]: paramValue,
+      };
+      return newImageImports;
+    });
   }
 
-  function startImport(newImport, index) {
-    setCurrentlyImporting(true);
-    var imageRequest = new XMLHttpRequest();
-    imageRequest.addEventListener("load", (e) => {
-      setImageParam("progress", 50, index);
-      uploadToWagtail(
-        new File([imageRequest.response], newImport["name"]),
-        newImport,
-        index
+  function getBufferSize(imageImport) {
+    // files fetched by the server are never held by the browser
+    return props.serverSideDriveFetch ? 0 : parseInt(imageImport.size) || 0;
+  }
+
+  function downloadFromDrive(newImport, index) {
+    return new Promise((resolve, reject) => {
+      var imageRequest = new XMLHttpRequest();
+      imageRequest.addEventListener("load", (e) => {
+        if (imageRequest.status == 200) {
+          setImageParam("progress", 50, index);
+          resolve(new File([imageRequest.response], newImport["name"]));
+        } else {
+          reject(
+            new ImportError(
+              "Failed to import from Google",
+              imageRequest.status >= 500 || imageRequest.status == 429
+            )
+          );
+        }
+      });
+      imageRequest.addEventListener("error", () => {
+        reject(new ImportError("Failed to import from Google", true));
+      });
+      imageRequest.addEventListener("progress", (e) => {
+        if (e.lengthComputable) {
+          setImageParam(
+            "progress",
+            Math.round((100 * e.loaded) / (2 * e.total)),
+            index
+          );
+        }
+      });
+      imageRequest.open(
+        "GET",
+        "https://www.googleapis.com/drive/v3/files/" +
+          newImport["drive_id"] +
+          "?alt=media"
       );
+      imageRequest.responseType = "blob";
+      imageRequest.setRequestHeader("Authorization", "Bearer " + oauthToken);
+      imageRequest.send();
     });
-    imageRequest.addEventListener("error", () => {
-      setImageParam("progress", 0, index);
-      setCurrentlyImporting(false);
-      setImageParam("error", "Failed to import from Google", index);
+  }
+
+  function pollServerFetchProgress(newImport, index) {
+    // the server downloads the file from Drive itself, so poll it for progress
+    const progressInterval = setInterval(() => {
+      fetch(
+        props.driveFetchProgressUrl +
+          "?drive_id=" +
+          encodeURIComponent(newImport["drive_id"]),
+        { credentials: "same-origin" }
+      )
+        .then((res) => res.json())
+        .then((progress) => {
+          if (progress["total"]) {
+            setImageParam(
+              "progress",
+              Math.round((90 * progress["loaded"]) / progress["total"]),
+              index
+            );
+          }
+        })
+        .catch((error) => {
+          console.error(error);
+        });
+    }, 1000);
+    return () => {
+      clearInterval(progressInterval);
+    };
+  }
+
+  function appendLedgerFields(formData, newImport) {
+    // the state of the Drive file, recorded so that it isn't imported again until it changes
+    formData.append("md5_checksum", newImport["md5_checksum"]);
+    formData.append("head_revision_id", newImport["head_revision_id"]);
+    formData.append("modified_time", newImport["modified_time"]);
+  }
+
+  function uploadToWagtail(imageFile, newImport, index) {
+    return new Promise((resolve, reject) => {
+      let formData = new FormData();
+      formData.append("drive_id", newImport["drive_id"]);
+      formData.append("wagtail_id", newImport["wagtail_id"]);
+      formData.append("action", newImport["action"]);
+      formData.append("name", newImport["name"]);
+      formData.append("collection", props.collection);
+      appendLedgerFields(formData, newImport);
+      if (imageFile) {
+        formData.append("image_file", imageFile);
+      } else {
+        formData.append("oauth_token", oauthToken);
+      }
+      var request = new XMLHttpRequest();
+      request.addEventListener("load", (e) => {
+        if (request.status == 200) {
+          resolve(JSON.parse(request.response));
+        } else {
+          reject(
+            new ImportError(
+              "Failed to upload to Wagtail",
+              isRetryableUploadStatus(request.status)
+            )
+          );
+        }
+      });
+      request.addEventListener("error", (e) => {
+        reject(new ImportError("Failed to upload to Wagtail", true));
+      });
+      request.upload.addEventListener("progress", (e) => {
+        if (imageFile && e.lengthComputable) {
+          setImageParam(
+            "progress",
+            Math.round(50 + (100 * e.loaded) / (2 * e.total)),
+            index
+          );
+        }
+      });
+      request.open("POST", window.location);
+      request.setRequestHeader("X-CSRFToken", props.csrfToken);
+      request.setRequestHeader("X-Requested-With", "XMLHttpRequest");
+      request.send(formData);
     });
-    imageRequest.addEventListener("progress", (e) => {
-      if (e.lengthComputable) {
-        setImageParam(
-          "progress",
-          Math.round((100 * e.loaded) / (2 * e.total)),
-          index
-        );
+  }
+
+  function isBatchingImports() {
+    return props.importBatchSize > 1;
+  }
+
+  function addToImportBatch(imageFile, newImport, index) {
+    return new Promise((resolve, reject) => {
+      importBatch.current.push({ imageFile, newImport, index, resolve, reject });
+      // a batched import no longer holds up the imports after it, so let the next one start
+      activeImports.current.delete(index);
+      if (importBatch.current.length >= props.importBatchSize) {
+        sendImportBatch();
       }
+      setFinishedCount((count) => count + 1);
     });
-    imageRequest.open(
-      "GET",
-      "https://www.googleapis.com/drive/v3/files/" +
-        newImport["drive_id"] +
-        "?alt=media"
-    );
-    imageRequest.responseType = "blob";
-    imageRequest.setRequestHeader("Authorization", "Bearer " + oauthToken);
-    imageRequest.send();
   }
 
-  function uploadToWagtail(imageFile, newImport, index) {
+  function sendImportBatch() {
+    const batch = importBatch.current.splice(0);
     let formData = new FormData();
-    formData.append("drive_id", newImport["drive_id"]);
-    formData.append("wagtail_id", newImport["wagtail_id"]);
-    formData.append("action", newImport["action"]);
-    formData.append("name", newImport["name"]);
     formData.append("collection", props.collection);
-    formData.append("image_file", imageFile);
+    const items = batch.map(({ imageFile, newImport }, position) => {
+      let item = {
+        drive_id: newImport["drive_id"],
+        wagtail_id: newImport["wagtail_id"],
+        action: newImport["action"],
+        name: newImport["name"],
+        md5_checksum: newImport["md5_checksum"],
+        head_revision_id: newImport["head_revision_id"],
+        modified_time: newImport["modified_time"],
+      };
+      if (imageFile) {
+        item["file"] = "file_" + position;
+        formData.append(item["file"], imageFile);
+      }
+      return item;
+    });
+    formData.append("items", JSON.stringify(items));
+    if (batch.some(({ imageFile }) => !imageFile)) {
+      formData.append("oauth_token", oauthToken);
+    }
+    function rejectBatch(error) {
+      batch.forEach(({ reject }) => reject(error));
+    }
     var request = new XMLHttpRequest();
-    request.addEventListener("load", async (e) => {
-      let res = await request.response;
-      res = JSON.parse(res);
-      setImageParam("imported", true, index);
-      setCurrentlyImporting(false);
-      setImageParam("error", res["error"], index);
-      setImageParam("form", res["form"], index);
-      setImageParam("edit_action", res["edit_action"], index);
-      setImageParam("delete_action", res["delete_action"], index);
-      setImageParam("progress", 100, index);
+    request.addEventListener("load", (e) => {
+      if (request.status == 200) {
+        const results = JSON.parse(request.response)["results"];
+        batch.forEach(({ resolve }, position) => resolve(results[position]));
+      } else {
+        rejectBatch(
+          new ImportError(
+            "Failed to upload to Wagtail",
+            isRetryableUploadStatus(request.status)
+          )
+        );
+      }
     });
-    request.addEventListener("error", async (e) => {
-      setCurrentlyImporting(false);
-      setImageParam("error", "Failed to upload to Wagtail", index);
+    request.addEventListener("error", (e) => {
+      rejectBatch(new ImportError("Failed to upload to Wagtail", true));
     });
     request.upload.addEventListener("progress", (e) => {
       if (e.lengthComputable) {
-        setImageParam(
-          "progress",
-          Math.round(50 + (100 * e.loaded) / (2 * e.total)),
-          index
-        );
+        batch.forEach(({ imageFile, index }) => {
+          if (imageFile) {
+            setImageParam(
+              "progress",
+              Math.round(50 + (100 * e.loaded) / (2 * e.total)),
+              index
+            );
+          }
+        });
       }
     });
-    request.open("POST", window.location);
+    request.open("POST", props.bulkImportUrl);
     request.setRequestHeader("X-CSRFToken", props.csrfToken);
     request.setRequestHeader("X-Requested-With", "XMLHttpRequest");
     request.send(formData);
   }
 
-  React.useEffect(() => {
-    // start import if not currently importing
-    if (!currentlyImporting) {
-      const nextImportIndex = imageImports.findIndex(
-        (imageImport) => !imageImport["error"] && !imageImport["imported"]
+  async function sendChunkedUploadRequest(url, options) {
+    let res;
+    try {
+      res = await fetch(url, {
+        credentials: "same-origin",
+        ...options,
+        headers: { "X-CSRFToken": props.csrfToken, ...options.headers },
+      });
+    } catch (error) {
+      throw new ImportError("Failed to upload to Wagtail", true);
+    }
+    if (res.status != 200 && res.status != 409) {
+      throw new ImportError(
+        "Failed to upload to Wagtail",
+        isRetryableUploadStatus(res.status)
       );
-      const nextImport = imageImports[nextImportIndex];
-      if (nextImport) {
-        startImport(nextImport, nextImportIndex);
+    }
+    return res.json();
+  }
+
+  async function uploadInChunks(imageFile, newImport, index) {
+    let upload = chunkedUploads.current.get(index);
+    if (upload) {
+      // resume from the last chunk the server acknowledged
+      const status = await sendChunkedUploadRequest(
+        props.chunkedUploadUrl + upload.uploadId + "/",
+        { method: "GET" }
+      );
+      upload.received = status["received"];
+    } else {
+      let formData = new FormData();
+      formData.append("drive_id", newImport["drive_id"]);
+      formData.append("wagtail_id", newImport["wagtail_id"]);
+      formData.append("action", newImport["action"]);
+      formData.append("name", newImport["name"]);
+      formData.append("collection", props.collection);
+      appendLedgerFields(formData, newImport);
+      formData.append("size", imageFile.size);
+      const res = await sendChunkedUploadRequest(props.chunkedUploadUrl, {
+        method: "POST",
+        body: formData,
+      });
+      upload = {
+        uploadId: res["upload_id"],
+        chunkSize: res["chunk_size"],
+        received: res["received"],
+      };
+      chunkedUploads.current.set(index, upload);
+    }
+
+    const uploadUrl = props.chunkedUploadUrl + upload.uploadId + "/";
+    while (upload.received < imageFile.size) {
+      const end = Math.min(upload.received + upload.chunkSize, imageFile.size);
+      const res = await sendChunkedUploadRequest(uploadUrl, {
+        method: "PUT",
+        body: imageFile.slice(upload.received, end),
+        headers: {
+          "Content-Type": "application/octet-stream",
+          "Content-Range":
+            "bytes " + upload.received + "-" + (end - 1) + "/" + imageFile.size,
+        },
+      });
+      // a rejected chunk also reports how much the server has, so carry on from there
+      upload.received = res["received"];
+      setImageParam(
+        "progress",
+        Math.round(50 + (50 * upload.received) / imageFile.size),
+        index
+      );
+    }
+
+    const res = await sendChunkedUploadRequest(uploadUrl + "finish/", {
+      method: "POST",
+    });
+    chunkedUploads.current.delete(index);
+    return res;
+  }
+
+  function pollImportJobs() {
+    // fetch the status of every pending job in one request
+    fetch(
+      props.importJobsUrl +
+        "?ids=" +
+        Array.from(pendingJobs.current.keys()).join(","),
+      { credentials: "same-origin" }
+    )
+      .then((res) => res.json())
+      .then((res) => {
+        Object.entries(res["jobs"]).forEach(([jobId, job]) => {
+          const onFinished = pendingJobs.current.get(parseInt(jobId));
+          if (
+            onFinished &&
+            (job["status"] == "succeeded" || job["status"] == "failed")
+          ) {
+            pendingJobs.current.delete(parseInt(jobId));
+            onFinished(job);
+          }
+        });
+        if (pendingJobs.current.size === 0) {
+          clearInterval(jobPoller.current);
+          jobPoller.current = null;
+        }
+      })
+      .catch((error) => {
+        console.error(error);
+      });
+  }
+
+  function waitForImportJob(jobId) {
+    return new Promise((resolve) => {
+      pendingJobs.current.set(jobId, resolve);
+      if (!jobPoller.current) {
+        jobPoller.current = setInterval(
+          pollImportJobs,
+          props.importJobPollInterval
+        );
       }
+    });
+  }
+
+  function setImportResult(res, index) {
+    setImageParam("imported", true, index);
+    setImageParam("error", res["error"], index);
+    setImageParam("form", res["form"], index);
+    setImageParam("form_url", res["form_url"], index);
+    setImageParam("edit_action", res["edit_action"], index);
+    setImageParam("delete_action", res["delete_action"], index);
+    setImageParam("progress", 100, index);
+  }
+
+  async function runImport(newImport, index) {
+    if (newImport["unchanged"]) {
+      // skip the download and upload: the image already has this file
+      setImageParam("imported", true, index);
+      setImageParam("message", "Unchanged since it was last imported.", index);
+      setImageParam("progress", 100, index);
+      return;
     }
-  }, [currentlyImporting]);
+    for (let attempt = 1; ; attempt++) {
+      try {
+        let res;
+        if (props.serverSideDriveFetch && isBatchingImports()) {
+          // the server fetches a batch's files one after another, so there's no progress to poll for
+          res = await addToImportBatch(null, newImport, index);
+        } else if (props.serverSideDriveFetch) {
+          const stopPolling = pollServerFetchProgress(newImport, index);
+          try {
+            res = await uploadToWagtail(null, newImport, index);
+          } finally {
+            stopPolling();
+          }
+        } else {
+          let imageFile = downloadedFiles.current.get(index);
+          if (!imageFile) {
+            imageFile = await downloadFromDrive(newImport, index);
+          }
+          if (imageFile.size > props.chunkedUploadThreshold) {
+            // keep the file so that a retry can resume the upload without downloading it again
+            downloadedFiles.current.set(index, imageFile);
+            try {
+              res = await uploadInChunks(imageFile, newImport, index);
+            } catch (error) {
+              if (!error.retryable || attempt >= MAX_IMPORT_ATTEMPTS) {
+                downloadedFiles.current.delete(index);
+              }
+              throw error;
+            }
+            downloadedFiles.current.delete(index);
+          } else if (isBatchingImports()) {
+            res = await addToImportBatch(imageFile, newImport, index);
+          } else {
+            res = await uploadToWagtail(imageFile, newImport, index);
+          }
+        }
+        if (res["job_id"]) {
+          // the import was queued to run in the background: free up this slot for the next
+          // import, and show the result once the job has finished
+          setImageParam("progress", 90, index);
+          waitForImportJob(res["job_id"]).then((job) =>
+            setImportResult(job, index)
+          );
+        } else {
+          setImportResult(res, index);
+        }
+        return;
+      } catch (error) {
+        if (!error.retryable || attempt >= MAX_IMPORT_ATTEMPTS) {
+          setImageParam("progress", 0, index);
+          setImageParam("error", error.message, index);
+          return;
+        }
+        // back off exponentially before retrying
+        await new Promise((resolve) =>
+          setTimeout(resolve, RETRY_DELAY * 2 ** (attempt - 1))
+        );
+      }
+    }
+  }
+
+  function startImport(newImport, index) {
+    const bufferSize = getBufferSize(newImport);
+    startedImports.current.add(index);
+    activeImports.current.add(index);
+    bufferedBytes.current += bufferSize;
+    runImport(newImport, index).finally(() => {
+      activeImports.current.delete(index);
+      bufferedBytes.current -= bufferSize;
+      setFinishedCount((count) => count + 1);
+    });
+  }
+
+  React.useEffect(() => {
+    // start as many imports as the concurrency and memory limits allow
+    let waitingForMemory = false;
+    for (let index = 0; index < imageImports.length; index++) {
+      if (activeImports.current.size >= props.maxConcurrentImports) {
+        break;
+      }
+      const imageImport = imageImports[index];
+      if (startedImports.current.has(index)) {
+        continue;
+      }
+      if (
+        (activeImports.current.size > 0 || importBatch.current.length > 0) &&
+        bufferedBytes.current + getBufferSize(imageImport) >
+          props.maxBufferedBytes
+      ) {
+        // wait for active or batched imports to release their memory
+        waitingForMemory = true;
+        break;
+      }
+      startImport(imageImport, index);
+    }
+    // send a partly filled batch once no other import can join it
+    if (
+      importBatch.current.length > 0 &&
+      (activeImports.current.size === 0 || waitingForMemory)
+    ) {
+      sendImportBatch();
+    }
+  }, [finishedCount]);
+
+  React.useEffect(() => {
+    if (!props.deferSearchIndexing) {
+      return;
+    }
+    // images edited during this session are only queued for indexing, so index them all
+    // at once when the user leaves the page
+    function flushSearchIndex() {
+      let formData = new FormData();
+      formData.append("csrfmiddlewaretoken", props.csrfToken);
+      navigator.sendBeacon(props.flushSearchIndexUrl, formData);
+    }
+    window.addEventListener("pagehide", flushSearchIndex);
+    return () => {
+      window.removeEventListener("pagehide", flushSearchIndex);
+    };
+  }, []);
 
   function getDisplay(imageImport, index) {
     if (imageImport.finished) {
@@ -220,6 +651,17 @@ function FileImporter(props) {
           setImageParam("edit_action", res["edit_action"], index);
           setImageParam("delete_action", res["delete_action"], index);
         }}
+        onFormRequested={() => {
+          // the server sent only the URL of the edit form, so fetch it now that it's wanted
+          fetch(imageImport.form_url, { credentials: "same-origin" })
+            .then((res) => res.json())
+            .then((res) => {
+              setImageParam("form", res["form"], index);
+            })
+            .catch((error) => {
+              console.error(error);
+            });
+        }}
         csrfToken={props.csrfToken}
         tagitOpts={props.tagitOpts}
       />
@@ -291,7 +733,8 @@ function ImageImportDisplay(props) {
         >
           {props.imageImport.error || !props.imageImport.imported
             ? props.imageImport.error
-            : "Image successfully imported. Please update this image with a more appropriate title, if necessary. You may also delete the image completely if the import wasn't required."}
+            : props.imageImport.message ||
+              "Image successfully imported. Please update this image with a more appropriate title, if necessary. You may also delete the image completely if the import wasn't required."}
         </p>
         {props.imageImport.form ? (
           <ImportUpdateForm
@@ -302,6 +745,14 @@ function ImageImportDisplay(props) {
             csrfToken={props.csrfToken}
             tagitOpts={props.tagitOpts}
           />
+        ) : props.imageImport.form_url ? (
+          <button
+            type="button"
+            class="button button-secondary"
+            onClick={props.onFormRequested}
+          >
+            Edit
+          </button>
         ) : null}
       </div>
     </li>
@@ -392,40 +843,90 @@ function ImportUpdateForm(props) {
 function DuplicateIdentifier(props) {
   const [potentialDuplicates, setPotentialDuplicates] = React.useState({});
   const [duplicateActions, setDuplicateActions] = React.useState({});
+  // whether every duplicate has been received, as they are streamed in as they are found
+  const [finished, setFinished] = React.useState(false);
+  // set if looking for duplicates failed, so that the duplicates found so far can still be acted on
+  const [error, setError] = React.useState(null);
   React.useEffect(() => {
     // query potential duplicates in Wagtail
     const data = JSON.stringify(props.imageData);
+    let found = {};
+    let receivedAll = false;
+
+    function addResults(lines) {
+      let newActions = {};
+      for (const line of lines) {
+        const result = JSON.parse(line);
+        if (result["done"]) {
+          receivedAll = true;
+          setFinished(true);
+          props.onGetDuplicateData(found);
+          // if no duplicates, confirm no actions without needing confirmation button click
+          if (Object.keys(found).length == 0) {
+            props.onConfirmDuplicateActions({});
+          }
+        } else {
+          found[result["id"]] = result["duplicate"];
+          // set default actions
+          newActions[result["id"]] = "replace";
+        }
+      }
+      if (Object.keys(newActions).length > 0) {
+        setPotentialDuplicates({ ...found });
+        setDuplicateActions((actions) => ({ ...newActions, ...actions }));
+      }
+    }
+
+    async function readResults(res) {
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+          break;
+        }
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        // the last line may not have been received in full yet
+        buffered = lines.pop();
+        addResults(lines.filter((line) => line));
+      }
+    }
+
     fetch(props.duplicateReviewUrl, {
       method: "post",
       headers: {
-        Accept: "application/json, text/plain, */*",
+        Accept: "application/x-ndjson",
         "Content-Type": "application/json",
+        // used to fetch Drive thumbnails when looking for near duplicates
+        "X-Drive-OAuth-Token": gapi.auth2
+          .getAuthInstance()
+          .currentUser.get()
+          .getAuthResponse().access_token,
       },
       body: data,
     })
       .then((res) => {
         if (res.ok) {
-          res.json().then((res_json) => {
-            setPotentialDuplicates(res_json);
-            props.onGetDuplicateData(res_json);
-            let duplicateIds = Object.keys(res_json);
-            // set default actions
-            let actions = {};
-            for (let index = 0; index < duplicateIds.length; index++) {
-              actions[duplicateIds[index]] = "replace";
-            }
-            setDuplicateActions(actions);
-            // if no duplicates, confirm no actions without needing confirmation button click
-            if (duplicateIds.length == 0) {
-              props.onConfirmDuplicateActions({});
-            }
-          });
+          return readResults(res);
         } else {
-          console.error(res);
+          throw res;
         }
       })
       .catch((error) => {
         console.error(error);
+      })
+      .finally(() => {
+        if (!receivedAll) {
+          // the request failed or the stream ended early, so no more duplicates are coming: stop waiting for
+          // them, so that the ones found so far can still be confirmed
+          setError(
+            "Not every duplicate could be identified. Please check for duplicates yourself, or try again."
+          );
+          setFinished(true);
+          props.onGetDuplicateData(found);
+        }
       });
   }, [props.selectedImageData]);
 
@@ -494,6 +995,7 @@ function DuplicateIdentifier(props) {
           <p>
             <b>{Object.keys(potentialDuplicates).length} duplicates detected</b>
           </p>
+          {error ? <p class="status-msg failure">{error}</p> : null}
           <table class="listing">
             <thead>
               <tr class="table-headers">
@@ -516,6 +1018,9 @@ function DuplicateIdentifier(props) {
               {duplicateComparisons}
             </tbody>
           </table>
+          {finished ? null : (
+            <LoadingSpinner message="Identifying more duplicates" />
+          )}
         </div>
         <footer>
           <ul>
@@ -523,6 +1028,7 @@ function DuplicateIdentifier(props) {
               <button
                 type="submit"
                 class="button"
+                disabled={!finished}
                 onClick={() =>
                   props.onConfirmDuplicateActions(duplicateActions)
                 }
@@ -534,6 +1040,27 @@ function DuplicateIdentifier(props) {
         </footer>
       </React.Fragment>
     );
+  } else if (error) {
+    return (
+      <React.Fragment>
+        <div class="nice-padding">
+          <p class="status-msg failure">{error}</p>
+        </div>
+        <footer>
+          <ul>
+            <li class="actions">
+              <button
+                type="submit"
+                class="button"
+                onClick={() => props.onConfirmDuplicateActions({})}
+              >
+                Import all
+              </button>
+            </li>
+          </ul>
+        </footer>
+      </React.Fragment>
+    );
   } else {
     return (
       <div class="nice-padding">
@@ -590,6 +1117,7 @@ function DuplicateComparison(props) {
               src={props.wagtailDuplicate["thumbnail"]}
               width="165"
               height="165"
+              loading="lazy"
             />
           </td>
           <td>
@@ -616,7 +1144,14 @@ function DuplicateComparison(props) {
           <td>
             <p>Created at {props.wagtailDuplicate["created_at"]}</p>
           </td>
-          <td></td>
+          <td>
+            {props.wagtailDuplicate["near_duplicate"] ? (
+              <p>Similar image</p>
+            ) : null}
+            {props.wagtailDuplicate["unchanged"] ? (
+              <p>Unchanged since it was imported</p>
+            ) : null}
+          </td>
         </tr>
       </tbody>
     </table>
@@ -701,7 +1236,7 @@ function DriveSelector(props) {
           q: q,
           pageSize: 1000,
           fields:
-            "nextPageToken, files(id, name, thumbnailLink, fileExtension, md5Checksum, size, imageMediaMetadata)",
+            "nextPageToken, files(id, name, thumbnailLink, fileExtension, md5Checksum, headRevisionId, modifiedTime, size, imageMediaMetadata)",
         });
         imageData.push(...response.result.files);
       }
@@ -710,7 +1245,7 @@ function DriveSelector(props) {
           let response = await gapi.client.drive.files.get({
             fileId: images[index].id,
             fields:
-              "id, name, thumbnailLink, fileExtension, md5Checksum, size, imageMediaMetadata",
+              "id, name, thumbnailLink, fileExtension, md5Checksum, headRevisionId, modifiedTime, size, imageMediaMetadata",
           });
           imageData.push(response.result);
         }
@@ -763,6 +1298,18 @@ ReactDOM.render(
     }}
     driveParent={domContainer.dataset.driveParent}
     indexUrl={domContainer.dataset.indexUrl}
+    serverSideDriveFetch={domContainer.dataset.serverSideDriveFetch == "true"}
+    driveFetchProgressUrl={domContainer.dataset.driveFetchProgressUrl}
+    maxConcurrentImports={parseInt(domContainer.dataset.maxConcurrentImports)}
+    maxBufferedBytes={parseInt(domContainer.dataset.maxBufferedBytes)}
+    importJobsUrl={domContainer.dataset.importJobsUrl}
+    importJobPollInterval={parseInt(domContainer.dataset.importJobPollInterval)}
+    deferSearchIndexing={domContainer.dataset.deferSearchIndexing == "true"}
+    flushSearchIndexUrl={domContainer.dataset.flushSearchIndexUrl}
+    chunkedUploadUrl={domContainer.dataset.chunkedUploadUrl}
+    chunkedUploadThreshold={parseInt(domContainer.dataset.chunkedUploadThreshold)}
+    bulkImportUrl={domContainer.dataset.bulkImportUrl}
+    importBatchSize={parseInt(domContainer.dataset.importBatchSize)}
   />,
   domContainer
 );
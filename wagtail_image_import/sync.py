@@ -0,0 +1,201 @@
+import logging
+
+from django.utils import timezone
+
+from .drive import DriveAuthError, DriveFetchError, fetch_drive_file, get_drive_json
+from .importing import apply_duplicate_policy, get_failure_result, import_image_file
+from .models import LEDGER_FIELDS, DriveIDMapping
+from .utils import get_duplicate_scoring_plan
+
+
+logger = logging.getLogger(__name__)
+
+# the Drive fields needed to sync a file, on top of those used to find its duplicates
+SYNC_FILE_FIELDS = [
+    "id",
+    "name",
+    "mimeType",
+    "parents",
+    "trashed",
+    *LEDGER_FIELDS,
+]
+
+PAGE_SIZE = 1000
+
+
+def get_file_fields():
+    fields = set(SYNC_FILE_FIELDS)
+    plan = get_duplicate_scoring_plan()
+    fields.update("/".join(drive_path) for drive_path, *rest in plan.fields)
+    return ",".join(sorted(fields))
+
+
+def is_synced_file(file_data, folder_id):
+    """
+    Returns whether a Drive file is an image in the folder, and so should be imported
+    """
+    return (
+        not file_data.get("trashed")
+        and folder_id in file_data.get("parents", [])
+        and file_data.get("mimeType", "").startswith("image/")
+    )
+
+
+def get_start_page_token(oauth_token):
+    return get_drive_json("changes/startPageToken", oauth_token)["startPageToken"]
+
+
+def list_folder_files(folder_id, oauth_token):
+    query = "'{}' in parents and trashed = false".format(folder_id.replace("'", "\\'"))
+    params = {
+        "q": query,
+        "fields": "nextPageToken,files({})".format(get_file_fields()),
+        "pageSize": PAGE_SIZE,
+    }
+    while True:
+        page = get_drive_json("files", oauth_token, **params)
+        yield from page.get("files", [])
+        if not page.get("nextPageToken"):
+            return
+        params["pageToken"] = page["nextPageToken"]
+
+
+def list_changed_files(page_token, oauth_token):
+    """
+    Returns the latest data of each file changed since page_token (leaving out removed files), and the page token
+    to list later changes from - or page_token itself, if the listing ends without one
+    """
+    files = {}
+    params = {
+        "pageToken": page_token,
+        "fields": "nextPageToken,newStartPageToken,changes(fileId,removed,file({}))".format(
+            get_file_fields()
+        ),
+        "pageSize": PAGE_SIZE,
+    }
+    while True:
+        page = get_drive_json("changes", oauth_token, **params)
+        for change in page.get("changes", []):
+            if change.get("removed") or not change.get("file"):
+                files.pop(change["fileId"], None)
+            else:
+                files[change["fileId"]] = change["file"]
+        if page.get("newStartPageToken"):
+            return list(files.values()), page["newStartPageToken"]
+        if not page.get("nextPageToken"):
+            # without a token to carry on from, list the same changes again next time
+            logger.warning(
+                "Drive changes since %s ended without a page token", page_token
+            )
+            return list(files.values()), page_token
+        params["pageToken"] = page["nextPageToken"]
+
+
+def sync_file(folder_sync, file_data, mapping, oauth_token, duplicate_policy):
+    """
+    Imports a Drive file into the synced collection, replacing the image it was previously imported as (given by
+    its DriveIDMapping, mapping) if there is one, or else handling its most likely duplicate according to
+    duplicate_policy. Files which haven't changed since they were imported are skipped without being fetched
+    """
+    import_data = {
+        "drive_id": file_data["id"],
+        "name": file_data.get("name", ""),
+        "collection": folder_sync.collection_id,
+        "action": "keep",
+        **{
+            field: file_data.get(drive_field)
+            for drive_field, field in LEDGER_FIELDS.items()
+        },
+    }
+    if mapping is not None:
+        if mapping.is_unchanged(file_data, mapping.image.file_hash):
+            return {
+                "drive_id": file_data["id"],
+                "success": True,
+                "skipped": True,
+                "image_id": mapping.image_id,
+            }
+        import_data.update(action="replace", wagtail_id=mapping.image_id)
+    else:
+        skipped_result = apply_duplicate_policy(
+            file_data, import_data, duplicate_policy
+        )
+        if skipped_result:
+            return skipped_result
+
+    try:
+        image_file = fetch_drive_file(
+            file_data["id"], oauth_token, import_data["name"]
+        )
+    except DriveAuthError:
+        # rejected credentials would fail every other file too, so stop the sync rather than report each one
+        raise
+    except DriveFetchError:
+        logger.exception("Fetching Drive file %s failed", file_data["id"])
+        return get_failure_result(file_data["id"], "Failed to import from Google")
+    try:
+        result = import_image_file(folder_sync.user, import_data, image_file)
+    except Exception:
+        # one bad file shouldn't stop the rest of the sync
+        logger.exception("Importing Drive file %s failed", file_data["id"])
+        return get_failure_result(file_data["id"], "Failed to import")
+    finally:
+        image_file.close()
+    result["replaced"] = import_data["action"] == "replace"
+    return result
+
+
+def sync_folder(folder_sync, oauth_token, duplicate_policy="skip"):
+    """
+    Imports the images added to or changed in a synced Drive folder since it was last synced, or on the first sync,
+    every image in the folder which hasn't already been imported, and returns the result of each. Images are
+    neither deleted nor moved when their files are removed from the folder. The page token is only advanced if
+    every file was imported, so that failed files are tried again on the next sync
+    """
+    if folder_sync.page_token:
+        changed_files, page_token = list_changed_files(
+            folder_sync.page_token, oauth_token
+        )
+        files = [
+            file_data
+            for file_data in changed_files
+            if is_synced_file(file_data, folder_sync.folder_id)
+        ]
+        mappings = {
+            mapping.drive_id: mapping
+            for mapping in DriveIDMapping.objects.filter(
+                drive_id__in=[file_data["id"] for file_data in files]
+            ).select_related("image")
+        }
+    else:
+        # get the token before listing the folder, so that changes made while it is listed are picked up next time
+        page_token = get_start_page_token(oauth_token)
+        files = [
+            file_data
+            for file_data in list_folder_files(folder_sync.folder_id, oauth_token)
+            if is_synced_file(file_data, folder_sync.folder_id)
+        ]
+        # files imported before the folder was synced are left as they are
+        imported_ids = set(
+            DriveIDMapping.objects.filter(
+                drive_id__in=[file_data["id"] for file_data in files]
+            ).values_list("drive_id", flat=True)
+        )
+        files = [file_data for file_data in files if file_data["id"] not in imported_ids]
+        mappings = {}
+
+    results = [
+        sync_file(
+            folder_sync,
+            file_data,
+            mappings.get(file_data["id"]),
+            oauth_token,
+            duplicate_policy,
+        )
+        for file_data in files
+    ]
+    if all(result["success"] for result in results):
+        folder_sync.page_token = page_token
+    folder_sync.last_synced_at = timezone.now()
+    folder_sync.save(update_fields=["page_token", "last_synced_at"])
+    return results
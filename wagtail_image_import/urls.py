@@ -1,16 +1,53 @@
 from django.urls import path
 
-from .views import create_from_uploaded_image, edit, import_from_drive, find_duplicates
+from .views import (
+    chunked_upload,
+    create_from_uploaded_image,
+    drive_fetch_progress,
+    edit,
+    edit_form,
+    import_bulk,
+    import_from_drive,
+    import_jobs,
+    find_duplicates,
+    finish_chunked_upload,
+    flush_search_index,
+    start_chunked_upload,
+    thumbnail,
+    uploaded_image_form,
+)
 
 
 app_name = "wagtail_image_import"
 urlpatterns = [
     path("import/", import_from_drive, name="import"),
+    path("import/bulk/", import_bulk, name="import_bulk"),
+    path("import/jobs/", import_jobs, name="import_jobs"),
+    path("import/uploads/", start_chunked_upload, name="start_chunked_upload"),
+    path(
+        "import/uploads/<uuid:upload_id>/", chunked_upload, name="chunked_upload"
+    ),
+    path(
+        "import/uploads/<uuid:upload_id>/finish/",
+        finish_chunked_upload,
+        name="finish_chunked_upload",
+    ),
     path("edit/<int:image_id>/", edit, name="edit"),
+    path("edit-form/<int:image_id>/", edit_form, name="edit_form"),
     path("find-duplicates/", find_duplicates, name="find_duplicates"),
+    path("thumbnail/<int:image_id>/", thumbnail, name="thumbnail"),
+    path("flush-search-index/", flush_search_index, name="flush_search_index"),
+    path(
+        "drive-fetch-progress/", drive_fetch_progress, name="drive_fetch_progress"
+    ),
     path(
         "create-from-uploaded-image/<int:uploaded_image_id>/",
         create_from_uploaded_image,
         name="create_from_uploaded_image",
     ),
+    path(
+        "uploaded-image-form/<int:uploaded_image_id>/",
+        uploaded_image_form,
+        name="uploaded_image_form",
+    ),
 ]
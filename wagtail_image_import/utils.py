@@ -1,49 +1,361 @@
-from django.db.models import Count, F, Q
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.exceptions import FieldError, ImproperlyConfigured
+from django.db.models import Count
 
 from wagtail.images import get_image_model
+from wagtail.images.models import Filter
+
+from .duplicate_backends import QUERY_CHUNK_SIZE, chunked, get_duplicate_backend
+from .duplicate_cache import invalidate_drive_ids
+from .fingerprints import (
+    FINGERPRINT_FIELDS,
+    normalize_fingerprint_value,
+    set_fingerprint_drive_ids,
+)
+from .fuzzy_titles import (
+    FUZZY_TITLE_FIELD,
+    get_fuzzy_title_threshold,
+    get_similarity,
+    get_title_ngrams,
+)
+from .models import (
+    LEDGER_FIELDS,
+    DriveIDMapping,
+    DuplicateFindingMixin,
+    DuplicateFingerprint,
+    TitleNGram,
+)
+
+
+DEFAULT_FIELD_MAPPING = {"id": "driveidmapping__drive_id", "name": "title"}
+# maps drive fields to db fields
+# if using DuplicateFindingMixin, you can also add imageMediaMetadata__time: exif_datetime, and md5Checksum: md5_hash
+
+# the fingerprint-backed fields which are only filled in for image models using DuplicateFindingMixin
+MIXIN_FINGERPRINT_FIELDS = {"md5_hash", "exif_datetime"}
+
+DEFAULT_FIELD_WEIGHTING = {"driveidmapping__drive_id": 10, "md5Checksum": 5, "title": 2}
+# maps db fields to their weighting when finding most likely duplicate - default weighting is 1
+
+
+class DuplicateScoringPlan:
+    """
+    The duplicate finding settings, validated and compiled into what each lookup needs: the path of each mapped
+    Drive field within the Drive data, its weighting, and a template queryset for its matches. Building a plan
+    raises ImproperlyConfigured for a field mapping or weighting which can't be used
+    """
+
+    def __init__(self, field_mapping, field_weighting):
+        if not isinstance(field_mapping, dict):
+            raise ImproperlyConfigured(
+                "WAGTAILIMAGEIMPORT_FIELD_MAPPING must be a dict of Drive fields to db fields"
+            )
+        if not isinstance(field_weighting, dict):
+            raise ImproperlyConfigured(
+                "WAGTAILIMAGEIMPORT_FIELD_WEIGHTING must be a dict of db fields to weightings"
+            )
+        for db_field, weighting in field_weighting.items():
+            if isinstance(weighting, bool) or not isinstance(weighting, (int, float)):
+                raise ImproperlyConfigured(
+                    "The weighting of '{}' in WAGTAILIMAGEIMPORT_FIELD_WEIGHTING must be a number".format(
+                        db_field
+                    )
+                )
+
+        Image = get_image_model()
+        self.field_mapping = field_mapping
+        self.field_weighting = field_weighting
+        # a list of (drive path, db field, weighting, template queryset, lookup) for each mapped field
+        self.fields = []
+        for drive_field, db_field in field_mapping.items():
+            if not (isinstance(drive_field, str) and isinstance(db_field, str)):
+                raise ImproperlyConfigured(
+                    "WAGTAILIMAGEIMPORT_FIELD_MAPPING must map Drive field names to db field names"
+                )
+            if db_field == FUZZY_TITLE_FIELD:
+                queryset, lookup = None, None
+            elif db_field in FINGERPRINT_FIELDS:
+                if db_field in MIXIN_FINGERPRINT_FIELDS and not issubclass(
+                    Image, DuplicateFindingMixin
+                ):
+                    # the fingerprints would all be empty, so the field would never match
+                    raise ImproperlyConfigured(
+                        "'{}' in WAGTAILIMAGEIMPORT_FIELD_MAPPING needs {} to use DuplicateFindingMixin".format(
+                            db_field, Image._meta.label
+                        )
+                    )
+                lookup = FINGERPRINT_FIELDS[db_field]
+                queryset = DuplicateFingerprint.objects.values_list("image_id", lookup)
+            else:
+                lookup = db_field
+                try:
+                    queryset = Image.objects.values_list("pk", lookup)
+                except FieldError as e:
+                    raise ImproperlyConfigured(
+                        "'{}' in WAGTAILIMAGEIMPORT_FIELD_MAPPING is not a field of {}: {}".format(
+                            db_field, Image._meta.label, e
+                        )
+                    )
+            self.fields.append(
+                (
+                    tuple(drive_field.split("__")),
+                    db_field,
+                    field_weighting.get(db_field, 1),
+                    queryset,
+                    lookup,
+                )
+            )
+
+    def get_lookup_values(self, image_data):
+        """
+        Returns a dict of the non-empty lookup values of a Drive item, by db field. Only the mapped Drive fields
+        are read, rather than flattening the whole item
+        """
+        lookup_values = {}
+        for path, db_field, weighting, queryset, lookup in self.fields:
+            value = image_data
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            if isinstance(value, dict):
+                continue
+            value = get_lookup_value(value, db_field)
+            if value:
+                lookup_values[db_field] = value
+        return lookup_values
+
+    def get_most_likely_duplicates(self, image_data_list):
+        """
+        Finds the most likely duplicate of every item in image_data_list, returning a list of images (or None where
+        no duplicate exists) in the same order. The matches for each mapped field are found by the duplicate
+        backend - with the default DatabaseDuplicateBackend, one query per field (per chunk of values) - and
+        scored here, with one more query to fetch the matched images, so the number of queries does not grow
+        with the number of items
+        """
+        lookup_values_list = [
+            self.get_lookup_values(image_data) for image_data in image_data_list
+        ]
+
+        backend = get_duplicate_backend()
+        matches = {}
+        # maps each db field to a dict of {value: {matching image pk: similarity}}
+        for path, db_field, weighting, queryset, lookup in self.fields:
+            values = {
+                lookup_values[db_field]
+                for lookup_values in lookup_values_list
+                if db_field in lookup_values
+            }
+            if not values:
+                continue
+            if db_field == FUZZY_TITLE_FIELD:
+                matches[db_field] = find_similar_titles(values)
+                continue
+            matches[db_field] = backend.get_matches(db_field, lookup, queryset, values)
+
+        best_matches = []
+        for lookup_values in lookup_values_list:
+            scores = defaultdict(int)
+            for path, db_field, weighting, queryset, lookup in self.fields:
+                if db_field not in lookup_values or db_field not in matches:
+                    continue
+                for pk, similarity in (
+                    matches[db_field].get(lookup_values[db_field], {}).items()
+                ):
+                    scores[pk] += weighting * similarity
+            # order by the weighted number of matching fields, using the lowest pk to break ties
+            best_matches.append(
+                min(scores, key=lambda pk: (-scores[pk], pk)) if scores else None
+            )
+
+        images = (
+            get_image_model()
+            .objects.select_related("driveidmapping")
+            .in_bulk({pk for pk in best_matches if pk is not None})
+        )
+        return [images.get(pk) for pk in best_matches]
+
+
+_duplicate_scoring_plan = None
+
+
+def get_duplicate_scoring_plan():
+    """
+    Returns the DuplicateScoringPlan for the WAGTAILIMAGEIMPORT_FIELD_MAPPING and WAGTAILIMAGEIMPORT_FIELD_WEIGHTING
+    settings. This is first built when the app is ready, so that a bad configuration fails at startup
+    """
+    global _duplicate_scoring_plan
+    if _duplicate_scoring_plan is None:
+        _duplicate_scoring_plan = DuplicateScoringPlan(
+            getattr(settings, "WAGTAILIMAGEIMPORT_FIELD_MAPPING", DEFAULT_FIELD_MAPPING),
+            getattr(
+                settings, "WAGTAILIMAGEIMPORT_FIELD_WEIGHTING", DEFAULT_FIELD_WEIGHTING
+            ),
+        )
+    return _duplicate_scoring_plan
+
+
+def reset_duplicate_scoring_plan(setting, **kwargs):
+    global _duplicate_scoring_plan
+    if setting in (
+        "WAGTAILIMAGEIMPORT_FIELD_MAPPING",
+        "WAGTAILIMAGEIMPORT_FIELD_WEIGHTING",
+    ):
+        _duplicate_scoring_plan = None
 
 
 def get_most_likely_duplicate(drive_image_info, field_mapping, field_weighting):
-    filters = {}
-    or_filter = Q()
-    drive_image_info = flatten(drive_image_info)
-
-    for drive_field, db_field in field_mapping.items():
-        value = drive_image_info.get(drive_field, None)
-        if not value:
-            # don't find duplicates for empty data, likely to match too many
-            continue
-        field_filter = Q(**{db_field: value})
-        filters[db_field] = field_filter
-        or_filter = or_filter | field_filter
-
-    if not filters:
-        # if no filters are applied, no duplicates exist
-        return None
+    return get_most_likely_duplicates([drive_image_info], field_mapping, field_weighting)[0]
+
+
+def get_most_likely_duplicates(image_data_list, field_mapping, field_weighting):
+    return DuplicateScoringPlan(
+        field_mapping, field_weighting
+    ).get_most_likely_duplicates(image_data_list)
+
+
+def find_similar_titles(titles, threshold=None):
+    """
+    Finds the images whose titles are similar to each of titles, returning a dict of {title: {image pk: similarity}}
+    including only similarities of at least threshold.
 
-    qs = get_image_model().objects.select_related("driveidmapping").filter(or_filter)
-    # find images matching any of the fields
+    Rather than comparing against every title, this uses prefix filtering: a title can only reach the threshold
+    if it shares at least min_overlap of the query's trigrams, so it must contain at least one of the
+    (len(query trigrams) - min_overlap + 1) rarest of them. Only the index entries for those rare trigrams are
+    read to find candidates, whose similarity is then calculated exactly from their titles
+    """
+    if threshold is None:
+        threshold = get_fuzzy_title_threshold()
+    query_ngrams = {title: get_title_ngrams(title) for title in titles}
+    all_ngrams = set().union(*query_ngrams.values()) if query_ngrams else set()
+    if not all_ngrams:
+        return {}
 
-    total_filter_count_annotation = 0
-    for db_field, field_filter in filters.items():
-        cnt_name = db_field + "__true_cnt"
-        qs = qs.annotate(**{cnt_name: Count("id", filter=field_filter)})
-        total_filter_count_annotation += field_weighting.get(db_field, 1) * F(cnt_name)
+    frequencies = Counter()
+    for ngrams_chunk in chunked(sorted(all_ngrams), QUERY_CHUNK_SIZE):
+        frequencies.update(
+            dict(
+                TitleNGram.objects.filter(ngram__in=ngrams_chunk)
+                .values_list("ngram")
+                .annotate(count=Count("image"))
+                .order_by()
+            )
+        )
 
-    qs = qs.annotate(match_filter_cnt=total_filter_count_annotation).order_by(
-        "-match_filter_cnt"
-    )
-    # order by the number of matching fields
+    prefixes = {}
+    for title, ngrams in query_ngrams.items():
+        # Dice >= threshold requires 2 * overlap >= threshold * (len(ngrams) + len(other)) >= threshold *
+        # (len(ngrams) + overlap), so overlap >= threshold * len(ngrams) / (2 - threshold)
+        min_overlap = max(math.ceil(threshold * len(ngrams) / (2 - threshold)), 1)
+        rarest = sorted(ngrams, key=lambda ngram: (frequencies[ngram], ngram))
+        prefixes[title] = {
+            ngram
+            for ngram in rarest[: len(ngrams) - min_overlap + 1]
+            if frequencies[ngram]
+        }
 
-    return qs.first()
+    postings = defaultdict(set)
+    for ngrams_chunk in chunked(
+        sorted(set().union(*prefixes.values())), QUERY_CHUNK_SIZE
+    ):
+        for ngram, image_id in TitleNGram.objects.filter(
+            ngram__in=ngrams_chunk
+        ).values_list("ngram", "image_id"):
+            postings[ngram].add(image_id)
 
+    candidates = {
+        title: set().union(*(postings[ngram] for ngram in prefix))
+        for title, prefix in prefixes.items()
+    }
+    candidate_ngrams = {}
+    for pks_chunk in chunked(
+        sorted(set().union(*candidates.values())), QUERY_CHUNK_SIZE
+    ):
+        for image_id, title in DuplicateFingerprint.objects.filter(
+            image_id__in=pks_chunk
+        ).values_list("image_id", "title"):
+            candidate_ngrams[image_id] = get_title_ngrams(title)
+
+    similar_titles = {}
+    for title, pks in candidates.items():
+        similarities = {}
+        for pk in pks:
+            similarity = get_similarity(
+                query_ngrams[title], candidate_ngrams.get(pk, set())
+            )
+            if similarity >= threshold:
+                similarities[pk] = similarity
+        similar_titles[title] = similarities
+    return similar_titles
+
+
+def set_drive_id_mappings(drive_ids, ledgers=None):
+    """
+    Creates or updates the DriveIDMappings of many images at once, given a dict of {image pk: drive id}, and
+    optionally a dict of {image pk: {mapping field: value}} of the ledger fields (and file_hash) to record
+    """
+    ledgers = ledgers or {}
+    ledger_fields = list(LEDGER_FIELDS.values()) + ["file_hash"]
+    for pks_chunk in chunked(sorted(drive_ids), QUERY_CHUNK_SIZE):
+        mappings = {
+            mapping.image_id: mapping
+            for mapping in DriveIDMapping.objects.filter(image_id__in=pks_chunk)
+        }
+        for mapping in mappings.values():
+            mapping.drive_id = drive_ids[mapping.image_id]
+            # a ledger left from an earlier import no longer describes the image
+            ledger = ledgers.get(mapping.image_id, {})
+            for field in ledger_fields:
+                setattr(mapping, field, ledger.get(field) or "")
+        DriveIDMapping.objects.bulk_update(
+            mappings.values(), ["drive_id"] + ledger_fields
+        )
+        DriveIDMapping.objects.bulk_create(
+            [
+                DriveIDMapping(
+                    image_id=pk, drive_id=drive_ids[pk], **ledgers.get(pk, {})
+                )
+                for pk in pks_chunk
+                if pk not in mappings
+            ]
+        )
+        # bulk operations don't send signals, so update the cached duplicates and fingerprints directly
+        invalidate_drive_ids({pk: drive_ids[pk] for pk in pks_chunk})
+        set_fingerprint_drive_ids({pk: drive_ids[pk] for pk in pks_chunk})
+        get_duplicate_backend().refresh_images(pks_chunk)
+
+
+def get_existing_renditions(images, filter_spec):
+    """
+    Returns a dict mapping image pks to their existing renditions for filter_spec, fetched in bulk.
+    Images whose rendition has not been generated yet are left out
+    """
+    if not images:
+        return {}
+    rendition_filter = Filter(spec=filter_spec)
+    focal_point_keys = {
+        image.pk: rendition_filter.get_cache_key(image) for image in images
+    }
+    Rendition = get_image_model().get_rendition_model()
+    renditions = {}
+    for pks_chunk in chunked(sorted(focal_point_keys), QUERY_CHUNK_SIZE):
+        for rendition in Rendition.objects.filter(
+            image_id__in=pks_chunk, filter_spec=rendition_filter.spec
+        ):
+            if rendition.focal_point_key == focal_point_keys[rendition.image_id]:
+                renditions[rendition.image_id] = rendition
+    return renditions
+
+
+def get_lookup_value(value, db_field):
+    """
+    Returns a Drive field value as it is stored in db_field, or None if it is empty
+    """
+    if not value:
+        # don't find duplicates for empty data, likely to match too many
+        return None
+    if db_field in FINGERPRINT_FIELDS:
+        return normalize_fingerprint_value(FINGERPRINT_FIELDS[db_field], value) or None
+    return str(value)
 
-def flatten(d, parent_key="", sep="__"):
-    items = []
-    for k, v in d.items():
-        new_key = parent_key + sep + k if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten(v, new_key, sep=sep).items())
-        else:
-            items.append((new_key, v))
-    return dict(items)
@@ -1,29 +1,81 @@
 import json
-import os.path
+import logging
 
 from django import forms
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404, render
+from django.db import transaction
+from django.core.files import File
+from django.http import (
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.http import urlencode
 from django.utils.module_loading import import_string
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
 from wagtail.core.models import Collection
 from wagtail.images import get_image_model
-from wagtail.images.forms import get_image_form, get_image_multi_form
+from wagtail.images.forms import get_image_multi_form
 from wagtail.images.models import UploadedImage
 from wagtail.images.permissions import permission_policy
-from wagtail.search.backends import get_search_backends
 
-from .models import DriveIDMapping
+from .chunked_uploads import (
+    ChunkError,
+    delete_expired_uploads,
+    delete_upload,
+    get_chunk_size,
+    get_chunked_upload_threshold,
+    get_upload_path,
+    parse_content_range,
+    validate_upload_size,
+    write_chunk,
+)
+from .drive import DriveFetchError, get_fetch_progress
+from .importing import (
+    fetch_drive_file_for_user,
+    get_failure_result,
+    get_image_result,
+    get_import_form,
+    get_ledger_values,
+    get_uploaded_image_result,
+    import_image_file,
+    promote_uploaded_image,
+    save_imported_image,
+    store_uploaded_image,
+)
+from .duplicate_cache import MISSING, DuplicatePayloadCache, get_cache_backend
+from .fuzzy_titles import get_fuzzy_title_threshold
+from .indexing import (
+    deferred_search_indexing,
+    flush_search_index_updates,
+    is_search_indexing_deferred,
+    update_search_index,
+)
+from .instrumentation import instrumented, stage
+from .jobs import enqueue_import_job
+from .models import LEDGER_FIELDS, ChunkedUpload, DriveIDMapping, ImportJob
+from .near_duplicates import get_near_duplicates, has_perceptual_hashes
 from .templatetags.wagtail_image_import_tags import can_import
-from .utils import get_most_likely_duplicate
+from .utils import (
+    get_duplicate_scoring_plan,
+    get_existing_renditions,
+    set_drive_id_mappings,
+)
 
 
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FILTER_SPEC = "max-165x165"
+
+
+@instrumented("import_from_drive")
 def import_from_drive(request):
     if not can_import(request.user):
         raise PermissionDenied
@@ -37,125 +89,49 @@ def import_from_drive(request):
             for collection in collections
         ]
     )
-    Image = get_image_model()
-    ImageForm = get_image_form(Image)
 
     if request.method == "POST":
-        # Build a form for validation
-        wagtail_id = request.POST.get("wagtail_id")
-        if request.POST["action"] == "replace" and wagtail_id:
-            existing_image = get_image_model().objects.get(pk=wagtail_id)
-            form = ImageForm(
-                {
-                    "title": existing_image.title,
-                    "collection": existing_image.collection.id,
-                },
-                {"file": request.FILES["image_file"],},
-                user=request.user,
-                instance=existing_image,
-            )
-        else:
-
-            form = ImageForm(
-                {
-                    "title": request.POST.get("name", ""),
-                    "collection": request.POST.get("collection"),
-                },
-                {"file": request.FILES["image_file"],},
-                user=request.user,
+        if "image_file" not in request.FILES:
+            error = get_drive_fetch_error(
+                request.POST.get("oauth_token"), [request.POST.get("drive_id")]
             )
-
-        if form.is_valid():
-            # Save it
-            image = form.save(commit=False)
-            image.uploaded_by_user = request.user
-            image.file_size = image.file.size
-            image.file.seek(0)
-            image._set_file_hash(image.file.read())
-            image.file.seek(0)
-            image.save()
-            drive_id = request.POST.get("drive_id")
-            if drive_id:
-                DriveIDMapping.objects.update_or_create(
-                    image=image, defaults={"drive_id": drive_id}
-                )
-
-            # Success! Send back an edit form for this image to the user
-            return JsonResponse(
-                {
-                    "success": True,
-                    "image_id": int(image.id),
-                    "edit_action": reverse(
-                        "wagtail_image_import:edit", args=(image.id,)
-                    ),
-                    "delete_action": reverse(
-                        "wagtailimages:delete_multiple", args=(image.id,)
-                    ),
-                    "form": render_to_string(
-                        "wagtail_image_import/edit_form.html",
-                        {
-                            "image": image,
-                            "form": get_image_multi_form(Image)(
-                                instance=image,
-                                prefix="image-%d" % image.id,
-                                user=request.user,
-                            ),
-                        },
-                        request=request,
-                    ),
-                }
+            if error:
+                return JsonResponse({"success": False, "error": error}, status=400)
+
+        if getattr(settings, "WAGTAILIMAGEIMPORT_BACKGROUND_IMPORTS", False):
+            # leave the import to the run_import_worker command, and let the browser poll for the result
+            job = enqueue_import_job(
+                request.user,
+                request.POST,
+                image_file=request.FILES.get("image_file"),
+                oauth_token=request.POST.get("oauth_token", ""),
             )
-        elif "file" in form.errors:
-            # The uploaded file is invalid; reject it now
             return JsonResponse(
-                {"success": False, "error": "\n".join(form.errors["file"]),}
-            )
-        else:
-            # Some other field of the image form has failed validation, e.g. a required metadata field
-            # on a custom image model. Store the image as an UploadedImage instead and present the
-            # edit form so that it will become a proper Image when successfully filled in
-            uploaded_image = UploadedImage.objects.create(
-                file=request.FILES["image_file"], uploaded_by_user=request.user
-            )
-            image = Image(
-                title=request.POST.get("name", ""),
-                collection_id=request.POST.get("collection"),
+                {"drive_id": job.drive_id, "success": True, "job_id": job.pk}
             )
 
+        if "image_file" in request.FILES:
+            return get_import_response(request, request.FILES["image_file"])
+
+        # the file is fetched from Drive by the server, rather than downloaded and uploaded again by the browser
+        try:
+            with stage("drive_fetch") as fetch:
+                image_file = fetch_drive_file_for_user(
+                    request.user,
+                    request.POST["drive_id"],
+                    request.POST["oauth_token"],
+                    request.POST.get("name", ""),
+                )
+                fetch.bytes = image_file.size
+        except DriveFetchError:
             return JsonResponse(
-                {
-                    "error": "The image was uploaded, but needs additional input to be saved. Errors: "
-                    + "\n".join(
-                        [
-                            field + ": " + error
-                            for field, error_list in form.errors.items()
-                            for error in error_list
-                        ]
-                    ),
-                    "success": True,
-                    "uploaded_image_id": uploaded_image.id,
-                    "edit_action": reverse(
-                        "wagtail_image_import:create_from_uploaded_image",
-                        args=(uploaded_image.id,),
-                    ),
-                    "delete_action": reverse(
-                        "wagtailimages:delete_upload_multiple",
-                        args=(uploaded_image.id,),
-                    ),
-                    "form": render_to_string(
-                        "wagtail_image_import/edit_form.html",
-                        {
-                            "uploaded_image": uploaded_image,
-                            "form": get_image_multi_form(Image)(
-                                instance=image,
-                                prefix="uploaded-image-%d" % uploaded_image.id,
-                                user=request.user,
-                            ),
-                        },
-                        request=request,
-                    ),
-                }
+                {"success": False, "error": "Failed to import from Google"}
             )
+        try:
+            return get_import_response(request, image_file)
+        finally:
+            image_file.close()
+
     # manually set the Google picker parent folder if a function is provided
     drive_parent_finder = getattr(
         settings, "WAGTAILIMAGEIMPORT_SET_DRIVE_PARENT_FUNCTION", ""
@@ -171,11 +147,450 @@ def import_from_drive(request):
         "picker_api_key": settings.WAGTAILIMAGEIMPORT_GOOGLE_PICKER_API_KEY,
         "collections": collections_to_choose,
         "drive_parent": drive_parent,
+        "server_side_drive_fetch": is_server_side_drive_fetch_enabled(),
+        "max_concurrent_imports": getattr(
+            settings, "WAGTAILIMAGEIMPORT_MAX_CONCURRENT_IMPORTS", 3
+        ),
+        "max_buffered_bytes": getattr(
+            settings, "WAGTAILIMAGEIMPORT_MAX_BUFFERED_BYTES", 200 * 1024 * 1024
+        ),
+        "defer_search_indexing": is_search_indexing_deferred(),
+        "import_job_poll_interval": getattr(
+            settings, "WAGTAILIMAGEIMPORT_IMPORT_JOB_POLL_INTERVAL", 2000
+        ),
+        "chunked_upload_threshold": get_chunked_upload_threshold(),
+        "import_batch_size": get_import_batch_size(),
     }
     return render(request, "wagtail_image_import/import.html", context=context)
 
 
+def is_server_side_drive_fetch_enabled():
+    return getattr(settings, "WAGTAILIMAGEIMPORT_SERVER_SIDE_DRIVE_FETCH", False)
+
+
+def get_drive_fetch_error(oauth_token, drive_ids):
+    """
+    Returns the error to respond with if the server can't fetch the files of imports posted without one from
+    Drive, given their Drive IDs and the OAuth token posted, or None if it can
+    """
+    if not is_server_side_drive_fetch_enabled():
+        return "image_file is needed, as fetching files from Drive on the server is disabled"
+    if not all(drive_ids):
+        return "drive_id is needed to fetch a file from Drive"
+    if not oauth_token:
+        return "oauth_token is needed to fetch a file from Drive"
+    return None
+
+
+def get_import_batch_size():
+    """
+    Returns the number of images the browser sends to import_bulk at once, or 1 if it should import them one at
+    a time: as it does when imports run in the background, which import_bulk doesn't support
+    """
+    if getattr(settings, "WAGTAILIMAGEIMPORT_BACKGROUND_IMPORTS", False):
+        return 1
+    return getattr(settings, "WAGTAILIMAGEIMPORT_IMPORT_BATCH_SIZE", 10)
+
+
+def get_import_response(request, image_file):
+    result = import_image_file(request.user, request.POST, image_file)
+    add_import_form(request, result, request.POST)
+    return JsonResponse(result)
+
+
+@require_POST
+def start_chunked_upload(request):
+    """
+    Starts an upload of a large file in chunks, storing the import data sent with it, and returns the id of the
+    upload and the size of chunk to send
+    """
+    if not can_import(request.user):
+        raise PermissionDenied
+    try:
+        size = int(request.POST["size"])
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest()
+    try:
+        validate_upload_size(size)
+    except ChunkError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+
+    delete_expired_uploads()
+    action = request.POST.get("action", "keep")
+    wagtail_id = request.POST.get("wagtail_id")
+    upload = ChunkedUpload.objects.create(
+        user=request.user,
+        drive_id=request.POST.get("drive_id") or "",
+        name=request.POST.get("name", ""),
+        action=action,
+        wagtail_id=int(wagtail_id) if action == "replace" and wagtail_id else None,
+        collection_id=request.POST.get("collection") or None,
+        size=size,
+        **get_ledger_values(request.POST),
+    )
+    return JsonResponse(
+        {
+            "upload_id": str(upload.upload_id),
+            "chunk_size": get_chunk_size(),
+            "received": 0,
+        }
+    )
+
+
+def chunked_upload(request, upload_id):
+    """
+    PUT: appends a chunk, given by its Content-Range, to an upload. GET: returns the number of bytes received,
+    so that an interrupted upload can be resumed from the last acknowledged chunk
+    """
+    if not can_import(request.user):
+        raise PermissionDenied
+    if request.method == "PUT":
+        with transaction.atomic():
+            # lock the upload while the chunk is written, so that a chunk retried while the first attempt is still
+            # being written waits for it, and is then rejected as already received
+            upload = get_object_or_404(
+                ChunkedUpload.objects.select_for_update(),
+                upload_id=upload_id,
+                user=request.user,
+            )
+            try:
+                start, end, total = parse_content_range(
+                    request.META.get("HTTP_CONTENT_RANGE")
+                )
+                if total != upload.size:
+                    raise ChunkError("The upload is {} bytes".format(upload.size))
+                write_chunk(upload, start, end, request)
+            except ChunkError as e:
+                return JsonResponse(
+                    {"error": str(e), "received": upload.received}, status=409
+                )
+    elif request.method == "GET":
+        upload = get_object_or_404(
+            ChunkedUpload, upload_id=upload_id, user=request.user
+        )
+    else:
+        return HttpResponseNotAllowed(["GET", "PUT"])
+    return JsonResponse({"received": upload.received, "size": upload.size})
+
+
+@require_POST
+@instrumented("finish_chunked_upload")
+def finish_chunked_upload(request, upload_id):
+    """
+    Imports the file assembled from an upload's chunks as import_from_drive imports an uploaded file
+    """
+    if not can_import(request.user):
+        raise PermissionDenied
+    upload = get_object_or_404(ChunkedUpload, upload_id=upload_id, user=request.user)
+    try:
+        validate_upload_size(upload.size)
+    except ChunkError as e:
+        delete_upload(upload)
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+    if upload.received != upload.size:
+        return JsonResponse(
+            {"success": False, "error": "The upload is incomplete"}, status=409
+        )
+
+    import_data = upload.get_import_data()
+    with open(get_upload_path(upload), "rb") as f:
+        image_file = File(f, name=upload.name or "upload")
+        if getattr(settings, "WAGTAILIMAGEIMPORT_BACKGROUND_IMPORTS", False):
+            job = enqueue_import_job(request.user, import_data, image_file=image_file)
+            result = {"drive_id": job.drive_id, "success": True, "job_id": job.pk}
+        else:
+            result = import_image_file(request.user, import_data, image_file)
+            add_import_form(request, result, import_data)
+    delete_upload(upload)
+    return JsonResponse(result)
+
+
+def add_import_form(request, result, import_data):
+    """
+    Adds the rendered edit form for a finished import to its result or, if edit forms are fetched lazily, the
+    URL to fetch it from when the user opens it
+    """
+    if getattr(settings, "WAGTAILIMAGEIMPORT_LAZY_EDIT_FORMS", False):
+        add_import_form_url(result, import_data)
+        return
+    with stage("render_form"):
+        render_import_form(request, result, import_data)
+
+
+def add_import_form_url(result, import_data):
+    if "image_id" in result:
+        result["form_url"] = reverse(
+            "wagtail_image_import:edit_form", args=(result["image_id"],)
+        )
+    elif "uploaded_image_id" in result:
+        result["form_url"] = (
+            reverse(
+                "wagtail_image_import:uploaded_image_form",
+                args=(result["uploaded_image_id"],),
+            )
+            + "?"
+            + urlencode(
+                {
+                    "name": import_data.get("name", ""),
+                    "collection": import_data.get("collection") or "",
+                }
+            )
+        )
+
+
+def render_import_form(request, result, import_data):
+    Image = get_image_model()
+    if "image_id" in result:
+        # Success! Send back an edit form for this image to the user
+        image = Image.objects.get(id=result["image_id"])
+        result["form"] = render_image_edit_form(request, image)
+    elif "uploaded_image_id" in result:
+        # present the edit form so that the UploadedImage will become a proper Image when
+        # successfully filled in
+        uploaded_image = UploadedImage.objects.get(id=result["uploaded_image_id"])
+        result["form"] = render_uploaded_image_form(
+            request,
+            uploaded_image,
+            import_data.get("name", ""),
+            import_data.get("collection"),
+        )
+
+
+def render_image_edit_form(request, image):
+    return render_to_string(
+        "wagtail_image_import/edit_form.html",
+        {
+            "image": image,
+            "form": get_image_multi_form(type(image))(
+                instance=image, prefix="image-%d" % image.id, user=request.user,
+            ),
+        },
+        request=request,
+    )
+
+
+def render_uploaded_image_form(request, uploaded_image, title, collection_id):
+    Image = get_image_model()
+    image = Image(title=title, collection_id=collection_id)
+    return render_to_string(
+        "wagtail_image_import/edit_form.html",
+        {
+            "uploaded_image": uploaded_image,
+            "form": get_image_multi_form(Image)(
+                instance=image,
+                prefix="uploaded-image-%d" % uploaded_image.id,
+                user=request.user,
+            ),
+        },
+        request=request,
+    )
+
+
+@instrumented("edit_form")
+def edit_form(request, image_id):
+    """
+    Returns the edit form for an imported image, fetched when the user opens it if edit forms are fetched lazily
+    """
+    image = get_object_or_404(get_image_model(), id=image_id)
+    if not permission_policy.user_has_permission_for_instance(
+        request.user, "change", image
+    ):
+        raise PermissionDenied
+    with stage("render_form"):
+        form = render_image_edit_form(request, image)
+    return JsonResponse({"form": form})
+
+
+@instrumented("uploaded_image_form")
+def uploaded_image_form(request, uploaded_image_id):
+    """
+    Returns the form to create an image from an uploaded image which needs additional input, with the title and
+    collection given by the "name" and "collection" parameters
+    """
+    uploaded_image = get_object_or_404(UploadedImage, id=uploaded_image_id)
+    if uploaded_image.uploaded_by_user != request.user:
+        raise PermissionDenied
+    with stage("render_form"):
+        form = render_uploaded_image_form(
+            request,
+            uploaded_image,
+            request.GET.get("name", ""),
+            request.GET.get("collection") or None,
+        )
+    return JsonResponse({"form": form})
+
+
+def import_jobs(request):
+    """
+    Returns the status of several background import jobs at once, given as a comma separated list of "ids", so
+    that the browser can poll for all of its pending imports in one request. Finished jobs include their result
+    and edit form, as for an import run within the request
+    """
+    if not can_import(request.user):
+        raise PermissionDenied
+
+    try:
+        job_ids = [
+            int(job_id) for job_id in request.GET.get("ids", "").split(",") if job_id
+        ]
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    statuses = {}
+    for job in ImportJob.objects.filter(user=request.user, pk__in=job_ids):
+        status = {"status": job.status}
+        if job.is_finished:
+            status.update(job.get_result())
+            add_import_form(
+                request, status, {"name": job.name, "collection": job.collection_id}
+            )
+        statuses[job.pk] = status
+    return JsonResponse({"jobs": statuses})
+
+
+@require_POST
+def import_bulk(request):
+    """
+    Imports many images in a single request. The "items" parameter is a JSON list of imports, each with the
+    same fields as a single import, plus the name of the uploaded file holding its contents as "file" - or, if
+    this is left out, the file is fetched from Drive using the "oauth_token" parameter. All valid images and
+    their Drive ID mappings are saved in one transaction, with a savepoint for each image so that one failing
+    to save doesn't fail the rest, and a compact list of results is returned in the same order as the items
+    """
+    if not can_import(request.user):
+        raise PermissionDenied
+
+    error = None
+    try:
+        items = json.loads(request.POST["items"])
+    except (KeyError, ValueError):
+        items = None
+    if not isinstance(items, list) or not all(
+        isinstance(item, dict) and isinstance(item.get("file") or "", str)
+        for item in items
+    ):
+        error = "items must be a JSON list of imports"
+    elif any(item.get("file") and item["file"] not in request.FILES for item in items):
+        error = "An uploaded file named by the items is missing"
+    elif not all(item.get("file") for item in items):
+        error = get_drive_fetch_error(
+            request.POST.get("oauth_token"),
+            [item.get("drive_id") for item in items if not item.get("file")],
+        )
+    if error:
+        return JsonResponse({"success": False, "error": error}, status=400)
+
+    results = [None] * len(items)
+    valid_imports = []
+    fetched_files = []
+    try:
+        for index, item in enumerate(items):
+            import_data = {
+                "action": "keep",
+                "collection": request.POST.get("collection"),
+                **item,
+            }
+            drive_id = import_data.get("drive_id")
+            if import_data.get("file"):
+                image_file = request.FILES[import_data["file"]]
+            else:
+                try:
+                    image_file = fetch_drive_file_for_user(
+                        request.user,
+                        drive_id,
+                        request.POST["oauth_token"],
+                        import_data.get("name", ""),
+                    )
+                except DriveFetchError:
+                    results[index] = get_failure_result(
+                        drive_id, "Failed to import from Google"
+                    )
+                    continue
+                fetched_files.append(image_file)
+
+            form = get_import_form(request.user, import_data, image_file)
+            if form.is_valid():
+                valid_imports.append((index, import_data, form))
+            elif "file" in form.errors:
+                results[index] = get_failure_result(
+                    drive_id, "\n".join(form.errors["file"])
+                )
+            else:
+                uploaded_image = store_uploaded_image(request.user, image_file)
+                results[index] = get_uploaded_image_result(
+                    drive_id, uploaded_image, form
+                )
+
+        imported_images = []
+        try:
+            with transaction.atomic():
+                for index, import_data, form in valid_imports:
+                    drive_id = import_data.get("drive_id")
+                    try:
+                        with transaction.atomic():
+                            image = save_imported_image(request.user, form)
+                    except Exception:
+                        logger.exception(
+                            "Importing %s failed", drive_id or import_data.get("name")
+                        )
+                        results[index] = get_failure_result(drive_id, "Failed to import")
+                        continue
+                    imported_images.append((index, import_data, image))
+                set_drive_id_mappings(
+                    {
+                        image.pk: import_data["drive_id"]
+                        for index, import_data, image in imported_images
+                        if import_data.get("drive_id")
+                    },
+                    ledgers={
+                        image.pk: {
+                            "file_hash": image.file_hash,
+                            **get_ledger_values(import_data),
+                        }
+                        for index, import_data, image in imported_images
+                    },
+                )
+        except Exception:
+            # the files of the saved images were written to storage, so delete them along with the rolled
+            # back images
+            for index, import_data, image in imported_images:
+                image.file.storage.delete(image.file.name)
+            raise
+    finally:
+        for image_file in fetched_files:
+            image_file.close()
+
+    for index, import_data, image in imported_images:
+        results[index] = get_image_result(import_data.get("drive_id"), image)
+    for result, item in zip(results, items):
+        # the edit forms are fetched only when opened, to keep the results compact
+        add_import_form_url(
+            result, {"collection": request.POST.get("collection"), **item}
+        )
+    return JsonResponse({"results": results})
+
+
+def drive_fetch_progress(request):
+    if not can_import(request.user):
+        raise PermissionDenied
+    progress = get_fetch_progress(request.user, request.GET.get("drive_id", ""))
+    return JsonResponse(progress or {"loaded": 0, "total": None})
+
+
+@require_POST
+def flush_search_index(request):
+    """
+    Indexes the images changed during the user's import session in bulk, called by the browser when the
+    session ends
+    """
+    if not can_import(request.user):
+        raise PermissionDenied
+    indexed = flush_search_index_updates(user=request.user)
+    return JsonResponse({"success": True, "indexed": indexed})
+
+
 @require_POST
+@instrumented("create_from_uploaded_image")
 def create_from_uploaded_image(request, uploaded_image_id):
     Image = get_image_model()
     ImageForm = get_image_multi_form(Image)
@@ -194,38 +609,44 @@ def create_from_uploaded_image(request, uploaded_image_id):
         user=request.user,
     )
 
-    if form.is_valid():
-        # assign the file content from uploaded_image to the image object, to ensure it gets saved to
+    with stage("form_validation"):
+        is_valid = form.is_valid()
+    if is_valid:
+        # move the file from uploaded_image to the image object, to ensure it gets saved to
         # Image's storage
-
-        image.file.save(
-            os.path.basename(uploaded_image.file.name),
-            uploaded_image.file.file,
-            save=False,
-        )
+        moved = promote_uploaded_image(uploaded_image, image)
         image.uploaded_by_user = request.user
-        image.file_size = image.file.size
-        image.file.open()
-        image.file.seek(0)
-        image._set_file_hash(image.file.read())
-        image.file.seek(0)
-        form.save()
-
-        uploaded_image.file.delete()
+        with stage("image_save"), deferred_search_indexing(request.user):
+            form.save()
+
+        if not moved:
+            uploaded_image.file.delete()
         uploaded_image.delete()
 
         drive_id = request.POST.get("drive_id")
         if drive_id:
-            DriveIDMapping.objects.update_or_create(
-                image=image, defaults={"drive_id": drive_id}
-            )
+            with stage("mapping_upsert"):
+                DriveIDMapping.objects.update_or_create(
+                    image=image,
+                    defaults={
+                        "drive_id": drive_id,
+                        "file_hash": image.file_hash,
+                        **get_ledger_values(request.POST),
+                    },
+                )
 
         # Reindex the image to make sure all tags are indexed
-        for backend in get_search_backends():
-            backend.add(image)
+        with stage("search_index"):
+            update_search_index(image, request.user)
 
         return JsonResponse({"success": True, "image_id": image.id,})
     else:
+        with stage("render_form"):
+            rendered_form = render_to_string(
+                "wagtail_image_import/edit_form.html",
+                {"uploaded_image": uploaded_image, "form": form,},
+                request=request,
+            )
         return JsonResponse(
             {
                 "success": False,
@@ -236,16 +657,13 @@ def create_from_uploaded_image(request, uploaded_image_id):
                 "delete_action": reverse(
                     "wagtailimages:delete_upload_multiple", args=(uploaded_image.id,)
                 ),
-                "form": render_to_string(
-                    "wagtail_image_import/edit_form.html",
-                    {"uploaded_image": uploaded_image, "form": form,},
-                    request=request,
-                ),
+                "form": rendered_form,
             }
         )
 
 
 @require_POST
+@instrumented("edit")
 def edit(request, image_id, callback=None):
     Image = get_image_model()
     ImageForm = get_image_multi_form(Image)
@@ -265,73 +683,222 @@ def edit(request, image_id, callback=None):
         user=request.user,
     )
 
-    if form.is_valid():
-        form.save()
+    with stage("form_validation"):
+        is_valid = form.is_valid()
+    if is_valid:
+        with stage("image_save"), deferred_search_indexing(request.user):
+            form.save()
 
         # Reindex the image to make sure all tags are indexed
-        for backend in get_search_backends():
-            backend.add(image)
+        with stage("search_index"):
+            update_search_index(image, request.user)
 
         return JsonResponse({"success": True, "image_id": int(image_id),})
     else:
+        with stage("render_form"):
+            rendered_form = render_to_string(
+                "wagtail_image_import/edit_form.html",
+                {
+                    "image": image,
+                    "edit_action": reverse(
+                        "wagtail_image_import:edit", args=(image_id,)
+                    ),
+                    "delete_action": reverse(
+                        "wagtailimages:delete_multiple", args=(image_id,)
+                    ),
+                    "form": form,
+                },
+                request=request,
+            )
         return JsonResponse(
-            {
-                "success": False,
-                "image_id": int(image_id),
-                "form": render_to_string(
-                    "wagtail_image_import/edit_form.html",
-                    {
-                        "image": image,
-                        "edit_action": reverse(
-                            "wagtail_image_import:edit", args=(image_id,)
-                        ),
-                        "delete_action": reverse(
-                            "wagtailimages:delete_multiple", args=(image_id,)
-                        ),
-                        "form": form,
-                    },
-                    request=request,
-                ),
-            }
+            {"success": False, "image_id": int(image_id), "form": rendered_form}
         )
 
 
 @csrf_exempt
+@instrumented("find_duplicates")
 def find_duplicates(request):
+    """
+    Returns the most likely duplicate of each Drive file in the JSON list posted, by Drive ID. If the request
+    accepts application/x-ndjson, the duplicates are instead streamed as newline delimited JSON as they are
+    found, one {"id", "duplicate"} object per line, followed by a final {"done": true} line
+    """
     if (not can_import(request.user)) or (not request.method == "POST"):
         raise PermissionDenied
     image_data_list = json.loads(request.body)
+    oauth_token = request.META.get("HTTP_X_DRIVE_OAUTH_TOKEN", "")
 
-    field_mapping = getattr(
-        settings,
-        "WAGTAILIMAGEIMPORT_FIELD_MAPPING",
-        {"id": "driveidmapping__drive_id", "name": "title",},
+    if "application/x-ndjson" in request.META.get("HTTP_ACCEPT", ""):
+        response = StreamingHttpResponse(
+            stream_duplicates(image_data_list, oauth_token),
+            content_type="application/x-ndjson",
+        )
+        # stop proxies such as nginx from holding back the results until the end
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    payloads = {
+        image_data["id"]: payload
+        for image_data, payload in iter_duplicate_payloads(
+            image_data_list, oauth_token
+        )
+    }
+    return JsonResponse(
+        {
+            image_data["id"]: payloads[image_data["id"]]
+            for image_data in image_data_list
+            if payloads[image_data["id"]]
+        }
     )
-    # maps drive fields to db fields
-    # if using DuplicateFindingMixin, you can also add imageMediaMetadata__time: exif_datetime, and md5Checksum: md5_hash
 
-    field_weighting = getattr(
-        settings,
-        "WAGTAILIMAGEIMPORT_FIELD_WEIGHTING",
-        {"driveidmapping__drive_id": 10, "md5Checksum": 5, "title": 2},
+
+def stream_duplicates(image_data_list, oauth_token):
+    batch_size = getattr(settings, "WAGTAILIMAGEIMPORT_DUPLICATE_STREAM_BATCH_SIZE", 50)
+    for image_data, payload in iter_duplicate_payloads(
+        image_data_list, oauth_token, batch_size=batch_size
+    ):
+        if payload:
+            yield json.dumps({"id": image_data["id"], "duplicate": payload}) + "\n"
+    yield json.dumps({"done": True}) + "\n"
+
+
+def iter_duplicate_payloads(image_data_list, oauth_token, batch_size=None):
+    """
+    Yields (image_data, payload) for each item in image_data_list, where payload is the duplicate review payload
+    of its most likely duplicate, or None if it has none: first the items found in the duplicate cache, then the
+    rest in batches of batch_size (or all at once), so that results can be sent as soon as they are found
+    """
+    plan = get_duplicate_scoring_plan()
+
+    near_duplicate_distance = getattr(
+        settings, "WAGTAILIMAGEIMPORT_NEAR_DUPLICATE_DISTANCE", None
     )
-    # maps db fields to their weighting when finding most likely duplicate - default weighting is 1
+    if not has_perceptual_hashes():
+        near_duplicate_distance = None
+
+    payloads = [MISSING] * len(image_data_list)
+    cache_backend = get_cache_backend()
+    if cache_backend is not None:
+        payload_cache = DuplicatePayloadCache(
+            cache_backend,
+            plan.field_mapping,
+            plan.field_weighting,
+            plan.get_lookup_values,
+            {
+                "near_duplicates": near_duplicate_distance is not None,
+                "near_duplicate_distance": near_duplicate_distance,
+                "fuzzy_title_threshold": get_fuzzy_title_threshold(),
+                "datetime_format": getattr(settings, "WAGTAIL_DATETIME_FORMAT", None),
+            },
+            revision_values=get_drive_revision,
+        )
+        with stage("cache_lookup"):
+            payloads, versions = payload_cache.get_many(image_data_list)
+
+    missing_image_data_list = []
+    for image_data, payload in zip(image_data_list, payloads):
+        if payload is MISSING:
+            missing_image_data_list.append(image_data)
+        else:
+            yield image_data, payload
 
-    duplicates = {}
-    for image_data in image_data_list:
-        duplicate = get_most_likely_duplicate(
-            image_data, field_mapping, field_weighting
+    batch_size = batch_size or len(missing_image_data_list) or 1
+    for start in range(0, len(missing_image_data_list), batch_size):
+        batch = missing_image_data_list[start : start + batch_size]
+        batch_payloads = get_duplicate_payloads(
+            batch, plan, near_duplicate_distance, oauth_token
+        )
+        if cache_backend is not None:
+            with stage("cache_store"):
+                payload_cache.set_many(batch, batch_payloads, versions)
+        yield from zip(batch, batch_payloads)
+
+
+def get_drive_revision(image_data):
+    """
+    Returns the values of a Drive item which tell whether it has changed since it was last imported
+    """
+    return {
+        drive_field: image_data.get(drive_field)
+        for drive_field in ["id", *LEDGER_FIELDS]
+    }
+
+
+def is_unchanged_since_import(image_data, image):
+    """
+    Returns whether image was imported from the Drive item given by image_data, which hasn't changed since
+    """
+    try:
+        mapping = image.driveidmapping
+    except DriveIDMapping.DoesNotExist:
+        return False
+    return mapping.is_unchanged(image_data, image.file_hash)
+
+
+def get_duplicate_payloads(image_data_list, plan, near_duplicate_distance, oauth_token):
+    """
+    Returns the duplicate review payload of the most likely duplicate of each item in image_data_list, or None
+    for items without a duplicate
+    """
+    with stage("duplicate_scoring"):
+        most_likely_duplicates = plan.get_most_likely_duplicates(image_data_list)
+
+    near_duplicate_indexes = set()
+    if near_duplicate_distance is not None:
+        # look for resized, recompressed or edited copies of the images without an exact duplicate, by comparing
+        # perceptual hashes of their Drive thumbnails
+        unmatched_indexes = [
+            index
+            for index, duplicate in enumerate(most_likely_duplicates)
+            if duplicate is None
+        ]
+        with stage("near_duplicates"):
+            near_duplicates = get_near_duplicates(
+                [image_data_list[index] for index in unmatched_indexes],
+                oauth_token,
+                near_duplicate_distance,
+            )
+        for index, near_duplicate in zip(unmatched_indexes, near_duplicates):
+            if near_duplicate is not None:
+                most_likely_duplicates[index] = near_duplicate
+                near_duplicate_indexes.add(index)
+
+    with stage("renditions"):
+        thumbnails = get_existing_renditions(
+            [duplicate for duplicate in most_likely_duplicates if duplicate],
+            THUMBNAIL_FILTER_SPEC,
         )
+    payloads = []
+    for index, duplicate in enumerate(most_likely_duplicates):
         if not duplicate:
+            payloads.append(None)
             continue
-        duplicate_data = {
-            "wagtail_id": duplicate.pk,
-            "title": duplicate.title,
-            "created_at": duplicate.created_at.strftime(
-                getattr(settings, "WAGTAIL_DATETIME_FORMAT", "%d.%m.%Y. %H:%M")
-            ),
-            "thumbnail": duplicate.get_rendition("max-165x165").url,
-        }
-        duplicates[image_data["id"]] = duplicate_data
+        if duplicate.pk in thumbnails:
+            thumbnail_url = thumbnails[duplicate.pk].url
+        else:
+            # don't hold up the response generating missing thumbnails: the browser will request them separately
+            thumbnail_url = reverse(
+                "wagtail_image_import:thumbnail", args=(duplicate.pk,)
+            )
+        payloads.append(
+            {
+                "wagtail_id": duplicate.pk,
+                "title": duplicate.title,
+                "created_at": duplicate.created_at.strftime(
+                    getattr(settings, "WAGTAIL_DATETIME_FORMAT", "%d.%m.%Y. %H:%M")
+                ),
+                "thumbnail": thumbnail_url,
+                "near_duplicate": index in near_duplicate_indexes,
+                "unchanged": is_unchanged_since_import(
+                    image_data_list[index], duplicate
+                ),
+            }
+        )
+    return payloads
 
-    return JsonResponse(duplicates)
+
+def thumbnail(request, image_id):
+    if not can_import(request.user):
+        raise PermissionDenied
+    image = get_object_or_404(get_image_model(), id=image_id)
+    return redirect(image.get_rendition(THUMBNAIL_FILTER_SPEC).url)